@@ -7,6 +7,15 @@ import os
 import argparse
 from glob import glob
 import csv  # Importar el módulo csv
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar utilidades
+from utilidades.deteccion import detectar_csv
+from utilidades.escritura import MOTORES_EXCEL, EscritoresPorArchivo, guardar_excel
+from utilidades.etiquetas import VocabularioEtiquetas, ruta_vocabulario
+from utilidades.columnas import hojas_a_procesar, proyectar
+from utilidades.lectura import LECTORES_CSV, columnas_tabla, detectar_formato, leer_tabla, leer_texto_por_lotes
+from utilidades.nombres import NOMBRES_COMPUESTOS_AMPLIADOS, split_name
+from utilidades.telefonos import FORMATOS_TELEFONO, ReporteTelefonos, formato_telefono, limpiar_columna, ruta_reporte
 
 # --- Constantes ---
 DEFAULT_GROUP_BY = 'GRUPO / TALLER'
@@ -20,186 +29,233 @@ DEFAULT_ROLES_MAPPING = {
     'Ventas': ['Ventas', 'Email.6'],
 }
 
-def split_name(full_name):
-    """Divide un nombre completo en nombre y apellido."""
-    if not isinstance(full_name, str):
-        return "", ""
-    parts = full_name.split()
-    if len(parts) == 0:
-        return "", ""
-    elif len(parts) == 1:
-        return parts[0], ""
-    elif len(parts) == 2:
-        return parts[0], parts[1]
-    else:
-        firstname = []
-        lastname = []
-        compound_names = ["María", "Ana", "Juan", "Luis", "José", "Carlos",
-                          "San", "Santa", "De", "Del", "La", "El", "Los",
-                          "Da", "Do", "Das", "Dos", "D'", "L'", "O'"]  # Añadidos más nombres compuestos
-
-        i = 0
-        while i < len(parts):
-            if i < len(parts) - 1 and parts[i] in compound_names:
-                firstname.append(parts[i] + " " + parts[i + 1])
-                i += 2
-            else:
-                firstname.append(parts[i])
-                i += 1
-
-        if len(firstname) >= 3:
-            mid = len(firstname) // 2
-            lastname = firstname[mid:]
-            firstname = firstname[:mid]
-
-        return " ".join(firstname), " ".join(lastname)
-
-
-def detect_delimiter(filepath, num_lines=5):
-    """Detecta el delimitador más probable de un archivo CSV."""
+COLUMN_ORDER = [
+    'Name', 'Position', 'Company', 'Description', 'Country', 'Zip',
+    'City', 'State', 'Address', 'Status', 'Source', 'Email',
+    'Website', 'Phonenumber', 'Lead value', 'Tags'
+]
+
+
+def transformar_grupo(group_df, input_file, group_by_col, roles_mapping, vocabulario=None):
+    """
+    Contactos de un grupo, como DataFrame con las columnas de COLUMN_ORDER (vacío si no hay).
+    Los tags salen de `vocabulario` (VocabularioEtiquetas), que los cuenta.
+    """
+    if vocabulario is None:
+        vocabulario = VocabularioEtiquetas()
+    data = []
+    for index, row in group_df.iterrows():
+        company = row['Nombre_empresa']
+        phone_number = row['Telefonos']  # Ya pasó por la etapa de teléfonos (ver `procesar_hoja`)
+
+        # --- Obtener 'Actividad' y 'GRUPO / TALLER' ---
+        actividad = row.get('Actividad', '')  # Usar .get() por si no existe
+        grupo_taller = row.get(group_by_col, '')  # Usar group_by_col y .get()
+
+        for position, cols in roles_mapping.items():
+            name_col, email_col = cols
+            full_name = str(row[name_col]) if pd.notna(row[name_col]) else ''
+            email = row[email_col] if pd.notna(row[email_col]) else ''
+
+            if email and full_name:
+                firstname, lastname = split_name(full_name, NOMBRES_COMPUESTOS_AMPLIADOS)
+
+                # --- Crear los tags ---
+                # Priorizar 'Actividad Comercial', luego 'Actividad', y finalmente cadena vacía
+                tags_source = row.get('Actividad Comercial', row.get('Actividad', ''))
+                tags = vocabulario.etiquetar(tags_source)  # Cada actividad distinta se divide una sola vez
+
+                person_data = {
+                    'Name': f"{firstname} {lastname}".strip(),  # Combina nombre y apellido
+                    'Position': position,
+                    'Company': company,
+                    'Description': '',  # Valores por defecto para las nuevas columnas
+                    'Country': 'Panama',
+                    'Zip': '',
+                    'City': '',  # Ya no se pone SAN FELIPE por defecto
+                    'State': '',
+                    'Address': '',
+                    'Status': '',
+                    'Source': '',
+                    'Email': email,
+                    'Website': '',
+                    'Phonenumber': phone_number,
+                    'Lead value': '',
+                    'Tags': tags  # Agregar los tags
+                }
+                data.append(person_data)
+
+    output_df = pd.DataFrame(data)
+    if output_df.empty:
+        return output_df
+    return output_df[COLUMN_ORDER]
+
+
+def ruta_grupo(group_name, output_dir, output_format, sufijo=""):
+    """Ruta del archivo de salida de un grupo (nombre del grupo sin caracteres inválidos, más `sufijo`)."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            sample_lines = [file.readline() for _ in range(num_lines)]
-    except UnicodeDecodeError:
+        output_filename = re.sub(r'[\\/*?:"<>|]', "", str(group_name))
+        output_filename = output_filename.strip()
+    except TypeError:
+        output_filename = "grupo_invalido"
+    extension = "csv" if output_format == "csv" else "xlsx"
+    return os.path.join(output_dir, f"{output_filename}{sufijo}.{extension}")
+
+
+def guardar_grupo(output_df, group_name, output_filepath, output_format, excel_writer=None):
+    """Escribe de una vez el archivo de un grupo."""
+    if output_format == "csv":
         try:
-            with open(filepath, 'r', encoding='latin-1') as file:
-                sample_lines = [file.readline() for _ in range(num_lines)]
-        except UnicodeDecodeError:
-            with open(filepath, 'r', encoding='cp1252') as file: #Prueba con encoding cp1252
-               sample_lines = [file.readline() for _ in range(num_lines)]
-
-    sniffer = csv.Sniffer()
-    for line in sample_lines:
+            # --- Usa csv.writer para un CSV bien formado ---
+            with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(output_df.columns)  # Encabezados
+                for row in output_df.values:
+                    writer.writerow(row)
+            # ------------------------------------------------
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+        except Exception as e:
+            print(f"Error al guardar '{output_filepath}': {e}")
+    else:
         try:
-            dialect = sniffer.sniff(line)
-            return dialect.delimiter
-        except csv.Error:
-            continue
-    return '\t'  # Delimitador por defecto
+            guardar_excel(output_df, output_filepath, excel_writer)
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+        except Exception as e:
+            print(f"Error al guardar '{output_filepath}': {e}")
+
+
+def procesar_por_lotes(lotes, input_file, output_dir, output_format, group_by_col, roles_mapping,
+                       excel_writer=None, sufijo="", phone_format=None, hoja=0, tags_vocabulary=False):
+    """
+    Transforma el archivo lote a lote y añade las filas de cada grupo a su
+    archivo, que queda abierto hasta el último lote: nunca hay más de un lote
+    en memoria.
+    """
+    # Sin conversión en CSV: mismo texto que el csv.writer de guardar_grupo
+    escritores = EscritoresPorArchivo(COLUMN_ORDER, formato=output_format,
+                                      convertir_csv=lambda valor: valor, motor=excel_writer)
+    grupos = {}  # Nombre de grupo -> ruta de salida
+    reporte = ReporteTelefonos(ruta_reporte(output_dir, input_file, sufijo), input_file)
+    vocabulario = VocabularioEtiquetas()
+    try:
+        for lote in lotes:
+            lote = limpiar_columna(lote, 'Telefonos', phone_format, reporte, hoja)
+            for group_name, group_df in lote.groupby(group_by_col):
+                output_filepath = grupos.setdefault(group_name,
+                                                    ruta_grupo(group_name, output_dir, output_format, sufijo))
+                output_df = transformar_grupo(group_df, input_file, group_by_col, roles_mapping, vocabulario)
+                if not output_df.empty:
+                    escritores.agregar_df(output_filepath, output_df)
+    except (KeyError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+
+    try:
+        filas_escritas = escritores.cerrar()
+        reporte.cerrar()
+        if tags_vocabulary:
+            vocabulario.guardar(ruta_vocabulario(output_dir, input_file, sufijo), input_file)
+    except Exception as e:
+        print(f"Error al guardar los archivos de '{input_file}': {e}")
+        return
+
+    for group_name, output_filepath in grupos.items():
+        if filas_escritas.get(output_filepath):
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+        else:
+            print(f"No hay datos para el grupo '{group_name}' en '{input_file}', no se genera archivo.")
 
 
-def process_and_split_excel(input_file, output_dir, output_format="excel",
-                            group_by_col=DEFAULT_GROUP_BY, roles_mapping=None):
-    """Procesa archivos, transforma datos y divide en archivos por grupo."""
+def lectura_de(input_file):
+    """Opciones de lectura: los textos con su codificación y delimitador detectados (una sola lectura)."""
+    if detectar_formato(input_file) != 'texto':
+        return {}
+    encoding, delimiter = detectar_csv(input_file)
+    return {'sep': delimiter, 'encoding': encoding}
 
-    try:
-        # Intenta leer como Excel primero
-        df = pd.read_excel(input_file, engine='openpyxl')
-    except (FileNotFoundError, ValueError, KeyError, TypeError, pd.errors.EmptyDataError) as e1:
-        try:
-            # Si falla Excel, intenta leer como CSV
-            delimiter = detect_delimiter(input_file)  # Detecta el delimitador
-            df = pd.read_csv(input_file, sep=delimiter, encoding='utf-8')
-        except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError, pd.errors.EmptyDataError) as e2:
-            try:
-                # Si UTF-8 falla, intenta con latin-1
-                df = pd.read_csv(input_file, sep=delimiter, encoding='latin-1')
-            except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError, pd.errors.EmptyDataError) as e3:
-                try:
-                    # Si latin-1 falla, intenta con cp1252
-                    df = pd.read_csv(input_file, sep=delimiter, encoding='cp1252')
-                except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError, pd.errors.EmptyDataError) as e4:
-                    print(f"Error: No se pudo leer '{input_file}' ni como Excel ni como CSV.")
-                    print(f"Errores:\nExcel: {e1}\nCSV (utf-8): {e2}\nCSV (latin-1): {e3}\nCSV(cp1252): {e4}")
-                    return
+
+def process_and_split_excel(input_file, output_dir, output_format="excel",
+                            group_by_col=DEFAULT_GROUP_BY, roles_mapping=None, max_memory_mb=None,
+                            excel_writer=None, hoja=None, csv_reader=None, phone_format=None,
+                            tags_vocabulary=False):
+    """
+    Procesa archivos, transforma datos y divide en archivos por grupo.
+    Cada hoja del libro cuyo encabezado coincide con el mapeo se procesa por
+    separado (un CSV es una sola hoja); si son varias, los archivos de cada
+    hoja llevan su nombre: 'Grupo (Hoja).xlsx'. Con `hoja`, solo esa.
+    Con `max_memory_mb`, los CSV se leen y transforman por lotes que caben en esa memoria.
+    `phone_format` elige cómo se escriben los teléfonos (ver `utilidades.telefonos`);
+    con `tags_vocabulary`, el vocabulario de tags de cada hoja se guarda junto a la salida.
+    """
 
     if roles_mapping is None:
         roles_mapping = DEFAULT_ROLES_MAPPING
 
+    if hoja is not None:
+        procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb,
+                      excel_writer, hoja, sufijo=f" ({hoja})", csv_reader=csv_reader, phone_format=phone_format,
+                      tags_vocabulary=tags_vocabulary)
+        return
+
+    try:
+        hojas = hojas_a_procesar(input_file, roles_mapping,
+                                 obligatorias=['Nombre_empresa', 'Telefonos', group_by_col], **lectura_de(input_file))
+    except (OSError, ValueError, KeyError, TypeError, ImportError,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer '{input_file}'.")
+        print(f"Error: {e}")
+        return
+
+    for hoja, encabezado in hojas:
+        procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb,
+                      excel_writer, hoja, sufijo=f" ({hoja})" if len(hojas) > 1 else "", encabezado=encabezado,
+                      csv_reader=csv_reader, phone_format=phone_format, tags_vocabulary=tags_vocabulary)
+
+
+def procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb=None,
+                  excel_writer=None, hoja=0, sufijo="", encabezado=None, csv_reader=None, phone_format=None,
+                  tags_vocabulary=False):
+    """Lee una hoja (solo las columnas que usa la transformación) y la divide en archivos por grupo."""
+    lotes = None
+    try:
+        # Un solo intento con el lector del formato real; los textos con su delimitador detectado
+        lectura = lectura_de(input_file)
+        if encabezado is None:
+            encabezado = columnas_tabla(input_file, sheet_name=hoja, **lectura)
+
+        # Solo se leen las columnas que usa la transformación; las que faltan se avisan aquí una vez
+        columnas, roles_mapping = proyectar(encabezado, input_file, roles_mapping,
+                                            obligatorias=['Nombre_empresa', 'Telefonos', group_by_col],
+                                            opcionales=['Actividad Comercial', 'Actividad'])
+        if lectura and max_memory_mb:
+            lotes = leer_texto_por_lotes(input_file, max_memory_mb, usecols=columnas, **lectura)
+        else:
+            df = leer_tabla(input_file, sheet_name=hoja, usecols=columnas, lector=csv_reader, **lectura)
+    except (OSError, ValueError, KeyError, TypeError, ImportError,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer '{input_file}'.")
+        print(f"Error: {e}")
+        return
+
+    if lotes is not None:
+        procesar_por_lotes(lotes, input_file, output_dir, output_format, group_by_col, roles_mapping,
+                           excel_writer, sufijo, phone_format, hoja, tags_vocabulary)
+        return
+
+    with ReporteTelefonos(ruta_reporte(output_dir, input_file, sufijo), input_file) as reporte:
+        df = limpiar_columna(df, 'Telefonos', phone_format, reporte, hoja)
     grouped = df.groupby(group_by_col)
+    vocabulario = VocabularioEtiquetas()
 
     for group_name, group_df in grouped:
-        data = []
-        for index, row in group_df.iterrows():
-            company = row['Nombre_empresa']
-            phone_number = str(row['Telefonos']) if pd.notna(row['Telefonos']) else ''
-            phone_number = re.sub(r'\D', '', phone_number) # Limpiar numero de telefono
-
-            # --- Obtener 'Actividad' y 'GRUPO / TALLER' ---
-            actividad = row.get('Actividad', '')  # Usar .get() por si no existe
-            grupo_taller = row.get(group_by_col, '')  # Usar group_by_col y .get()
-
-            for position, cols in roles_mapping.items():
-                name_col, email_col = cols
-                try:
-                    full_name = str(row[name_col]) if pd.notna(row[name_col]) else ''
-                    email = row[email_col] if pd.notna(row[email_col]) else ''
-                except KeyError as e:
-                    print(f"Advertencia: Columna '{e}' no encontrada en '{input_file}'. Omitiendo.")
-                    continue
-
-                if email and full_name:
-                    firstname, lastname = split_name(full_name)
-
-                    # --- Crear los tags ---
-                    # Priorizar 'Actividad Comercial', luego 'Actividad', y finalmente cadena vacía
-                    tags_source = row.get('Actividad Comercial', row.get('Actividad', ''))
-                    if tags_source:
-                        # Dividir por comas, punto y coma, o "y" (con espacios opcionales)
-                        tags_list = re.split(r'[;,]| y ', tags_source)
-                        tags_list = [tag.strip().lower() for tag in tags_list if tag.strip()]  # Limpiar y a minúsculas
-                        tags = ",".join(tags_list)
-                    else:
-                        tags = ""
-
-                    person_data = {
-                        'Name': f"{firstname} {lastname}".strip(),  # Combina nombre y apellido
-                        'Position': position,
-                        'Company': company,
-                        'Description': '',  # Valores por defecto para las nuevas columnas
-                        'Country': 'Panama',
-                        'Zip': '',
-                        'City': '',  # Ya no se pone SAN FELIPE por defecto
-                        'State': '',
-                        'Address': '',
-                        'Status': '',
-                        'Source': '',
-                        'Email': email,
-                        'Website': '',
-                        'Phonenumber': phone_number,
-                        'Lead value': '',
-                        'Tags': tags  # Agregar los tags
-                    }
-                    data.append(person_data)
-
-        output_df = pd.DataFrame(data)
+        output_df = transformar_grupo(group_df, input_file, group_by_col, roles_mapping, vocabulario)
         if not output_df.empty:
-            # --- Orden de columnas CORRECTO ---
-            column_order = [
-                'Name', 'Position', 'Company', 'Description', 'Country', 'Zip',
-                'City', 'State', 'Address', 'Status', 'Source', 'Email',
-                'Website', 'Phonenumber', 'Lead value', 'Tags'
-            ]
-            output_df = output_df[column_order]
-
-            try:
-                output_filename = re.sub(r'[\\/*?:"<>|]', "", str(group_name))
-                output_filename = output_filename.strip() #Eliminar espacios al inicio y al final
-            except TypeError:
-                output_filename = "grupo_invalido"
-
-            if output_format == "csv":
-                output_filepath = os.path.join(output_dir, f"{output_filename}.csv")
-                try:
-                    # --- Usa csv.writer para un CSV bien formado ---
-                    with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                        writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                        writer.writerow(output_df.columns)  # Encabezados
-                        for row in output_df.values:
-                            writer.writerow(row)
-                    # ------------------------------------------------
-                    print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
-                except Exception as e:
-                    print(f"Error al guardar '{output_filepath}': {e}")
-            else:
-                output_filepath = os.path.join(output_dir, f"{output_filename}.xlsx")
-                try:
-                    output_df.to_excel(output_filepath, index=False, engine='openpyxl')
-                    print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
-                except Exception as e:
-                    print(f"Error al guardar '{output_filepath}': {e}")
+            guardar_grupo(output_df, group_name, ruta_grupo(group_name, output_dir, output_format, sufijo),
+                          output_format, excel_writer)
         else:
             print(f"No hay datos para el grupo '{group_name}' en '{input_file}', no se genera archivo.")
+    if tags_vocabulary:
+        vocabulario.guardar(ruta_vocabulario(output_dir, input_file, sufijo), input_file)
 
 
 def main():
@@ -210,11 +266,30 @@ def main():
                         help="Directorio de salida (si no, usa el de entrada).")
     parser.add_argument("-f", "--format", choices=["excel", "csv"], default="excel",
                         help="Formato de salida ('excel' o 'csv', por defecto: 'excel').")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir xlsx: 'openpyxl' (por defecto), 'write_only' o 'xlsxwriter' "
+                             "(estos dos en streaming, con memoria constante). También: variable MOTOR_EXCEL.")
+    parser.add_argument("--csv_reader", choices=LECTORES_CSV,
+                        help="Lector de CSV/TSV: 'pandas' (por defecto) o 'arrow' (pyarrow: varios hilos y archivo "
+                             "mapeado en memoria; mismo resultado). También: variable LECTOR_CSV.")
+    parser.add_argument("--phone_format", choices=FORMATOS_TELEFONO,
+                        help="Teléfonos: 'digitos' (por defecto: solo los dígitos) o 'e164' (números de Panamá "
+                             "validados y escritos como +507...; los inválidos no se suben y van a "
+                             "'telefonos_invalidos_<archivo>.csv'). También: variable FORMATO_TELEFONO.")
+    parser.add_argument("--tags_vocabulary", action="store_true",
+                        help="Guarda también el vocabulario de tags de cada archivo (cada tag y en cuántos contactos "
+                             "sale) en 'etiquetas_<archivo>.csv', para crear los tags en Perfex antes de importar.")
     parser.add_argument("-g", "--group_by", default=DEFAULT_GROUP_BY,
                         help="Columna para agrupar (por defecto: 'GRUPO / TALLER').")
     parser.add_argument("-m", "--mapping",
                         help="Ruta a un archivo de mapeo de columnas (opcional).")
+    parser.add_argument("--max_memory", type=float,
+                        help="Memoria máxima en MB: los CSV se procesan por lotes que caben en ella (opcional).")
     args = parser.parse_args()
+    try:
+        phone_format = formato_telefono(args.phone_format)
+    except ValueError as e:
+        parser.error(str(e))
 
     output_dir = args.output_dir if args.output_dir else args.input_dir
     if output_dir != args.input_dir and not os.path.exists(output_dir):
@@ -243,7 +318,9 @@ def main():
 
     for input_file in filtered_input_files:
         print(f"Procesando archivo: {input_file}")
-        process_and_split_excel(input_file, output_dir, args.format, args.group_by, roles_mapping)
+        process_and_split_excel(input_file, output_dir, args.format, args.group_by, roles_mapping, args.max_memory,
+                                args.excel_writer, csv_reader=args.csv_reader, phone_format=phone_format,
+                                tags_vocabulary=args.tags_vocabulary)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,275 +1,104 @@
 import pandas as pd
-import re
 import os
 import argparse
-import csv
 from glob import glob
-import chardet
 from unicodedata import normalize
-import numpy as np
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar utilidades
+from utilidades.escritura import MOTORES_EXCEL, repartir_como_array_split
+from utilidades.etiquetas import VocabularioEtiquetas, ruta_vocabulario
+from utilidades.leads import PerfilLeads, fix_encoding_issues, guardar_leads, leads_del_archivo
+from utilidades.lectura import LECTORES_CSV
+from utilidades.telefonos import FORMATOS_TELEFONO, ReporteTelefonos, formato_telefono, ruta_reporte
 # --- Constantes ---
 DEFAULT_ROLES_MAPPING = {
     'Dueño': ['RAZON_SOCIAL', 'EMAIL']  # Usamos RAZON_SOCIAL como nombre
 }
-
-def split_name(full_name):
-    """Divide un nombre completo en nombre y apellido (sin cambios)."""
-    if not isinstance(full_name, str):
-        return "", ""
-    parts = full_name.split()
-    if len(parts) == 0:
-        return "", ""
-    elif len(parts) == 1:
-        return parts[0], ""
-    elif len(parts) == 2:
-        return parts[0], parts[1]
-    else:
-        firstname = []
-        lastname = []
-        compound_names = ["María", "Ana", "Juan", "Luis", "José", "Carlos",
-                          "San", "Santa", "De", "Del", "La", "El", "Los",
-                          "Da", "Do", "Das", "Dos", "D'", "L'", "O'"]
-
-        i = 0
-        while i < len(parts):
-            if i < len(parts) - 1 and parts[i] in compound_names:
-                firstname.append(parts[i] + " " + parts[i + 1])
-                i += 2
-            else:
-                firstname.append(parts[i])
-                i += 1
-
-        if len(firstname) >= 3:
-            mid = len(firstname) // 2
-            lastname = firstname[mid:]
-            firstname = firstname[:mid]
-
-        return " ".join(firstname), " ".join(lastname)
-
-def detect_encoding(filepath):
-    """Detecta la codificación de un archivo usando chardet."""
-    with open(filepath, 'rb') as file:
-        rawdata = file.read()
-    result = chardet.detect(rawdata)
-    return result['encoding']
-
-
-def detect_delimiter(filepath, num_lines=5):
-    """Detecta el delimitador de un archivo CSV (mejorado con encoding)."""
-    encoding = detect_encoding(filepath)
-    try:
-        with open(filepath, 'r', encoding=encoding) as file:
-            sample_lines = [file.readline() for _ in range(num_lines)]
-    except:
-        return '\t'
-
-    sniffer = csv.Sniffer()
-    for line in sample_lines:
-        try:
-            dialect = sniffer.sniff(line)
-            return dialect.delimiter
-        except csv.Error:
-            continue
-    return '\t'
-
-
-def read_csv_robust(filepath, delimiter=None):
-    """Lee un CSV intentando múltiples codificaciones si es necesario."""
-    if delimiter is None:
-        delimiter = detect_delimiter(filepath)
-
-    encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'utf-8-sig', 'utf-16']
-
-    try:
-        encoding = detect_encoding(filepath)
-        df = pd.read_csv(filepath, sep=delimiter, encoding=encoding, errors='replace')
-        return df
-    except:
-        pass
-
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(filepath, sep=delimiter, encoding=encoding, errors='replace')
-            print(f"Archivo leído con éxito usando la codificación: {encoding}")
-            return df
-        except Exception as e:
-            print(f"Fallo al leer con {encoding}: {e}")
-            continue  # Prueba la siguiente codificación
-
-    print(f"No se pudo leer el archivo CSV: {filepath}")
-    return None  # Retorna None si falla
-
-def fix_encoding_issues(text):
-    """Intenta corregir problemas comunes de codificación."""
-    if isinstance(text, str):
-        # Diccionario de reemplazos
-        replacements = {
-            "Ã³": "ó",
-            "Ã¡": "á",
-            "Ã©": "é",
-            "Ã­": "í",
-            "Ãº": "ú",
-            "Ã±": "ñ",
-            "Ã": "Á",
-            "Ã‰": "É",
-            "Ã": "Í",
-            "Ã“": "Ó",
-            "Ãš": "Ú",
-            "Ã‘": "Ñ",
-            "Â¿": "¿",
-            "Â¡": "¡",
-            "â€œ": "“",
-            "â€": "”",
-            "â€”": "—",
-            "â€“": "–",
-            "â€¦": "…",
-            "Â": "",  # Remover Â (carácter de control)
-        }
-        #Aplica los remplazos
-        for incorrect, correct in replacements.items():
-            text = text.replace(incorrect, correct)
-
-        return text
+ADDRESS_COLUMNS = [  # Partes de la dirección, en orden
+    'PROVINCIA', 'DISTRITO', 'CORREGIMIENTO', 'URBANIZACION', 'DESCRIPCION_DEL_AREA',
+    'CALLE', 'CASA', 'EDIFICIO', 'APARTAMENTO',
+]
+PHONE_COLUMNS = ['TELEFONO', 'TELEFONO_2']  # Se unen, en orden, en 'Phonenumber'
+OPTIONAL_COLUMNS = ['NOMBRE_COMERCIAL', 'TELEFONO', 'TELEFONO_2', 'ACTIVIDADES'] + ADDRESS_COLUMNS  # Se leen si existen
+
+
+def construir_lead(row, firstname, lastname, email, combined_phone_number, address, vocabulario):
+    """Registro de un contacto (dict con las columnas de `utilidades.leads.COLUMN_ORDER`)."""
+    # --- Actividades (para Description y Tags) ---
+    actividades = row.get('ACTIVIDADES', '')
+    tags = vocabulario.etiquetar(actividades)  # Cada actividad distinta se divide una sola vez
+    if pd.notna(actividades) and actividades:
+        # Para la descripción, usamos la cadena completa (limpia)
+        description = fix_encoding_issues(str(actividades).strip())
     else:
-        return text #Retorna sin modificar
-
-def process_and_transform_excel(input_file, output_dir, output_format="excel", roles_mapping=None, chunksize=None):
+        description = ""
+
+    return {
+        'Name': f"{firstname} {lastname}".strip(),
+        'Position': "Dueño",
+        'Company': row.get('NOMBRE_COMERCIAL', ''),
+        'Description': description,  # Usamos la descripción
+        'Country': 'Panama',
+        'Zip': '',
+        'City': row.get('DISTRITO', ''),
+        'State': row.get('PROVINCIA', ''),
+        'Address': address,
+        'Status': '',
+        'Source': '',
+        'Email': email,
+        'Website': '',
+        'Phonenumber': combined_phone_number,
+        'Lead value': '',
+        'Tags': tags  # Y también los tags
+    }
+
+
+PERFIL = PerfilLeads(PHONE_COLUMNS, ADDRESS_COLUMNS, OPTIONAL_COLUMNS, construir_lead)
+
+
+def process_and_transform_excel(input_file, output_dir, output_format="excel", roles_mapping=None, chunksize=None,
+                                max_memory_mb=None, excel_writer=None, csv_reader=None, phone_format=None,
+                                tags_vocabulary=False):
     """Procesa, transforma y (opcionalmente) divide los datos."""
-
-    try:
-        df = pd.read_excel(input_file, engine='openpyxl')
-    except (FileNotFoundError, ValueError, KeyError, TypeError, pd.errors.EmptyDataError) as e1:
-        df = read_csv_robust(input_file)
-        if df is None:
-            return
-
     if roles_mapping is None:
         roles_mapping = DEFAULT_ROLES_MAPPING
 
-    data = []
-    for index, row in df.iterrows():
-        company = row.get('NOMBRE_COMERCIAL', '')
-        for position, cols in roles_mapping.items():
-            name_col, email_col = cols
-            try:
-                full_name = str(row[name_col]) if pd.notna(row[name_col]) else ''
-                email = row[email_col] if pd.notna(row[email_col]) else ''
-            except KeyError as e:
-                print(f"Advertencia: Columna '{e}' no encontrada en '{input_file}'. Omitiendo.")
-                continue
-
-            if email and full_name:
-                firstname, lastname = split_name(full_name)
-                phone1 = str(row.get('TELEFONO', '')).strip() if pd.notna(row.get('TELEFONO', '')) else ''
-                phone2 = str(row.get('TELEFONO_2', '')).strip() if pd.notna(row.get('TELEFONO_2', '')) else ''
-                phone1 = re.sub(r'\D', '', phone1)
-                phone2 = re.sub(r'\D', '', phone2)
-                phone_numbers = [p for p in [phone1, phone2] if p]
-                combined_phone_number = ",".join(phone_numbers)
-
-                actividades = row.get('ACTIVIDADES', '')
-                if actividades:
-                    actividades = str(actividades)
-                    tags_list = re.split(r'[;,]| y ', actividades)
-                    tags_list = [tag.strip().lower() for tag in tags_list if tag.strip()]
-                    tags = ",".join(tags_list)
-                    description = fix_encoding_issues(actividades.strip())
-                else:
-                    tags = ""
-                    description = ""
-
-                address_parts = [
-                    str(row.get('PROVINCIA', '')).strip(),
-                    str(row.get('DISTRITO', '')).strip(),
-                    str(row.get('CORREGIMIENTO', '')).strip(),
-                    str(row.get('URBANIZACION', '')).strip(),
-                    str(row.get('DESCRIPCION_DEL_AREA', '')).strip(),
-                    str(row.get('CALLE', '')).strip(),
-                    str(row.get('CASA', '')).strip(),
-                    str(row.get('EDIFICIO', '')).strip(),
-                    str(row.get('APARTAMENTO', '')).strip(),
-                ]
-                address = ", ".join(part for part in address_parts if part and part.lower() != "nan")
-
-                person_data = {
-                    'Name': f"{firstname} {lastname}".strip(),
-                    'Position': "Dueño",
-                    'Company': company,
-                    'Description': description,
-                    'Country': 'Panama',
-                    'Zip': '',
-                    'City': row.get('DISTRITO', ''),
-                    'State': row.get('PROVINCIA', ''),
-                    'Address': address,
-                    'Status': '',
-                    'Source': '',
-                    'Email': email,
-                    'Website': '',
-                    'Phonenumber': combined_phone_number,
-                    'Lead value': '',
-                    'Tags': tags
-                }
-                data.append(person_data)
-
-    output_df = pd.DataFrame(data)
-    if output_df.empty:
-        print(f"No hay datos para procesar en '{input_file}', no se genera archivo.")
-        return
-
-    column_order = [
-        'Name', 'Position', 'Company', 'Description', 'Country', 'Zip',
-        'City', 'State', 'Address', 'Status', 'Source', 'Email',
-        'Website', 'Phonenumber', 'Lead value', 'Tags'
-    ]
-    output_df = output_df[column_order]
-
-    # --- División en chunks (si chunksize se proporciona) ---
-    if chunksize is not None:
-        output_base = os.path.join(output_dir, "separadas", f"TO_Dashboard_{os.path.splitext(os.path.basename(input_file))[0]}")
-        os.makedirs(os.path.join(output_dir, "separadas"), exist_ok=True)  # Crea "separadas"
+    # Los teléfonos inválidos de todas las hojas van a un reporte junto a la salida
+    vocabulario = VocabularioEtiquetas()
+    with ReporteTelefonos(ruta_reporte(output_dir, input_file), input_file) as reporte:
+        # Las hojas que coinciden con el mapeo se leen una tras otra, cada una con su mapeo, y los
+        # registros van directo a la salida (ver `leads_del_archivo`)
+        leads = leads_del_archivo(input_file, roles_mapping, PERFIL, reporte, max_memory_mb, csv_reader,
+                                  phone_format, vocabulario)
+        if leads is None:
+            print(f"No hay datos para procesar en '{input_file}', no se genera archivo.")
+            return
 
-        for i, chunk in enumerate(np.array_split(output_df, len(output_df) // chunksize + 1)):
-            output_filepath = f"{output_base}_{i+1}.{output_format}"
-            if output_format == "csv":
-                try:
-                    with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                        writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                        writer.writerow(output_df.columns)  # Encabezados en cada chunk
-                        for row in chunk.values:
-                            fixed_row = [fix_encoding_issues(str(x)) for x in row]
-                            writer.writerow(fixed_row)
-                    print(f"Datos guardados en '{output_filepath}'")
-                except Exception as e:
-                    print(f"Error al guardar '{output_filepath}': {e}")
+        # --- División en chunks (si chunksize se proporciona) ---
+        if chunksize is not None:
+            output_base = os.path.join(output_dir, "separadas", f"TO_Dashboard_{os.path.splitext(os.path.basename(input_file))[0]}")
+            os.makedirs(os.path.join(output_dir, "separadas"), exist_ok=True)  # Crea "separadas"
 
-            else: #Excel
+            # Mismos tamaños que np.array_split, pero los registros esperan en un temporal y no en memoria
+            for numero, parte in repartir_como_array_split(leads, chunksize):
+                output_filepath = f"{output_base}_{numero}.{output_format}"
                 try:
-                    chunk.to_excel(output_filepath, index=False, engine='openpyxl')
+                    guardar_leads(parte, output_filepath, output_format, excel_writer)
                     print(f"Datos guardados en '{output_filepath}'")
                 except Exception as e:
                     print(f"Error al guardar '{output_filepath}': {e}")
 
-    else:
-        # --- Guardado normal (sin división) ---
-        output_filepath = os.path.join(output_dir, f"TO_Dashboard_{os.path.basename(input_file)}.{output_format}")
-        if output_format == "csv":
+        else:
+            # --- Guardado normal (sin división) ---
+            output_filepath = os.path.join(output_dir, f"TO_Dashboard_{os.path.basename(input_file)}.{output_format}")
             try:
-                with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                    writer.writerow(output_df.columns)
-                    for row in output_df.values:
-                        fixed_row = [fix_encoding_issues(str(x)) for x in row]
-                        writer.writerow(fixed_row)
-                print(f"Datos guardados en '{output_filepath}'")
-            except Exception as e:
-                print(f"Error al guardar '{output_filepath}': {e}")
-        else:  # Excel
-            try:
-                output_df.to_excel(output_filepath, index=False, engine='openpyxl')
+                guardar_leads(leads, output_filepath, output_format, excel_writer)
                 print(f"Datos guardados en '{output_filepath}'")
             except Exception as e:
                 print(f"Error al guardar '{output_filepath}': {e}")
 
+        if tags_vocabulary:
+            vocabulario.guardar(ruta_vocabulario(output_dir, input_file), input_file)
 
 
 def main():
@@ -280,10 +109,29 @@ def main():
                         help="Directorio de salida (si no, usa el directorio de entrada).")
     parser.add_argument("-f", "--format", choices=["excel", "csv"], default="excel",
                         help="Formato de salida ('excel' o 'csv', por defecto: 'excel').")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir xlsx: 'openpyxl' (por defecto), 'write_only' o 'xlsxwriter' "
+                             "(estos dos en streaming, con memoria constante). También: variable MOTOR_EXCEL.")
+    parser.add_argument("--csv_reader", choices=LECTORES_CSV,
+                        help="Lector de CSV/TSV: 'pandas' (por defecto) o 'arrow' (pyarrow: varios hilos y archivo "
+                             "mapeado en memoria; mismo resultado). También: variable LECTOR_CSV.")
+    parser.add_argument("--phone_format", choices=FORMATOS_TELEFONO,
+                        help="Teléfonos: 'digitos' (por defecto: solo los dígitos) o 'e164' (números de Panamá "
+                             "validados y escritos como +507...; los inválidos no se suben y van a "
+                             "'telefonos_invalidos_<archivo>.csv'). También: variable FORMATO_TELEFONO.")
+    parser.add_argument("--tags_vocabulary", action="store_true",
+                        help="Guarda también el vocabulario de tags de cada archivo (cada tag y en cuántos contactos "
+                             "sale) en 'etiquetas_<archivo>.csv', para crear los tags en Perfex antes de importar.")
+    parser.add_argument("--max_memory", type=float,
+                        help="Memoria máxima en MB: los CSV se leen por lotes que caben en ella (opcional).")
     parser.add_argument("-c", "--chunksize", type=int,
                         help="Tamaño de los chunks para dividir el archivo (opcional).")
 
     args = parser.parse_args()
+    try:
+        phone_format = formato_telefono(args.phone_format)
+    except ValueError as e:
+        parser.error(str(e))
 
     # --- Configuración del directorio de salida ---
     if args.output_dir:
@@ -301,7 +149,10 @@ def main():
 
     for input_file in filtered_input_files:
         print(f"Procesando archivo: {input_file}")
-        process_and_transform_excel(input_file, output_dir, args.format, chunksize=args.chunksize)
+        process_and_transform_excel(input_file, output_dir, args.format, chunksize=args.chunksize,
+                                    max_memory_mb=args.max_memory, excel_writer=args.excel_writer,
+                                    csv_reader=args.csv_reader, phone_format=phone_format,
+                                    tags_vocabulary=args.tags_vocabulary)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Compara la división de nombres completos en nombre y apellido:
+- 'lista':   la función que tenía cada script (bucle por palabras y `in`
+             sobre una lista de prefijos), llamada una vez por contacto;
+- 'cache':   utilidades.nombres.split_name (frozenset y caché LRU), una vez
+             por contacto;
+- 'unicos':  utilidades.nombres.dividir_nombres, que factoriza la columna y
+             divide solo los valores únicos.
+Las tres dan el mismo resultado; se comprueba antes de medir.
+
+Uso:
+    python benchmarks/division_nombres.py                  # 10.000, 100.000 y 1.000.000 contactos
+    python benchmarks/division_nombres.py --filas 100000 --unicos 500 5000 50000
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar utilidades
+from utilidades import nombres
+from utilidades.nombres import NOMBRES_COMPUESTOS, dividir_nombres, split_name
+
+FILAS_POR_DEFECTO = [10000, 100000, 1000000]
+UNICOS_POR_DEFECTO = [5000]
+NOMBRES = ["María José", "Juan Carlos", "Ana", "Luis Alberto", "José", "Carmen", "Pedro", "Rosa", "Del Carmen",
+           "San Juan", "Ana Lucía", "Carlos", "Santa María", "Luis"]
+APELLIDOS = ["Pérez", "González", "De León", "Rodríguez", "Castillo", "Del Valle", "Sánchez", "De La Cruz",
+             "Los Santos", "Vásquez", "El Rosario", "Martínez"]
+COMPOUND_NAMES_LISTA = ["María", "Ana", "Juan", "Luis", "José", "Carlos",
+                        "San", "Santa", "De", "Del", "La", "El", "Los"]
+
+
+def split_name_lista(full_name):
+    """La división de siempre: lista de prefijos y sin caché (referencia)."""
+    if not isinstance(full_name, str):
+        return "", ""
+    parts = full_name.split()
+    if len(parts) == 0:
+        return "", ""
+    elif len(parts) == 1:
+        return parts[0], ""
+    elif len(parts) == 2:
+        return parts[0], parts[1]
+    else:
+        firstname = []
+        lastname = []
+        i = 0
+        while i < len(parts):
+            if i < len(parts) - 1 and parts[i] in COMPOUND_NAMES_LISTA:
+                firstname.append(parts[i] + " " + parts[i + 1])
+                i += 2
+            else:
+                firstname.append(parts[i])
+                i += 1
+        if len(firstname) >= 3:
+            mid = len(firstname) // 2
+            lastname = firstname[mid:]
+            firstname = firstname[:mid]
+        return " ".join(firstname), " ".join(lastname)
+
+
+def datos_prueba(filas, unicos, semilla=0):
+    """`filas` nombres completos (y algún nulo) elegidos entre `unicos` nombres distintos."""
+    rng = np.random.default_rng(semilla)
+    base = list(dict.fromkeys(" ".join(filter(None, partes))
+                              for partes in itertools.product(NOMBRES, APELLIDOS, [""] + APELLIDOS)))
+    rng.shuffle(base)
+    # Si hacen falta más, se repiten con un número al final ("Ana Pérez 2")
+    distintos = [nombre if vuelta == 0 else f"{nombre} {vuelta}"
+                 for vuelta in range(unicos // len(base) + 1) for nombre in base][:unicos]
+    valores = np.array(distintos + [None], dtype=object)
+    return valores[rng.integers(0, len(valores), filas)].tolist()
+
+
+def medir(metodo, valores):
+    """Segundos de dividir `valores` con `metodo`, con la caché vacía al empezar."""
+    nombres._dividir.cache_clear()
+    inicio = time.perf_counter()
+    if metodo == 'lista':
+        [split_name_lista(valor) for valor in valores]
+    elif metodo == 'cache':
+        [split_name(valor) for valor in valores]
+    else:
+        dividir_nombres(valores)
+    return time.perf_counter() - inicio
+
+
+def comprobar(valores):
+    """Las tres formas dan el mismo (nombre, apellido) para cada valor."""
+    referencia = [split_name_lista(valor) for valor in valores]
+    firstnames, lastnames = dividir_nombres(valores, NOMBRES_COMPUESTOS)
+    if ([split_name(valor) for valor in valores] != referencia
+            or list(zip(firstnames.tolist(), lastnames.tolist())) != referencia):
+        raise AssertionError("La división de nombres no coincide con la de referencia")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara las formas de dividir nombres completos.")
+    parser.add_argument("--filas", type=int, nargs="+", default=FILAS_POR_DEFECTO,
+                        help="Número de contactos a dividir (por defecto: 10000 100000 1000000).")
+    parser.add_argument("--unicos", type=int, nargs="+", default=UNICOS_POR_DEFECTO,
+                        help="Nombres distintos entre los contactos (por defecto: 5000).")
+    args = parser.parse_args()
+
+    print(f"{'filas':>9} {'unicos':>7}  {'metodo':<7} {'segundos':>9} {'vs lista':>9}")
+    for filas in args.filas:
+        for unicos in args.unicos:
+            valores = datos_prueba(filas, unicos)
+            comprobar(valores[:10000])
+            referencia = None
+            for metodo in ('lista', 'cache', 'unicos'):
+                segundos = medir(metodo, valores)
+                if metodo == 'lista':
+                    referencia = segundos
+                print(f"{filas:>9} {unicos:>7}  {metodo:<7} {segundos:>9.3f} {referencia / segundos:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Compara los motores de escritura xlsx (utilidades.escritura.MOTORES_EXCEL)
+sobre hojas con las columnas de la plantilla de Perfex: tiempo, pico de
+memoria de Python (tracemalloc, en una segunda pasada) y tamaño del archivo.
+
+Uso:
+    python benchmarks/escritura_excel.py                  # 5.000, 50.000 y 500.000 filas
+    python benchmarks/escritura_excel.py --filas 5000 50000 --motores openpyxl xlsxwriter
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar utilidades
+from utilidades.escritura import MOTORES_EXCEL, guardar_excel
+
+FILAS_POR_DEFECTO = [5000, 50000, 500000]
+COLUMNAS = [
+    'Name', 'Position', 'Company', 'Description', 'Country', 'Zip',
+    'City', 'State', 'Address', 'Status', 'Source', 'Email',
+    'Website', 'Phonenumber', 'Lead value', 'Tags'
+]
+NOMBRES = ["María José", "Juan Carlos", "Ana", "Luis Alberto", "José", "Carmen", "Pedro", "Rosa"]
+APELLIDOS = ["Pérez", "González", "De León", "Rodríguez", "Castillo", "Del Valle", "Sánchez"]
+ACTIVIDADES = ["comercio al por menor", "transporte,logística", "restaurantes", "construcción", "importación"]
+
+
+def datos_prueba(filas, semilla=0):
+    """DataFrame de `filas` contactos sintéticos con las columnas de la plantilla (textos y vacíos)."""
+    rng = np.random.default_rng(semilla)
+    nombres = (pd.Series(rng.choice(NOMBRES, filas)) + " " + pd.Series(rng.choice(APELLIDOS, filas)))
+    empresas = pd.Series(rng.integers(0, filas // 3 + 1, filas)).map(lambda n: f"Empresa {n} S.A.")
+    df = pd.DataFrame({columna: [''] * filas for columna in COLUMNAS})
+    df['Name'] = nombres
+    df['Position'] = rng.choice(["Gerente General", "Ventas", "Mercadeo", "Dueño"], filas)
+    df['Company'] = empresas
+    df['Description'] = rng.choice(ACTIVIDADES, filas)
+    df['Country'] = 'Panama'
+    df['City'] = rng.choice(["PANAMA", "SAN MIGUELITO", "COLON", "DAVID"], filas)
+    df['Address'] = df['City'] + ", Calle " + pd.Series(rng.integers(1, 100, filas)).astype(str)
+    df['Email'] = [f"contacto{i}@empresa{i % 997}.com" for i in range(filas)]
+    df['Phonenumber'] = pd.Series(rng.integers(60000000, 69999999, filas)).astype(str)
+    df['Tags'] = df['Description'].str.replace(" ", "")
+    return df
+
+
+def medir(df, motor, directorio, memoria):
+    """(segundos, pico de memoria en MB o None, tamaño en MB) de guardar `df` con `motor`."""
+    ruta = os.path.join(directorio, f"{motor}_{len(df)}.xlsx")
+    inicio = time.perf_counter()
+    guardar_excel(df, ruta, motor)
+    segundos = time.perf_counter() - inicio
+    tamano = os.path.getsize(ruta) / (1024 * 1024)
+
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        guardar_excel(df, ruta, motor)
+        pico = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    os.remove(ruta)
+    return segundos, pico, tamano
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara los motores de escritura xlsx.")
+    parser.add_argument("--filas", type=int, nargs="+", default=FILAS_POR_DEFECTO,
+                        help="Tamaños de hoja a probar (por defecto: 5000 50000 500000).")
+    parser.add_argument("--motores", nargs="+", choices=MOTORES_EXCEL, default=list(MOTORES_EXCEL),
+                        help="Motores a comparar (por defecto: todos).")
+    parser.add_argument("--sin_memoria", action="store_true",
+                        help="No mide el pico de memoria (evita la segunda pasada con tracemalloc).")
+    args = parser.parse_args()
+
+    print(f"{'filas':>8}  {'motor':<11} {'segundos':>9} {'vs openpyxl':>11} {'pico MB':>9} {'archivo MB':>10}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for filas in args.filas:
+            df = datos_prueba(filas)
+            referencia = None
+            for motor in args.motores:
+                segundos, pico, tamano = medir(df, motor, directorio, not args.sin_memoria)
+                if motor == 'openpyxl':
+                    referencia = segundos
+                relativo = f"{referencia / segundos:.1f}x" if referencia else "-"
+                texto_pico = f"{pico:.1f}" if pico is not None else "-"
+                print(f"{filas:>8}  {motor:<11} {segundos:>9.2f} {relativo:>11} {texto_pico:>9} {tamano:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
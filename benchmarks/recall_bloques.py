@@ -0,0 +1,127 @@
+"""
+Comprueba que el modo 'bloques' de comparar_empresas.py con n-gramas no pierde
+ningún par frente al 'exhaustivo': genera pares de nombres casi iguales
+(erratas, letras de más o de menos, palabras cambiadas, nombres cortos), los
+compara por grupos en los dos modos y falla si 'bloques' no da exactamente los
+mismos pares y scores, para cada tamaño de n-grama. Informa también el recall
+de --claves tokens, que es una heurística y puede perder pares.
+
+Uso:
+    python benchmarks/recall_bloques.py                     # 3000 pares, n = 1, 2, 3 y 4
+    python benchmarks/recall_bloques.py --pares 10000 --ngramas 2 --umbral 70
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar comparar_empresas
+warnings.filterwarnings("ignore", message="Using slow pure-python SequenceMatcher")
+from comparar_empresas import UMBRAL_SIMILITUD, buscar_coincidencias
+from utilidades.normalizacion import normalize_string
+
+PARES_POR_DEFECTO = 3000
+NGRAMAS_POR_DEFECTO = [1, 2, 3, 4]
+PARES_POR_GRUPO = 50  # Cada grupo se compara todos contra todos
+LETRAS = "abcdefghijklmnopqrstuvwxyz0123456789"
+PALABRAS = ["comercial", "inversiones", "grupo", "panama", "servicios", "distribuidora", "del", "pacifico",
+            "global", "farmacia", "super", "mini", "el", "la", "constructora", "logistica", "hermanos",
+            "rodriguez", "chen", "central", "norte", "colon", "sa", "s a", "corp", "inc"]
+# Pares que el índice de trigramas de antes perdía (nombres de 5 a 7 letras con una errata)
+CASOS_CONOCIDOS = [("abcde", "abxde"), ("acme sa", "acne sa")]
+
+
+def nombre_base(rng):
+    """Un nombre de empresa: palabras del vocabulario o letras al azar, de 1 a 40 caracteres."""
+    if rng.random() < 0.5:
+        return " ".join(rng.choice(PALABRAS, rng.integers(1, 5)))
+    return "".join(rng.choice(list(LETRAS + " "), rng.integers(1, 41)))
+
+
+def errata(nombre, rng):
+    """`nombre` con 0 a 3 ediciones al azar: cambiar, añadir, quitar o trasponer letras, o cambiar una palabra."""
+    letras = list(nombre)
+    for _ in range(rng.integers(0, 4)):
+        operacion = rng.integers(0, 5)
+        posicion = int(rng.integers(0, len(letras) + 1))
+        if operacion == 0 or not letras:
+            letras.insert(posicion, rng.choice(list(LETRAS)))
+        elif operacion == 1:
+            del letras[min(posicion, len(letras) - 1)]
+        elif operacion == 2:
+            letras[min(posicion, len(letras) - 1)] = rng.choice(list(LETRAS))
+        elif operacion == 3 and len(letras) > 1:
+            posicion = min(posicion, len(letras) - 2)
+            letras[posicion], letras[posicion + 1] = letras[posicion + 1], letras[posicion]
+        else:
+            palabras = "".join(letras).split() or [""]
+            palabras[int(rng.integers(0, len(palabras)))] = str(rng.choice(PALABRAS))
+            letras = list(" ".join(palabras))
+    return "".join(letras)
+
+
+def pares_casi_iguales(pares, semilla=0):
+    """`pares` (target, otro) normalizados como en comparar_empresas.py, empezando por CASOS_CONOCIDOS."""
+    rng = np.random.default_rng(semilla)
+    resultado = list(CASOS_CONOCIDOS)
+    while len(resultado) < pares:
+        base = nombre_base(rng)
+        resultado.append((normalize_string(errata(base, rng)), normalize_string(errata(base, rng))))
+    return resultado[:pares]
+
+
+def comprobar(pares, ngramas, umbral):
+    """
+    Compara cada grupo de pares en los dos modos. Devuelve (pares del
+    exhaustivo, pares de tokens, segundos por modo); lanza AssertionError si
+    'bloques' con n-gramas pierde o cambia algún par.
+    """
+    total, encontrados_tokens = 0, 0
+    segundos = {"exhaustivo": 0.0, "tokens": 0.0, **{f"ngramas n={n}": 0.0 for n in ngramas}}
+    for inicio in range(0, len(pares), PARES_POR_GRUPO):
+        targets, otros = (list(nombres) for nombres in zip(*pares[inicio:inicio + PARES_POR_GRUPO]))
+        momento = time.perf_counter()
+        exhaustivo = buscar_coincidencias(targets, otros, "exhaustivo", umbral=umbral)
+        segundos["exhaustivo"] += time.perf_counter() - momento
+        total += len(exhaustivo)
+        for n in ngramas:
+            momento = time.perf_counter()
+            bloques = buscar_coincidencias(targets, otros, "bloques", "ngramas", n, umbral)
+            segundos[f"ngramas n={n}"] += time.perf_counter() - momento
+            if bloques != exhaustivo:
+                perdidos = sorted(set(exhaustivo) - set(bloques))
+                ejemplos = ", ".join(f"'{targets[i]}' <-> '{otros[j]}' ({score})" for i, j, score in perdidos[:5])
+                raise AssertionError(f"El modo 'bloques' con n={n} pierde {len(perdidos)} pares: {ejemplos}")
+        momento = time.perf_counter()
+        encontrados_tokens += len(buscar_coincidencias(targets, otros, "bloques", "tokens", umbral=umbral))
+        segundos["tokens"] += time.perf_counter() - momento
+    return total, encontrados_tokens, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprueba que el modo 'bloques' no pierde pares.")
+    parser.add_argument("--pares", type=int, default=PARES_POR_DEFECTO,
+                        help=f"Pares de nombres casi iguales (por defecto: {PARES_POR_DEFECTO}).")
+    parser.add_argument("--ngramas", type=int, nargs="+", default=NGRAMAS_POR_DEFECTO,
+                        help="Tamaños de n-grama a comprobar (por defecto: 1 2 3 4).")
+    parser.add_argument("--umbral", type=int, default=UMBRAL_SIMILITUD,
+                        help=f"Umbral de similitud (por defecto: {UMBRAL_SIMILITUD}).")
+    parser.add_argument("--semilla", type=int, default=0, help="Semilla de los nombres (por defecto: 0).")
+    args = parser.parse_args()
+
+    pares = pares_casi_iguales(args.pares, args.semilla)
+    total, encontrados_tokens, segundos = comprobar(pares, args.ngramas, args.umbral)
+    print(f"{len(pares)} pares en grupos de {PARES_POR_GRUPO}, umbral {args.umbral}: "
+          f"{total} pares sobre el umbral en el exhaustivo")
+    print(f"{'modo':<14} {'recall':>7} {'segundos':>9}")
+    for modo, tiempo in segundos.items():
+        recall = encontrados_tokens / total if modo == "tokens" and total else 1.0
+        print(f"{modo:<14} {recall:>7.4f} {tiempo:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,33 @@
 import pandas as pd
+import numpy as np
 import os
 import argparse
 from glob import glob
-import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from fuzzywuzzy import fuzz
-from unidecode import unidecode
 
-def normalize_string(text):
-    """Normaliza una cadena: minúsculas, sin tildes, solo alfanumérico."""
-    if not isinstance(text, str):
-        return ""
-    text = unidecode(text).lower()
-    text = re.sub(r'[^a-z0-9\s]', '', text)
-    return text.strip()
+from utilidades.escritura import MOTORES_EXCEL, EscritorResultados, TAMANO_LOTE
+from utilidades.indice_directorio import IndiceDirectorio
+from utilidades.lectura import leer_tabla
+from utilidades.mejores_k import MejoresK, entero_positivo
+from utilidades.niveles import resolver_por_niveles, resumen_niveles
+from utilidades.normalizacion import (normalize_string, normalizar_serie, tomar_estadisticas,
+                                      sumar_estadisticas, resumen_estadisticas)
+
+try:
+    from rapidfuzz import fuzz as rf_fuzz, process as rf_process
+except ImportError:  # rapidfuzz es opcional: sin él, el modo 'matriz' usa el de bloques
+    rf_fuzz = rf_process = None
+
+UMBRAL_SIMILITUD = 80
+NGRAMA = 2  # Con 3 o más, el filtro de n-gramas no descarta nada a este umbral (ver claves_requeridas)
+SIN_CANDIDATO = np.iinfo(np.int64).max
+FILAS_BLOQUE_TARGET = 1000  # Tamaño de los bloques de la matriz target x referencia
+FILAS_BLOQUE_OTRO = 10000
+COLUMNAS_CONTACTO = ['Telefono', 'Telefono.1', 'Email']
+COLUMNAS_RESULTADO = ['Empresa_Original', 'Empresa_Coincidente', 'Telefono1', 'Telefono2', 'Email',
+                      'Archivo_Origen', 'Score_Coincidencia']
 
 def compare_companies(target_company, other_company):
     """Compara dos nombres de empresa usando fuzzy matching."""
@@ -20,24 +35,360 @@ def compare_companies(target_company, other_company):
         return 0
     return fuzz.ratio(normalize_string(target_company), normalize_string(other_company))
 
-def process_and_compare(input_file, compare_dir, output_file):
+def generar_claves_bloque(texto, modo="ngramas", n=NGRAMA):
+    """
+    Claves de bloqueo de un nombre normalizado y cuántas veces aparece cada una
+    (Counter): n-gramas de caracteres o palabras. Un nombre más corto que n no
+    tiene n-gramas.
+    """
+    if modo == "tokens":
+        return Counter(texto.split())
+    return Counter(texto[i:i + n] for i in range(len(texto) - n + 1))
+
+def construir_indice_bloques(nombres, modo="ngramas", n=NGRAMA):
+    """
+    Construye un índice invertido: clave de bloque -> (posiciones de las filas que
+    la contienen, cuántas veces la contiene cada una), como arrays de numpy.
+    """
+    posiciones, veces = defaultdict(list), defaultdict(list)
+    for posicion, nombre in enumerate(nombres):
+        for clave, cuenta in generar_claves_bloque(nombre, modo, n).items():
+            posiciones[clave].append(posicion)
+            veces[clave].append(cuenta)
+    return {clave: (np.array(posiciones[clave], dtype=np.int64), np.array(veces[clave], dtype=np.int32))
+            for clave in posiciones}
+
+def longitud_compatible(len_a, len_b, umbral=UMBRAL_SIMILITUD):
+    """
+    fuzz.ratio = 2*M/(len_a+len_b) con M <= min(len_a, len_b), así que dos cadenas
+    de longitudes muy distintas nunca alcanzan el umbral (redondeado).
+    Acepta arrays de longitudes.
+    """
+    return 200 * np.minimum(len_a, len_b) >= (umbral - 0.5) * (len_a + len_b)
+
+def claves_requeridas(len_nombre, longitudes, modo="ngramas", n=NGRAMA, umbral=UMBRAL_SIMILITUD):
+    """
+    Claves (contando repetidas) que `nombre` debe compartir con cada nombre de
+    `longitudes` para que el par pueda llegar al umbral; SIN_CANDIDATO si las
+    longitudes no son compatibles.
+    En 'ngramas' es el lema de los q-gramas, así que no se pierde ningún par:
+    fuzz.ratio = 2*M/S (S, suma de las longitudes) con M a lo sumo la subsecuencia
+    común más larga L, luego L >= m = ceil((umbral - 0.5)*S/200). De los L-n+1
+    n-gramas de esa subsecuencia, cada uno de los S-2L caracteres que quedan fuera
+    corta como mucho n-1 en cada nombre, y el resto aparece en los dos: comparten
+    al menos m-n+1-(n-1)*(S-2m). Si da 0 o menos (nombres cortos, n grande), el par
+    se compara solo por la longitud.
+    En 'tokens' basta una palabra en común: es una heurística y puede perder pares
+    (una errata en cada palabra).
+    """
+    sumas = len_nombre + longitudes
+    if modo == "tokens":
+        requeridas = np.ones(len(longitudes), dtype=np.int64)
+    else:
+        # Redondear m hacia abajo solo relaja el filtro: el margen cubre el error de coma flotante
+        m = np.ceil((umbral - 0.5) * sumas / 200 - 1e-9).astype(np.int64)
+        requeridas = m - n + 1 - (n - 1) * (sumas - 2 * m)
+    return np.where(longitud_compatible(len_nombre, longitudes, umbral), requeridas, SIN_CANDIDATO)
+
+def candidatos_bloque(nombre, indice, longitudes, requisitos, modo="ngramas", n=NGRAMA, umbral=UMBRAL_SIMILITUD):
+    """
+    Posiciones (en orden) de los nombres del otro archivo que se puntúan con
+    `nombre` en el modo 'bloques': los de longitud compatible que comparten al
+    menos las claves que exige claves_requeridas. `requisitos` guarda esas
+    exigencias por longitud de nombre (se calculan una vez por longitud).
+    """
+    len_nombre = len(nombre)
+    requeridas = requisitos.get(len_nombre)
+    if requeridas is None:
+        requeridas = requisitos[len_nombre] = claves_requeridas(len_nombre, longitudes, modo, n, umbral)
+    comunes = np.zeros(len(longitudes), dtype=np.int64)
+    for clave, cuenta in generar_claves_bloque(nombre, modo, n).items():
+        if clave in indice:
+            posiciones, veces = indice[clave]
+            comunes[posiciones] += np.minimum(veces, cuenta)
+    return np.flatnonzero(comunes >= requeridas).tolist()
+
+def buscar_coincidencias(nombres_target, nombres_otro, modo="bloques", claves="ngramas", n=NGRAMA,
+                         umbral=UMBRAL_SIMILITUD, hilos=-1):
+    """
+    Devuelve la lista de coincidencias (posición target, posición otro, similitud).
+    En modo 'exhaustivo' compara todos los pares; en modo 'bloques' solo los pares
+    que comparten bastantes claves del índice invertido (ver claves_requeridas: con
+    n-gramas, los mismos pares que el exhaustivo); en modo 'matriz' calcula
+    la matriz de similitud completa por bloques con rapidfuzz.
+    """
+    coincidencias = []
+
+    if modo == "matriz":
+        if rf_process is not None:
+            return puntuar_matriz(nombres_target, nombres_otro, umbral, hilos)
+        print("Advertencia: rapidfuzz no está instalado. Se usa el modo 'bloques'.")
+
+    if modo == "exhaustivo":
+        for i, target_company in enumerate(nombres_target):
+            for j, other_company in enumerate(nombres_otro):
+                similarity = compare_companies(target_company, other_company)
+                if similarity >= umbral:
+                    coincidencias.append((i, j, similarity))
+        return coincidencias
+
+    indice = construir_indice_bloques(nombres_otro, claves, n)
+    longitudes = np.array([len(nombre) for nombre in nombres_otro], dtype=np.int64)
+    requisitos = {}
+
+    for i, target_company in enumerate(nombres_target):
+        candidatos = candidatos_bloque(target_company, indice, longitudes, requisitos, claves, n, umbral)
+        for j in candidatos:  # Mismo orden que el recorrido exhaustivo
+            similarity = compare_companies(target_company, nombres_otro[j])
+            if similarity >= umbral:
+                coincidencias.append((i, j, similarity))
+    return coincidencias
+
+def puntuar_matriz(nombres_target, nombres_otro, umbral=UMBRAL_SIMILITUD, hilos=-1,
+                   filas_target=FILAS_BLOQUE_TARGET, filas_otro=FILAS_BLOQUE_OTRO):
+    """
+    Calcula la matriz de similitud de cada bloque target x bloque referencia con
+    rapidfuzz process.cdist (varios hilos) y devuelve solo los pares sobre el umbral,
+    en el mismo orden (posición target, posición otro) que el recorrido exhaustivo.
+    Los nombres ya vienen normalizados, así que no se aplica ningún procesador.
+    La matriz solo preselecciona: el ratio de rapidfuzz (Indel) nunca es menor que
+    el de fuzzywuzzy (difflib cuenta como mucho los mismos caracteres comunes), así
+    que ningún par del modo exhaustivo queda fuera, y cada candidato se puntúa con
+    compare_companies, como en el exhaustivo: mismos pares y mismos scores.
+    """
+    coincidencias = []
+
+    for inicio_t in range(0, len(nombres_target), filas_target):
+        bloque_target = nombres_target[inicio_t:inicio_t + filas_target]
+        filas, columnas = [], []
+
+        for inicio_o in range(0, len(nombres_otro), filas_otro):
+            bloque_otro = nombres_otro[inicio_o:inicio_o + filas_otro]
+            # fuzz.ratio (fuzzywuzzy) redondea a entero: >= 80 equivale a >= 79.5
+            matriz = rf_process.cdist(bloque_target, bloque_otro, scorer=rf_fuzz.ratio,
+                                      score_cutoff=umbral - 0.5, workers=hilos)
+            f, c = np.nonzero(matriz)
+            filas.append(f + inicio_t)
+            columnas.append(c + inicio_o)
+
+        if not filas:
+            continue
+        filas = np.concatenate(filas)
+        columnas = np.concatenate(columnas)
+        orden = np.lexsort((columnas, filas))
+        for i, j in zip(filas[orden].tolist(), columnas[orden].tolist()):
+            similarity = compare_companies(nombres_target[i], nombres_otro[j])
+            if similarity >= umbral:
+                coincidencias.append((i, j, similarity))
+
+    return coincidencias
+
+def buscar_mejores(nombres_target, nombres_otro, k, modo="bloques", claves="ngramas", n=NGRAMA,
+                   umbral=UMBRAL_SIMILITUD, hilos=-1):
+    """
+    Como buscar_coincidencias, pero guarda solo los k mejores aciertos de cada
+    target en un montículo acotado. El k-ésimo mejor score actúa como corte
+    creciente: los pares cuya cota de longitud no lo supera no se puntúan.
+    Devuelve (posición target, posición otro, similitud) del mejor al peor.
+    """
+    mejores = MejoresK(k)
+
+    if modo == "matriz" and rf_process is None:
+        print("Advertencia: rapidfuzz no está instalado. Se usa el modo 'bloques'.")
+        modo = "bloques"
+
+    if modo == "matriz":
+        for inicio_t in range(0, len(nombres_target), FILAS_BLOQUE_TARGET):
+            bloque_target = nombres_target[inicio_t:inicio_t + FILAS_BLOQUE_TARGET]
+            for inicio_o in range(0, len(nombres_otro), FILAS_BLOQUE_OTRO):
+                bloque_otro = nombres_otro[inicio_o:inicio_o + FILAS_BLOQUE_OTRO]
+                # El corte del bloque es el menor de los k-ésimos scores de sus targets
+                minimo = min(mejores.score_minimo(i, umbral)
+                             for i in range(inicio_t, inicio_t + len(bloque_target)))
+                matriz = rf_process.cdist(bloque_target, bloque_otro, scorer=rf_fuzz.ratio,
+                                          score_cutoff=minimo - 0.5, workers=hilos)
+                # Candidatos de la matriz, puntuados como en el exhaustivo (ver puntuar_matriz)
+                for f, c in zip(*np.nonzero(matriz)):
+                    i, j = inicio_t + int(f), inicio_o + int(c)
+                    similarity = compare_companies(nombres_target[i], nombres_otro[j])
+                    if similarity >= mejores.score_minimo(i, umbral):
+                        mejores.agregar(i, (similarity, -j), j)
+    else:
+        indice = construir_indice_bloques(nombres_otro, claves, n) if modo == "bloques" else None
+        longitudes = np.array([len(nombre) for nombre in nombres_otro], dtype=np.int64)
+        requisitos = {}
+
+        for i, target_company in enumerate(nombres_target):
+            if indice is None:
+                candidatos = range(len(nombres_otro))
+            else:
+                candidatos = candidatos_bloque(target_company, indice, longitudes, requisitos, claves, n, umbral)
+            len_target = len(target_company)
+            for j in candidatos:
+                minimo = mejores.score_minimo(i, umbral)
+                if minimo > 100:
+                    break  # Ya tiene k aciertos perfectos: nada puede superarlos
+                if not longitud_compatible(len_target, longitudes[j], minimo):
+                    continue
+                similarity = compare_companies(target_company, nombres_otro[j])
+                if similarity >= minimo:
+                    mejores.agregar(i, (similarity, -j), j)
+
+    return [(i, j, clave[0]) for i, clave, j in mejores.ordenados()]
+
+def verificar_recall(nombres_target, nombres_otro, claves="ngramas", n=NGRAMA, umbral=UMBRAL_SIMILITUD):
+    """Compara el modo por bloques contra el exhaustivo e informa los pares que se pierden."""
+    exhaustivo = {(i, j) for i, j, _ in buscar_coincidencias(nombres_target, nombres_otro, "exhaustivo", umbral=umbral)}
+    bloques = {(i, j) for i, j, _ in buscar_coincidencias(nombres_target, nombres_otro, "bloques", claves, n, umbral)}
+    perdidos = sorted(exhaustivo - bloques)
+    recall = len(exhaustivo & bloques) / len(exhaustivo) if exhaustivo else 1.0
+    print(f"Recall bloques vs exhaustivo: {recall:.4f} "
+          f"({len(exhaustivo)} pares exhaustivo, {len(bloques)} pares bloques, {len(perdidos)} perdidos)")
+    for i, j in perdidos[:20]:
+        print(f"  Perdido: '{nombres_target[i]}' <-> '{nombres_otro[j]}'")
+    return recall, perdidos
+
+def leer_archivo_comparacion(compare_file):
+    """Lee un archivo a comparar según su formato real. Devuelve None si no se puede leer."""
+    try:
+        return leer_tabla(compare_file)
+    except Exception as e:
+        print(f"Error: No se pudo leer '{compare_file}'. Se omite. ({e})")
+        return None
+
+def detectar_nombre_comercial(df_other):
+    """Devuelve la columna 'Nombre_Comercial' (comparando normalizado) o None."""
+    for col in df_other.columns:
+        if normalize_string(col) == 'nombrecomercial':
+            return col
+    return None
+
+def construir_indice_empresas(df_other):
+    """
+    Reduce un archivo a comparar a lo que usa la comparación: Nombre_Comercial
+    (original y normalizado) y los datos de contacto. Si no tiene Nombre_Comercial
+    devuelve un DataFrame vacío para que no se vuelva a leer.
+    """
+    nombre_comercial_col = detectar_nombre_comercial(df_other)
+    if nombre_comercial_col is None:
+        return pd.DataFrame()
+    columnas = [nombre_comercial_col] + [col for col in COLUMNAS_CONTACTO
+                                         if col in df_other.columns and col != nombre_comercial_col]
+    df_indice = df_other[columnas].copy()
+    df_indice['Nombre_Comercial_Normalized'] = normalizar_serie(df_indice[nombre_comercial_col])
+    return df_indice
+
+# Estado de cada proceso trabajador: el target y las opciones se reciben una sola vez
+_TRABAJO = {}
+
+def _inicializar_trabajador(empresas_target, nombres_target, opciones):
+    """Guarda el target y las opciones en el proceso (initializer del pool)."""
+    _TRABAJO['empresas_target'] = empresas_target
+    _TRABAJO['nombres_target'] = nombres_target
+    _TRABAJO['opciones'] = opciones
+    _TRABAJO['indice'] = IndiceDirectorio(opciones['compare_dir'], "empresas", opciones['directorio_indice'],
+                                          persistente=opciones['usar_indice'])
+
+def comparar_archivo(compare_file):
+    """
+    Compara el target del proceso con un archivo del directorio.
+    Los resultados son tuplas (posición target, posición otro, similitud, fila).
+    Devuelve (resultados, entrada del índice, si se reconstruyó, estadísticas de
+    normalización) para que el proceso principal combine todo en orden.
+    """
+    opciones = _TRABAJO['opciones']
+    indice = _TRABAJO['indice']
+    reconstruidos = indice.reconstruidos
+    resultados = []
+
+    df_other = indice.obtener(compare_file, leer_archivo_comparacion, construir_indice_empresas)
+    reconstruido = indice.reconstruidos > reconstruidos
+    if df_other is None:
+        return resultados, indice.entrada(compare_file), reconstruido, tomar_estadisticas()
+
+    # --- Detección automática de 'Nombre_Comercial' ---
+    nombre_comercial_col = detectar_nombre_comercial(df_other)
+
+    if nombre_comercial_col is None:
+        print(f"Advertencia: '{compare_file}' no tiene 'Nombre_Comercial'. Se omite.")
+        return resultados, indice.entrada(compare_file), reconstruido, tomar_estadisticas()
+    # ------------------------------------------------------
+
+    empresas_target = _TRABAJO['empresas_target']
+    nombres_target = _TRABAJO['nombres_target']
+    nombres_otro = df_other['Nombre_Comercial_Normalized'].tolist()
+
+    if opciones['comprobar_recall']:
+        print(f"Verificando recall en '{os.path.basename(compare_file)}'...")
+        verificar_recall(nombres_target, nombres_otro, opciones['claves'], opciones['n'])
+
+    coincidencias = []
+    pendientes = range(len(nombres_target))
+    if opciones['niveles']:
+        # Niveles exacta / tokens / fonética: solo lo que no resuelven pasa al fuzzy matching.
+        # La similitud de sus pares se calcula igual, solo para informarla.
+        por_nivel, pendientes, resueltos = resolver_por_niveles(nombres_target, nombres_otro)
+        print(resumen_niveles(resueltos, len(pendientes), os.path.basename(compare_file)))
+        mejores = MejoresK(opciones['top_k']) if opciones['top_k'] else None
+        for index, other_index, nivel in por_nivel:
+            similarity = compare_companies(nombres_target[index], nombres_otro[other_index])
+            if mejores is None:
+                coincidencias.append((index, other_index, similarity, nivel))
+            else:
+                mejores.agregar(index, (similarity, -other_index), (index, other_index, similarity, nivel))
+        if mejores is not None:
+            coincidencias = [dato for _, _, dato in mejores.ordenados()]
+
+    objetivos = [nombres_target[index] for index in pendientes]
+    if opciones['top_k']:
+        difusas = buscar_mejores(objetivos, nombres_otro, opciones['top_k'], opciones['modo'],
+                                 opciones['claves'], opciones['n'], hilos=opciones['hilos'])
+    else:
+        difusas = buscar_coincidencias(objetivos, nombres_otro, opciones['modo'],
+                                       opciones['claves'], opciones['n'], hilos=opciones['hilos'])
+    coincidencias.extend((pendientes[index], other_index, similarity, 'difusa')
+                         for index, other_index, similarity in difusas)
+
+    if opciones['niveles']:
+        # Mismo orden que sin niveles: por target y, dentro de cada uno, por fila (o del mejor al peor)
+        if opciones['top_k']:
+            coincidencias.sort(key=lambda c: (c[0], -c[2], c[1]))
+        else:
+            coincidencias.sort(key=lambda c: (c[0], c[1]))
+
+    for index, other_index, similarity, nivel in coincidencias:
+        other_row = df_other.iloc[other_index]
+        telefono1 = other_row.get('Telefono', '')
+        telefono2 = other_row.get('Telefono.1', '') if 'Telefono.1' in other_row else ''
+        email = other_row.get('Email', '')
+
+        fila = {
+            'Empresa_Original': empresas_target[index],  # Usa la columna original
+            'Empresa_Coincidente': other_row[nombre_comercial_col],  # Usa la columna original
+            'Telefono1': telefono1,
+            'Telefono2': telefono2,
+            'Email': email,
+            'Archivo_Origen': os.path.basename(compare_file),
+            'Score_Coincidencia': similarity
+        }
+        if opciones['niveles']:
+            fila['Nivel_Coincidencia'] = nivel
+        resultados.append((index, other_index, similarity, fila))
+
+    return resultados, indice.entrada(compare_file), reconstruido, tomar_estadisticas()
+
+def process_and_compare(input_file, compare_dir, output_file, modo="bloques", claves="ngramas", n=NGRAMA,
+                        comprobar_recall=False, hilos=-1, usar_indice=True, directorio_indice=None, workers=1,
+                        top_k=None, niveles=False, tamano_lote=TAMANO_LOTE, excel_writer=None):
     """
     Procesa el archivo principal y lo compara con archivos en un directorio.
     """
     try:
-        # Intenta leer como Excel primero
-        df_target = pd.read_excel(input_file, engine='openpyxl')
-    except Exception:
-        try:
-            # Intenta leer como CSV con UTF-8
-            df_target = pd.read_csv(input_file, sep='\t', encoding='utf-8')
-        except Exception:
-            try:
-                #Si UTF8 falla intenta con latin-1
-                df_target = pd.read_csv(input_file, sep='\t', encoding='latin-1')
-            except:
-                print(f"Error: No se pudo leer el archivo principal '{input_file}'.")
-                return
+        # Un solo intento con el lector que corresponde al formato (xlsx, xls, parquet o texto)
+        df_target = leer_tabla(input_file)
+    except Exception as e:
+        print(f"Error: No se pudo leer el archivo principal '{input_file}': {e}")
+        return
 
     # --- Detección automática de la columna 'Company' ---
     company_col = None
@@ -51,68 +402,72 @@ def process_and_compare(input_file, compare_dir, output_file):
         return
     #-------------------------------------------------------
 
-    df_target['Company_Normalized'] = df_target[company_col].apply(normalize_string)
-
-    all_results = []
+    df_target['Company_Normalized'] = normalizar_serie(df_target[company_col])
 
     compare_files = glob(os.path.join(compare_dir, "*.xlsx")) + \
                     glob(os.path.join(compare_dir, "*.xls")) + \
                     glob(os.path.join(compare_dir, "*.csv"))
+    compare_files = [f for f in compare_files if not os.path.basename(f).startswith("~$")]
 
-    for compare_file in compare_files:
-        if os.path.basename(compare_file).startswith("~$"):
-            continue
+    if workers > 1 and hilos == -1:
+        hilos = 1  # Cada proceso usa un hilo para no saturar los núcleos
+    opciones = {
+        'compare_dir': compare_dir, 'modo': modo, 'claves': claves, 'n': n,
+        'comprobar_recall': comprobar_recall, 'hilos': hilos,
+        'usar_indice': usar_indice, 'directorio_indice': directorio_indice, 'top_k': top_k,
+        'niveles': niveles,
+    }
+    empresas_target = df_target[company_col].tolist()  # Usa la columna original
+    nombres_target = df_target['Company_Normalized'].tolist()
 
-        try:
-            df_other = pd.read_excel(compare_file, engine='openpyxl')
-        except Exception:
-            try:
-                df_other = pd.read_csv(compare_file, sep='\t', encoding='utf-8')
-            except Exception:
-                try:
-                    df_other = pd.read_csv(compare_file, sep='\t', encoding='latin-1')
-                except:
-                    print(f"Error: No se pudo leer '{compare_file}'. Se omite.")
-                    continue
+    indice = IndiceDirectorio(compare_dir, "empresas", directorio_indice, persistente=usar_indice)
+    estadisticas_normalizacion = [tomar_estadisticas()]
+    mejores = MejoresK(top_k) if top_k else None
 
-        # --- Detección automática de 'Nombre_Comercial' ---
-        nombre_comercial_col = None
-        for col in df_other.columns:
-            if normalize_string(col) == 'nombrecomercial':
-                nombre_comercial_col = col
-                break
+    columnas = list(COLUMNAS_RESULTADO)
+    if niveles:
+        columnas.append('Nivel_Coincidencia')
+    # Las coincidencias se escriben por lotes según llegan; con top_k solo se guardan k por empresa
+    escritor = EscritorResultados(output_file, columnas, tamano_lote, motor=excel_writer)
 
-        if nombre_comercial_col is None:
-            print(f"Advertencia: '{compare_file}' no tiene 'Nombre_Comercial'. Se omite.")
-            continue
-       # ------------------------------------------------------
-        df_other['Nombre_Comercial_Normalized'] = df_other[nombre_comercial_col].apply(normalize_string)
+    def combinar_resultados(orden, resultados):
+        if mejores is None:
+            escritor.agregar_filas(fila for _, _, _, fila in resultados)
+            return
+        # A igual score gana el archivo y la fila que aparecen antes
+        for index, other_index, similarity, fila in resultados:
+            mejores.agregar(index, (similarity, -orden, -other_index), fila)
 
-        for index, row in df_target.iterrows():
-            target_company = row['Company_Normalized']
-            for other_index, other_row in df_other.iterrows():
-                other_company = other_row['Nombre_Comercial_Normalized']
-                similarity = compare_companies(target_company, other_company)
-                if similarity >= 80:
-                    telefono1 = other_row.get('Telefono', '')
-                    telefono2 = other_row.get('Telefono.1', '') if 'Telefono.1' in other_row else ''
-                    email = other_row.get('Email', '')
-
-                    all_results.append({
-                        'Empresa_Original': row[company_col],  # Usa la columna original
-                        'Empresa_Coincidente': other_row[nombre_comercial_col],  # Usa la columna original
-                        'Telefono1': telefono1,
-                        'Telefono2': telefono2,
-                        'Email': email,
-                        'Archivo_Origen': os.path.basename(compare_file),
-                        'Score_Coincidencia': similarity
-                    })
-
-    if all_results:
-        df_results = pd.DataFrame(all_results)
-        df_results = df_results[['Empresa_Original', 'Empresa_Coincidente', 'Telefono1', 'Telefono2', 'Email', 'Archivo_Origen', 'Score_Coincidencia']]
-        df_results.to_excel(output_file, index=False)
-        print(f"Resultados guardados en '{output_file}'")
+    with escritor:
+        if workers > 1:
+            # El target se envía una sola vez a cada proceso (initializer), no con cada archivo
+            with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar_trabajador,
+                                     initargs=(empresas_target, nombres_target, opciones)) as executor:
+                resultados_archivos = executor.map(comparar_archivo, compare_files)
+                # map devuelve en el orden de compare_files: la salida es igual a la secuencial
+                for orden, (compare_file, (resultados, entrada, reconstruido, estadisticas)) in enumerate(
+                        zip(compare_files, resultados_archivos)):
+                    combinar_resultados(orden, resultados)
+                    indice.incorporar(compare_file, entrada, reconstruido)
+                    estadisticas_normalizacion.append(estadisticas)
+        else:
+            _inicializar_trabajador(empresas_target, nombres_target, opciones)
+            for orden, compare_file in enumerate(compare_files):
+                resultados, entrada, reconstruido, estadisticas = comparar_archivo(compare_file)
+                combinar_resultados(orden, resultados)
+                indice.incorporar(compare_file, entrada, reconstruido)
+                estadisticas_normalizacion.append(estadisticas)
+
+        if mejores is not None:
+            escritor.agregar_filas(fila for _, _, fila in mejores.ordenados())
+
+    indice.guardar()
+    if usar_indice:
+        print(indice.resumen())
+    print(resumen_estadisticas(sumar_estadisticas(*estadisticas_normalizacion)))
+
+    if escritor.filas_escritas:
+        print(f"Resultados guardados en '{output_file}' ({escritor.filas_escritas} filas)")
     else:
         print("No se encontraron coincidencias.")
 
@@ -124,6 +479,39 @@ def main():
     parser.add_argument("compare_dir", help="Directorio de archivos a comparar.")
     parser.add_argument("-o", "--output_file", default="resultados.xlsx",
                         help="Archivo de salida (por defecto: resultados.xlsx).")
+    parser.add_argument("--modo", choices=["bloques", "exhaustivo", "matriz"], default="bloques",
+                        help="'bloques' solo compara pares que comparten bastantes claves (con --claves ngramas, los "
+                             "mismos pares que 'exhaustivo'); 'exhaustivo' compara todos; "
+                             "'matriz' preselecciona los pares con la matriz de similitud de rapidfuzz en varios núcleos y los "
+                             "puntúa como 'exhaustivo' (mismos resultados) (por defecto: bloques).")
+    parser.add_argument("--claves", choices=["ngramas", "tokens"], default="ngramas",
+                        help="Claves del índice de bloqueo: n-gramas de caracteres (no pierde pares) o palabras "
+                             "(más rápido, pero pierde los pares sin ninguna palabra igual; ver --verificar_recall) "
+                             "(por defecto: ngramas).")
+    parser.add_argument("-n", "--ngrama", type=entero_positivo, default=NGRAMA,
+                        help="Tamaño de los n-gramas de caracteres; con 3 o más, al umbral de "
+                             f"{UMBRAL_SIMILITUD} no descartan ningún par y solo filtra la longitud (por defecto: {NGRAMA}).")
+    parser.add_argument("--verificar_recall", action="store_true",
+                        help="Compara el modo por bloques con el exhaustivo e informa los pares perdidos.")
+    parser.add_argument("--hilos", type=int, default=-1,
+                        help="Hilos para el modo 'matriz' (-1 usa todos los núcleos, por defecto: -1).")
+    parser.add_argument("--sin_indice", action="store_true",
+                        help="No usa ni actualiza el índice en disco del directorio de comparación.")
+    parser.add_argument("--indice_dir",
+                        help="Carpeta del índice (por defecto: .indice_comparacion dentro de compare_dir).")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Procesos que comparan archivos en paralelo (por defecto: 1).")
+    parser.add_argument("-k", "--top_k", type=entero_positivo,
+                        help="Guarda solo las k mejores coincidencias de cada empresa (por defecto: todas).")
+    parser.add_argument("--niveles", action="store_true",
+                        help="Resuelve primero por igualdad exacta, de palabras ordenadas y fonética; "
+                             "solo lo que quede sin resolver pasa al fuzzy matching.")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE,
+                        help=f"Filas de resultados que se acumulan antes de escribirlas (por defecto: {TAMANO_LOTE}). "
+                             "Con -o terminado en .csv la salida es CSV.")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir el xlsx de resultados: 'write_only' (openpyxl) o 'xlsxwriter'; "
+                             "siempre en streaming ('openpyxl' equivale a 'write_only'). También: variable MOTOR_EXCEL.")
     args = parser.parse_args()
 
     input_files = glob(os.path.join(args.input_dir, "*.xlsx")) + \
@@ -135,7 +523,10 @@ def main():
         return
 
     input_file = input_files[0]
-    process_and_compare(input_file, args.compare_dir, args.output_file)
+    process_and_compare(input_file, args.compare_dir, args.output_file, args.modo, args.claves,
+                        args.ngrama, args.verificar_recall, args.hilos,
+                        not args.sin_indice, args.indice_dir, args.workers, args.top_k,
+                        args.niveles, args.lote, args.excel_writer)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,25 +3,32 @@ import os
 import argparse
 from glob import glob
 import re
+import hashlib
 from fuzzywuzzy import fuzz
-from unidecode import unidecode
 import zipfile  # <--- AGREGA ESTA LÍNEA
-
-def normalize_string(text):
-    """Normaliza una cadena: minúsculas, sin tildes, solo alfanumérico."""
-    if not isinstance(text, str):
-        return ""
-    text = unidecode(text).lower()  # Elimina tildes y convierte a minúsculas
-    text = re.sub(r'[^a-z0-9\s]', '', text)  # Elimina caracteres no alfanuméricos
-    return text.strip()
-
-
-def find_matching_columns(df_target, df_other):
-    """Encuentra las columnas (o pares) con nombres/apellidos coincidentes."""
-    matching_cols = []
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from utilidades.escritura import MOTORES_EXCEL, EscritorResultados, TAMANO_LOTE
+from utilidades.indice_directorio import IndiceDirectorio
+from utilidades.lectura import leer_tabla
+from utilidades.mejores_k import MejoresK, entero_positivo
+from utilidades.niveles import resolver_por_niveles, resumen_niveles
+from utilidades.normalizacion import (normalizar_serie, normalizar_valores, tomar_estadisticas, sumar_estadisticas,
+                                      resumen_estadisticas)
+
+TAMANO_MUESTRA = 200  # Filas (y nombres objetivo) muestreados para detectar columnas
+UMBRAL_TASA_ACIERTOS = 0.05  # Fracción mínima de la muestra que debe coincidir
+PATRON_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+PATRON_NUMERICO = re.compile(r'^[\d\s\-\+\(\)\.,/]+$')  # Números y teléfonos
+SUFIJO_NORMALIZADO = '_Normalized'
+COLUMNAS_CONTACTO = ['Email', 'Contact phonenumber', 'Phonenumber']
+COLUMNAS_RESULTADO = ['Nombre_Archivo_Target', 'Nombre_Objetivo', 'Nombre_Coincidente',
+                      'Email', 'Telefono', 'Nombre_Archivo', 'Score_Coincidencia']
+
+def preparar_nombres_objetivo(df_target):
+    """Devuelve los nombres del archivo target (Firstname, Lastname y Nombre Completo)."""
     target_names = []
-
-    # Prepara los nombres del archivo target (input)
     for col in ['Firstname', 'Lastname']:  # Considera Firstname y Lastname
         if col in df_target.columns:
             target_names.extend(df_target[col].dropna().astype(str).tolist())
@@ -29,101 +36,316 @@ def find_matching_columns(df_target, df_other):
     if 'Firstname' in df_target.columns and 'Lastname' in df_target.columns:
         df_target['Nombre Completo'] = df_target['Firstname'].fillna('') + " " + df_target['Lastname'].fillna('')
         target_names.extend(df_target['Nombre Completo'].dropna().astype(str).tolist())
+    return target_names
+
+
+def es_columna_descartable(valores, proporcion=0.8):
+    """True si la muestra es claramente numérica, de correos o de teléfonos."""
+    if not valores:
+        return True
+    descartables = sum(1 for valor in valores
+                       if PATRON_EMAIL.match(valor) or PATRON_NUMERICO.match(valor))
+    return descartables >= proporcion * len(valores)
+
+
+def tasa_aciertos(target_names, valores_normalizados, umbral=80):
+    """Fracción de los valores de la muestra que coinciden con algún nombre objetivo."""
+    valores = [valor for valor in valores_normalizados if valor]
+    if not valores:
+        return 0.0
+    aciertos = sum(1 for valor in valores
+                   if any(fuzz.partial_ratio(target_name, valor) >= umbral for target_name in target_names))
+    return aciertos / len(valores)
+
+
+def find_matching_columns(target_names_normalized, df_indice, tamano_muestra=TAMANO_MUESTRA,
+                          umbral_tasa=UMBRAL_TASA_ACIERTOS, semilla=0):
+    """
+    Encuentra las columnas (o pares) con nombres/apellidos coincidentes.
+    Puntúa cada columna candidata del índice y cada par sobre una muestra
+    aleatoria acotada de filas (y de nombres objetivo), y confirma una columna
+    solo si su tasa de aciertos supera el umbral.
+    """
+    matching_cols = []
 
-    target_names = [normalize_string(name) for name in target_names]
+    target_names = [name for name in dict.fromkeys(target_names_normalized) if name]
+    if len(target_names) > tamano_muestra:
+        target_names = pd.Series(target_names).sample(tamano_muestra, random_state=semilla).tolist()
+    if not target_names:
+        return matching_cols
 
-    # Itera sobre columnas y pares de columnas del otro archivo
-    for i in range(len(df_other.columns)):
-        col1_name = df_other.columns[i]
-        col1_values = df_other.iloc[:, i].dropna().astype(str).tolist()  # .iloc for positional
-        col1_values_normalized = [normalize_string(val) for val in col1_values]
+    muestra = df_indice
+    if len(df_indice) > tamano_muestra:
+        muestra = df_indice.sample(tamano_muestra, random_state=semilla)
 
+    candidatas = columnas_candidatas(df_indice)
+
+    # Itera sobre columnas y pares de columnas candidatas del otro archivo
+    for posicion, col1_name in enumerate(candidatas):
         # Compara columna individual
-        if any(any(fuzz.partial_ratio(target_name, col_value) >= 80  # Ajusta el umbral según sea necesario
-                   for col_value in col1_values_normalized)
-               for target_name in target_names):
+        if tasa_aciertos(target_names, valores_normalizados(muestra, (col1_name,))) >= umbral_tasa:
             matching_cols.append((col1_name,))  # Tupla de un elemento
 
         # Compara pares de columnas
-        for j in range(i + 1, len(df_other.columns)):
-            col2_name = df_other.columns[j]
-            col2_values = df_other.iloc[:, j].dropna().astype(str).tolist()
+        for col2_name in candidatas[posicion + 1:]:
+            combined_values_normalized = valores_normalizados(muestra, (col1_name, col2_name))
+            if tasa_aciertos(target_names, combined_values_normalized) >= umbral_tasa:
+                matching_cols.append((col1_name, col2_name))  # Tupla de dos elementos
 
-            # Combina las dos columnas
-            combined_values = (df_other.iloc[:, i].fillna('').astype(str) + " " +
-                               df_other.iloc[:, j].fillna('').astype(str)).tolist()
-            combined_values_normalized = [normalize_string(val) for val in combined_values]
+    return matching_cols
 
 
-            if any(any(fuzz.partial_ratio(target_name, combined_value) >= 80
-                       for combined_value in combined_values_normalized)
-                   for target_name in target_names):
-                matching_cols.append((col1_name, col2_name))  # Tupla de dos elementos
+def leer_archivo_comparacion(compare_file):
+    """Lee un archivo a comparar según su formato real. Devuelve None si no se puede leer."""
+    try:
+        return leer_tabla(compare_file)
+    except (FileNotFoundError, ValueError, KeyError, TypeError, ImportError, zipfile.BadZipFile,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{compare_file}'. Se omitirá.")
+        print(f"Error: {e}")
+        return None
+
+
+def construir_indice_nombres(df_other, tamano_muestra=TAMANO_MUESTRA, semilla=0):
+    """
+    Reduce un archivo a comparar a sus columnas de texto candidatas (como texto
+    y normalizadas) y a las de contacto. Las columnas cuya muestra es claramente
+    numérica, de correos o de teléfonos se descartan.
+    """
+    muestra = df_other
+    if len(df_other) > tamano_muestra:
+        muestra = df_other.sample(tamano_muestra, random_state=semilla)
+
+    columnas = {}
+    for i, col in enumerate(df_other.columns):
+        valores = [valor.strip() for valor in muestra.iloc[:, i].dropna().astype(str).tolist()]  # .iloc for positional
+        if es_columna_descartable([valor for valor in valores if valor]):
+            continue
+        texto = df_other.iloc[:, i].fillna('').astype(str)
+        columnas[col] = texto
+        columnas[f"{col}{SUFIJO_NORMALIZADO}"] = normalizar_serie(texto)
 
-    return matching_cols
+    for col in COLUMNAS_CONTACTO:
+        if col in df_other.columns and col not in columnas:
+            columnas[col] = df_other[col]
 
+    return pd.DataFrame(columnas, index=df_other.index).reset_index(drop=True)
 
-def extract_info(df_target, df_other, matching_cols, filename):
-    """Extrae información (correo, teléfono) basada en coincidencias de nombre."""
-    results = []
 
-    # Normaliza los nombres objetivo una vez, fuera del bucle
-    target_names = []
-    for col in ['Firstname', 'Lastname']:
-        if col in df_target.columns:
-            target_names.extend(df_target[col].dropna().astype(str).tolist())
-    if 'Firstname' in df_target.columns and 'Lastname' in df_target.columns:
-        df_target['Nombre Completo'] = df_target['Firstname'].fillna('') + " " + df_target['Lastname'].fillna('')
-        target_names.extend(df_target['Nombre Completo'].dropna().astype(str).tolist())
-    target_names_normalized = [normalize_string(name) for name in target_names]
-
-
-    for match in matching_cols:
-        if len(match) == 1:
-            # Coincidencia con una sola columna
-            col_name = match[0]
-            other_names = df_other[col_name].dropna().astype(str).tolist()
-            other_names_normalized = [normalize_string(name) for name in other_names]
-
-            for target_name, target_name_norm in zip(target_names, target_names_normalized):
-                for other_name, other_name_norm, (index, row) in zip(other_names, other_names_normalized, df_other.iterrows()):
-                    if fuzz.partial_ratio(target_name_norm, other_name_norm) >= 80:
-
-                        # Extrae info (maneja si las columnas no existen)
-                        email = row.get('Email', '')  # Usa .get() para evitar KeyError
-                        phone = row.get('Contact phonenumber',
-                                        row.get('Phonenumber', '') if 'Phonenumber' in df_other.columns else '')
-
-                        results.append({
-                            'Nombre_Archivo_Target': input_file, #Nombre archivo target
-                            'Nombre_Objetivo': target_name,
-                            'Nombre_Coincidente': other_name,
-                            'Email': email,
-                            'Telefono': phone,
-                            'Nombre_Archivo': filename
-                        })
-        else:
-             # Coincidencia con par de columnas
-            col1_name, col2_name = match
-            combined_names = (df_other[col1_name].fillna('') + " " + df_other[col2_name].fillna('')).astype(str).tolist()
-            combined_names_normalized = [normalize_string(name) for name in combined_names]
-
-            for target_name, target_name_norm in zip(target_names, target_names_normalized):
-                for combined_name, combined_name_norm, (index, row) in zip(combined_names, combined_names_normalized, df_other.iterrows()):
-                    if fuzz.partial_ratio(target_name_norm, combined_name_norm) >= 80:
-                        email = row.get('Email', '')
-                        phone = row.get('Contact phonenumber',
-                                        row.get('Phonenumber', '') if 'Phonenumber' in df_other.columns else '')
-                        results.append({
-                            'Nombre_Archivo_Target': input_file,
-                            'Nombre_Objetivo': target_name,
-                            'Nombre_Coincidente': combined_name,
-                            'Email': email,
-                            'Telefono': phone,
-                            'Nombre_Archivo': filename
-                        })
-
-    return results
+def columnas_candidatas(df_indice):
+    """Columnas del índice que tienen su versión normalizada."""
+    return [col for col in df_indice.columns if f"{col}{SUFIJO_NORMALIZADO}" in df_indice.columns]
+
+
+def contexto_esquemas(target_names_normalized, tamano_muestra, umbral_tasa):
+    """
+    Huella de lo que, además del archivo, decide las columnas detectadas: los
+    nombres objetivo normalizados, el tamaño de la muestra y la tasa mínima.
+    """
+    sha = hashlib.sha256()
+    for nombre in target_names_normalized:
+        sha.update(str(nombre).encode('utf-8') + b'\0')
+    sha.update(f"{tamano_muestra}|{umbral_tasa}".encode('utf-8'))
+    return sha.hexdigest()[:16]
+
+
+def firma_archivo(ruta, contexto=""):
+    """
+    Firma de un archivo (ruta, tamaño y fecha de modificación en ns) para la
+    caché de esquemas, junto con el `contexto` de la detección (ver `contexto_esquemas`).
+    """
+    stat = os.stat(ruta)
+    return f"{os.path.abspath(ruta)}|{stat.st_size}|{stat.st_mtime_ns}|{contexto}"
+
+
+def cargar_cache_esquemas(ruta_cache):
+    """Carga la caché de esquemas detectados (firma -> columnas coincidentes)."""
+    if not ruta_cache or not os.path.exists(ruta_cache):
+        return {}
+    try:
+        with open(ruta_cache, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: No se pudo leer la caché de esquemas '{ruta_cache}': {e}")
+        return {}
+
+
+def guardar_cache_esquemas(ruta_cache, cache):
+    """Guarda la caché de esquemas detectados."""
+    if not ruta_cache:
+        return
+    try:
+        with open(ruta_cache, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"Advertencia: No se pudo guardar la caché de esquemas '{ruta_cache}': {e}")
+
+
+def valores_coincidencia(df_indice, match):
+    """Textos (sin normalizar) de una columna o par de columnas, alineados por fila."""
+    if len(match) == 1:
+        return df_indice[match[0]].tolist()
+    col1_name, col2_name = match
+    return (df_indice[col1_name] + " " + df_indice[col2_name]).tolist()
+
+
+def valores_normalizados(df_indice, match):
+    """Textos normalizados (ya guardados en el índice) de una columna o par de columnas."""
+    if len(match) == 1:
+        return df_indice[f"{match[0]}{SUFIJO_NORMALIZADO}"].tolist()
+    col1_name, col2_name = match
+    combinados = (df_indice[f"{col1_name}{SUFIJO_NORMALIZADO}"] + " " +
+                  df_indice[f"{col2_name}{SUFIJO_NORMALIZADO}"])
+    return combinados.str.strip().tolist()
+
+
+def buscar_coincidencias_nombres(target_names_normalized, df_indice, matching_cols, umbral=80, top_k=None,
+                                 niveles=False, filename=''):
+    """
+    Única pasada de fuzzy matching sobre las columnas detectadas.
+    Devuelve los aciertos como tuplas (índice target, posición fila, columnas, score, nivel)
+    y los textos comparados de cada columna (o par) para la extracción.
+    Con top_k solo guarda los k mejores de cada nombre objetivo (del mejor al
+    peor); un nombre que ya tiene k aciertos perfectos deja de compararse.
+    Con niveles, los nombres que resuelven la igualdad exacta, de palabras
+    ordenadas o fonética no pasan por partial_ratio en esa columna.
+    """
+    hits = []
+    textos = {}
+    mejores = MejoresK(top_k) if top_k else None
+
+    for orden_match, match in enumerate(matching_cols):
+        textos[match] = valores_coincidencia(df_indice, match)
+        normalizados = valores_normalizados(df_indice, match)
+        # Las cadenas vacías nunca coinciden (partial_ratio devuelve 0)
+        valores = [(fila, valor) for fila, valor in enumerate(normalizados) if valor]
+        pendientes = range(len(target_names_normalized))
+
+        hits_match = []
+        if niveles:
+            por_nivel, pendientes, resueltos = resolver_por_niveles(target_names_normalized, normalizados)
+            print(resumen_niveles(resueltos, len(pendientes), f"{filename} {' + '.join(match)}"))
+            for target_index, fila, nivel in por_nivel:
+                # El score de los niveles solo se informa: el par ya está resuelto
+                score = fuzz.partial_ratio(target_names_normalized[target_index], normalizados[fila])
+                if mejores is None:
+                    hits_match.append((target_index, fila, match, score, nivel))
+                else:
+                    mejores.agregar(target_index, (score, -orden_match, -fila),
+                                    (target_index, fila, match, score, nivel))
+
+        for target_index in pendientes:
+            target_name_norm = target_names_normalized[target_index]
+            if not target_name_norm:
+                continue
+            if mejores is None:
+                for fila, valor_norm in valores:
+                    score = fuzz.partial_ratio(target_name_norm, valor_norm)
+                    if score >= umbral:
+                        hits_match.append((target_index, fila, match, score, 'difusa'))
+                continue
+
+            minimo = mejores.score_minimo(target_index, umbral)
+            for fila, valor_norm in valores:
+                if minimo > 100:
+                    break  # Ya tiene k aciertos perfectos: nada puede superarlos
+                score = fuzz.partial_ratio(target_name_norm, valor_norm)
+                if score >= minimo:
+                    # A igual score gana la columna y la fila que aparecen antes
+                    mejores.agregar(target_index, (score, -orden_match, -fila),
+                                    (target_index, fila, match, score, 'difusa'))
+                    minimo = mejores.score_minimo(target_index, umbral)
+
+        if niveles:
+            hits_match.sort(key=lambda hit: (hit[0], hit[1]))  # Mismo orden que sin niveles
+        hits.extend(hits_match)
+
+    if mejores is not None:
+        hits = [hit for _, _, hit in mejores.ordenados()]
+    return hits, textos
+
+
+def extract_info(target_names, target_names_normalized, df_indice, matching_cols, filename, input_file='',
+                 top_k=None, niveles=False):
+    """
+    Extrae información (correo, teléfono) basada en coincidencias de nombre.
+    El índice del DataFrame devuelto es la posición del nombre objetivo.
+    """
+    columnas = COLUMNAS_RESULTADO + ['Nivel_Coincidencia'] if niveles else COLUMNAS_RESULTADO
+    hits, textos = buscar_coincidencias_nombres(target_names_normalized, df_indice, matching_cols, top_k=top_k,
+                                                niveles=niveles, filename=filename)
+    if not hits:
+        return pd.DataFrame(columns=columnas)
+
+    target_indices, filas, matches, scores, niveles_hits = zip(*hits)
+    filas = list(filas)
+
+    # Extrae info de todas las filas coincidentes de una vez (maneja si las columnas no existen)
+    if 'Email' in df_indice.columns:
+        emails = df_indice['Email'].iloc[filas].tolist()
+    else:
+        emails = [''] * len(filas)
+    if 'Contact phonenumber' in df_indice.columns:
+        phones = df_indice['Contact phonenumber'].iloc[filas].tolist()
+    elif 'Phonenumber' in df_indice.columns:
+        phones = df_indice['Phonenumber'].iloc[filas].tolist()
+    else:
+        phones = [''] * len(filas)
+
+    return pd.DataFrame({
+        'Nombre_Archivo_Target': input_file,  # Nombre archivo target
+        'Nombre_Objetivo': [target_names[t] for t in target_indices],
+        'Nombre_Coincidente': [textos[match][fila] for match, fila in zip(matches, filas)],
+        'Email': emails,
+        'Telefono': phones,
+        'Nombre_Archivo': filename,
+        'Score_Coincidencia': list(scores),
+        'Nivel_Coincidencia': list(niveles_hits),
+    }, columns=columnas, index=list(target_indices))
+
+
+# Estado de cada proceso trabajador: los nombres objetivo y las opciones se reciben una sola vez
+_TRABAJO = {}
+
+
+def _inicializar_trabajador(target_names, target_names_normalized, opciones):
+    """Guarda los nombres objetivo y las opciones en el proceso (initializer del pool)."""
+    _TRABAJO['target_names'] = target_names
+    _TRABAJO['target_names_normalized'] = target_names_normalized
+    _TRABAJO['opciones'] = opciones
+    _TRABAJO['indice'] = IndiceDirectorio(opciones['compare_dir'], "nombres", opciones['indice_dir'],
+                                          persistente=opciones['usar_indice'])
+
+
+def comparar_archivo(compare_file):
+    """
+    Compara los nombres objetivo del proceso con un archivo del directorio.
+    Devuelve (resultados, firma, columnas detectadas o None si venían de la caché,
+    entrada del índice, si se reconstruyó, estadísticas de normalización) para que
+    el proceso principal combine todo en orden.
+    """
+    opciones = _TRABAJO['opciones']
+    indice = _TRABAJO['indice']
+    reconstruidos = indice.reconstruidos
+
+    df_indice = indice.obtener(compare_file, leer_archivo_comparacion, construir_indice_nombres)
+    reconstruido = indice.reconstruidos > reconstruidos
+    firma = firma_archivo(compare_file, opciones['contexto_esquemas'])
+    if df_indice is None:
+        return None, firma, None, indice.entrada(compare_file), reconstruido, tomar_estadisticas()
+
+    filename = os.path.basename(compare_file)
+    detectadas = None
+    if firma in opciones['cache_esquemas']:
+        matching_cols = [tuple(match) for match in opciones['cache_esquemas'][firma]]
+        print(f"Esquema de '{filename}' tomado de la caché: {matching_cols}")
+    else:
+        matching_cols = detectadas = find_matching_columns(_TRABAJO['target_names_normalized'], df_indice,
+                                                           opciones['muestra'], opciones['umbral_tasa'])
+    results = extract_info(_TRABAJO['target_names'], _TRABAJO['target_names_normalized'], df_indice,
+                           matching_cols, filename, opciones['input_file'], opciones['top_k'],
+                           opciones['niveles'])
+    return results, firma, detectadas, indice.entrada(compare_file), reconstruido, tomar_estadisticas()
 
 
 def main():
@@ -132,6 +354,31 @@ def main():
     parser.add_argument("compare_dir", help="Directorio que contiene los archivos a comparar.")
     parser.add_argument("-o", "--output_file", default="resultados_comparacion.xlsx",
                         help="Nombre del archivo de salida (por defecto: resultados_comparacion.xlsx).")
+    parser.add_argument("--muestra", type=int, default=TAMANO_MUESTRA,
+                        help=f"Filas muestreadas para detectar las columnas de nombres (por defecto: {TAMANO_MUESTRA}).")
+    parser.add_argument("--umbral_tasa", type=float, default=UMBRAL_TASA_ACIERTOS,
+                        help=f"Tasa mínima de aciertos en la muestra para confirmar una columna (por defecto: {UMBRAL_TASA_ACIERTOS}).")
+    parser.add_argument("--cache_esquemas",
+                        help="Archivo JSON con los esquemas detectados (por defecto: .esquemas_detectados.json en compare_dir).")
+    parser.add_argument("--sin_cache_esquemas", action="store_true",
+                        help="Detecta las columnas de nuevo sin usar ni guardar la caché de esquemas.")
+    parser.add_argument("--sin_indice", action="store_true",
+                        help="No usa ni actualiza el índice en disco del directorio de comparación.")
+    parser.add_argument("--indice_dir",
+                        help="Carpeta del índice (por defecto: .indice_comparacion dentro de compare_dir).")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Procesos que comparan archivos en paralelo (por defecto: 1).")
+    parser.add_argument("-k", "--top_k", type=entero_positivo,
+                        help="Guarda solo las k mejores coincidencias de cada nombre objetivo (por defecto: todas).")
+    parser.add_argument("--niveles", action="store_true",
+                        help="Resuelve primero por igualdad exacta, de palabras ordenadas y fonética; "
+                             "solo lo que quede sin resolver pasa al fuzzy matching.")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE,
+                        help=f"Filas de resultados que se acumulan antes de escribirlas (por defecto: {TAMANO_LOTE}). "
+                             "Con -o terminado en .csv la salida es CSV.")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir el xlsx de resultados: 'write_only' (openpyxl) o 'xlsxwriter'; "
+                             "siempre en streaming ('openpyxl' equivale a 'write_only'). También: variable MOTOR_EXCEL.")
     args = parser.parse_args()
 
     input_files = glob(os.path.join(args.input_dir, "*.xlsx")) + \
@@ -146,66 +393,90 @@ def main():
 
 
     try:
-        # Intenta leer como Excel primero
-        df_target = pd.read_excel(input_file, engine='openpyxl')
-    except (FileNotFoundError, ValueError, KeyError, TypeError) as e1:
-        try:
-            # Si falla Excel, intenta leer como CSV con UTF-8
-            df_target = pd.read_csv(input_file, sep='\t', encoding='utf-8')
-        except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e2:
-            try:
-                # Si UTF-8 falla, intenta con latin-1
-                df_target = pd.read_csv(input_file, sep='\t', encoding='latin-1')
-            except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e3:
-                print(f"Error: No se pudo leer el archivo '{input_file}' ni como Excel ni como CSV.")
-                print(f"Errores:\nExcel: {e1}\nCSV (utf-8): {e2}\nCSV (latin-1): {e3}")
-                return
-
-    all_results = []
+        # Un solo intento con el lector que corresponde al formato (xlsx, xls, parquet o texto)
+        df_target = leer_tabla(input_file)
+    except (FileNotFoundError, ValueError, KeyError, TypeError, ImportError, zipfile.BadZipFile,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+        return
 
     compare_files = glob(os.path.join(args.compare_dir, "*.xlsx")) + \
                     glob(os.path.join(args.compare_dir, "*.xls")) + \
                     glob(os.path.join(args.compare_dir, "*.csv"))
+    # Ignora archivos temporales de Excel
+    compare_files = [f for f in compare_files if not os.path.basename(f).startswith("~$")]
 
     if not compare_files:
       print(f"No se encontraron archivos en la carpeta de comparación: {args.compare_dir}")
       return
 
-
-    for compare_file in compare_files:
-        # Ignora archivos temporales de Excel
-        if os.path.basename(compare_file).startswith("~$"):
-            continue
-
-        try:
-            # Intenta leer como Excel
-            df_other = pd.read_excel(compare_file, engine='openpyxl')
-        except (FileNotFoundError, ValueError, KeyError, TypeError, zipfile.BadZipFile) as e1:  # Añade zipfile.BadZipFile
-            try:
-                # Si falla Excel, intenta CSV con UTF-8
-                df_other = pd.read_csv(compare_file, sep='\t', encoding='utf-8')
-            except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e2:
-                try:
-                    # Si falla UTF-8, intenta latin-1
-                    df_other = pd.read_csv(compare_file, sep='\t', encoding='latin-1')
-                except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e3:
-                    print(f"Error: No se pudo leer el archivo '{compare_file}' ni como Excel ni como CSV. Se omitirá.")
-                    print(f"Errores:\nExcel: {e1}\nCSV (utf-8): {e2}\nCSV (latin-1): {e3}")
-                    continue #Continua al siguiente ciclo
-
-        filename = os.path.basename(compare_file)
-        matching_cols = find_matching_columns(df_target, df_other)
-        results = extract_info(df_target, df_other, matching_cols, filename)
-        all_results.extend(results)
-
-    if all_results:
-        df_results = pd.DataFrame(all_results)
-        try:
-          df_results.to_excel(args.output_file, index=False)
-          print(f"Resultados guardados en '{args.output_file}'")
-        except Exception as e:
-          print(f"No se pudo guardar, error: {e}")
-
+    # Normaliza los nombres objetivo una vez, fuera del bucle
+    target_names = preparar_nombres_objetivo(df_target)
+    target_names_normalized = normalizar_valores(target_names)
+
+    ruta_cache = None
+    if not args.sin_cache_esquemas:
+        ruta_cache = args.cache_esquemas or os.path.join(args.compare_dir, ".esquemas_detectados.json")
+    cache_esquemas = cargar_cache_esquemas(ruta_cache)
+    indice = IndiceDirectorio(args.compare_dir, "nombres", args.indice_dir, persistente=not args.sin_indice)
+    estadisticas_normalizacion = [tomar_estadisticas()]
+
+    opciones = {
+        'input_file': input_file, 'compare_dir': args.compare_dir, 'indice_dir': args.indice_dir,
+        'usar_indice': not args.sin_indice, 'muestra': args.muestra, 'umbral_tasa': args.umbral_tasa,
+        'cache_esquemas': cache_esquemas, 'top_k': args.top_k, 'niveles': args.niveles,
+        'contexto_esquemas': contexto_esquemas(target_names_normalized, args.muestra, args.umbral_tasa),
+    }
+
+    def combinar(compare_file, resultado):
+        results, firma, matching_cols, entrada, reconstruido, estadisticas = resultado
+        estadisticas_normalizacion.append(estadisticas)
+        if matching_cols:  # Sin columnas detectadas no se guarda: la próxima vez se vuelve a detectar
+            cache_esquemas[firma] = [list(match) for match in matching_cols]
+        indice.incorporar(compare_file, entrada, reconstruido)
+        if results is None or results.empty:
+            return
+        if args.top_k:
+            resultados_top_k.append(results)
+        else:
+            escritor.agregar_df(results)  # Sin top_k cada archivo va al disco en cuanto termina
+
+    columnas = COLUMNAS_RESULTADO + ['Nivel_Coincidencia'] if args.niveles else COLUMNAS_RESULTADO
+    escritor = EscritorResultados(args.output_file, columnas, args.lote, motor=args.excel_writer)
+    resultados_top_k = []
+
+    with escritor:
+        if args.workers > 1:
+            # Los nombres objetivo se envían una sola vez a cada proceso (initializer)
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_inicializar_trabajador,
+                                     initargs=(target_names, target_names_normalized, opciones)) as executor:
+                # map devuelve en el orden de compare_files: la salida es igual a la secuencial
+                for compare_file, resultado in zip(compare_files, executor.map(comparar_archivo, compare_files)):
+                    combinar(compare_file, resultado)
+        else:
+            _inicializar_trabajador(target_names, target_names_normalized, opciones)
+            for compare_file in compare_files:
+                combinar(compare_file, comparar_archivo(compare_file))
+
+        if resultados_top_k:
+            # Cada archivo aporta como mucho k por nombre: se quedan los k mejores en total
+            # (a igual score, el archivo que aparece antes)
+            df_results = pd.concat(resultados_top_k)
+            df_results['_orden'] = range(len(df_results))
+            df_results['_objetivo'] = df_results.index
+            df_results = df_results.sort_values(['_objetivo', 'Score_Coincidencia', '_orden'],
+                                                ascending=[True, False, True], kind='stable')
+            escritor.agregar_df(df_results.groupby('_objetivo', sort=False).head(args.top_k))
+
+    guardar_cache_esquemas(ruta_cache, cache_esquemas)
+    indice.guardar()
+    if not args.sin_indice:
+        print(indice.resumen())
+    print(resumen_estadisticas(sumar_estadisticas(*estadisticas_normalizacion)))
+
+    if escritor.filas_escritas:
+        print(f"Resultados guardados en '{args.output_file}' ({escritor.filas_escritas} filas)")
     else:
         print("No se encontraron coincidencias.")
 
@@ -1,27 +1,34 @@
+import argparse
 import os
+import sys
 import pandas as pd
 import math
 
-def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabezado=0):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Raíz del repo, para importar utilidades
+from utilidades.escritura import MOTORES_EXCEL, guardar_excel
+from utilidades.lectura import detectar_formato, leer_tabla
+
+EXTENSIONES_SOPORTADAS = ['.csv', '.xls', '.xlsx', '.parquet']
+
+def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabezado=0, motor_excel=None):
     """
     Divide un archivo CSV, Excel (xls, xlsx) o Parquet en múltiples archivos Excel,
-    preservando el encabezado en cada parte.
+    preservando el encabezado en cada parte. `motor_excel` elige cómo se escriben
+    las partes (ver utilidades.escritura.MOTORES_EXCEL).
     """
     try:
         nombre_base = os.path.splitext(os.path.basename(ruta_entrada))[0]
         extension = os.path.splitext(ruta_entrada)[1].lower()
+        if extension not in EXTENSIONES_SOPORTADAS:
+            print(f"Error: Tipo de archivo no soportado ({extension}).")
+            return
 
-        if extension == '.csv':
-            try:
-                df = pd.read_csv(ruta_entrada, encoding='utf-8', header=fila_encabezado)
-                encabezado = df.columns  # Guarda el encabezado
-            except UnicodeDecodeError:
-                try:
-                    df = pd.read_csv(ruta_entrada, encoding='latin-1', header=fila_encabezado)
-                    encabezado = df.columns
-                except UnicodeDecodeError:
-                    df = pd.read_csv(ruta_entrada, encoding='cp1252', header=fila_encabezado)
-                    encabezado = df.columns
+        # El lector se elige por el contenido (un .xls que en realidad es xlsx también sirve)
+        formato = detectar_formato(ruta_entrada)
+
+        if formato == 'texto':
+            df = leer_tabla(ruta_entrada, sep=',', header=fila_encabezado)
+            encabezado = df.columns  # Guarda el encabezado
 
             for i in range(0, len(df), filas_por_parte):
                 chunk = df[i:i + filas_por_parte]
@@ -29,10 +36,10 @@ def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabe
                 chunk = pd.concat([pd.DataFrame(columns=encabezado), chunk], ignore_index=False)
                 nombre_archivo_salida = f"{nombre_base}_parte_{i // filas_por_parte + 1}.xlsx"
                 ruta_completa_salida = os.path.join(ruta_salida, nombre_archivo_salida)
-                chunk.to_excel(ruta_completa_salida, index=False, engine='openpyxl')
+                guardar_excel(chunk, ruta_completa_salida, motor_excel)
                 print(f"Guardado: {nombre_archivo_salida}")
 
-        elif extension in ['.xls', '.xlsx']:
+        elif formato in ['xls', 'xlsx']:
             xls = pd.ExcelFile(ruta_entrada)
             for sheet_name in xls.sheet_names:
                 df = pd.read_excel(xls, sheet_name=sheet_name, header=fila_encabezado)
@@ -44,12 +51,12 @@ def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabe
                     chunk = pd.concat([pd.DataFrame(columns=encabezado), chunk], ignore_index=False)
                     nombre_archivo_salida = f"{nombre_base}_{sheet_name}_parte_{i // filas_por_parte + 1}.xlsx"
                     ruta_completa_salida = os.path.join(ruta_salida, nombre_archivo_salida)
-                    chunk.to_excel(ruta_completa_salida, index=False, sheet_name="Sheet1", engine='openpyxl')
+                    guardar_excel(chunk, ruta_completa_salida, motor_excel, hoja="Sheet1")
                     print(f"Guardado: {nombre_archivo_salida}")
             xls.close()
 
 
-        elif extension == '.parquet':
+        elif formato == 'parquet':
             df = pd.read_parquet(ruta_entrada, engine='pyarrow')
             if fila_encabezado != 0:
               header_rows = pd.read_parquet(ruta_entrada, engine='pyarrow').head(fila_encabezado)
@@ -66,12 +73,9 @@ def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabe
                 chunk = pd.concat([pd.DataFrame(columns=encabezado), chunk], ignore_index=False)
                 nombre_archivo_salida = f"{nombre_base}_parte_{i // filas_por_parte + 1}.xlsx"
                 ruta_completa_salida = os.path.join(ruta_salida, nombre_archivo_salida)
-                chunk.to_excel(ruta_completa_salida, index=False, engine='openpyxl')
+                guardar_excel(chunk, ruta_completa_salida, motor_excel)
                 print(f"Guardado: {nombre_archivo_salida}")
 
-        else:
-            print(f"Error: Tipo de archivo no soportado ({extension}).")
-
 
     except FileNotFoundError:
         print(f"Error: Archivo no encontrado: {ruta_entrada}")
@@ -81,7 +85,7 @@ def dividir_archivo(ruta_entrada, ruta_salida, filas_por_parte=5000, fila_encabe
         print(f"Error inesperado: {e}")
 
 
-def procesar_carpeta_input(carpeta_input="input", carpeta_output="output", fila_encabezado=0):
+def procesar_carpeta_input(carpeta_input="input", carpeta_output="output", fila_encabezado=0, motor_excel=None):
 
     if not os.path.exists(carpeta_output):
         os.makedirs(carpeta_output)
@@ -96,7 +100,8 @@ def procesar_carpeta_input(carpeta_input="input", carpeta_output="output", fila_
 
         if os.path.isfile(ruta_completa_entrada):
             print(f"Procesando: {nombre_archivo}")
-            dividir_archivo(ruta_completa_entrada, carpeta_output, fila_encabezado=fila_encabezado)
+            dividir_archivo(ruta_completa_entrada, carpeta_output, fila_encabezado=fila_encabezado,
+                            motor_excel=motor_excel)
 
     archivos_salida = [f for f in os.listdir(carpeta_output) if os.path.isfile(os.path.join(carpeta_output, f))]
     num_archivos = len(archivos_salida)
@@ -120,5 +125,10 @@ def procesar_carpeta_input(carpeta_input="input", carpeta_output="output", fila_
             os.rename(origen, destino)
 
 if __name__ == "__main__":
-    procesar_carpeta_input(fila_encabezado=0)  # Ajusta si es necesario
+    parser = argparse.ArgumentParser(description="Divide los archivos de 'input' en partes de 5000 filas.")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir xlsx: 'openpyxl' (por defecto), 'write_only' o 'xlsxwriter' "
+                             "(estos dos en streaming, con memoria constante). También: variable MOTOR_EXCEL.")
+    args = parser.parse_args()
+    procesar_carpeta_input(fila_encabezado=0, motor_excel=args.excel_writer)  # Ajusta si es necesario
     print("Proceso completado.")
\ No newline at end of file
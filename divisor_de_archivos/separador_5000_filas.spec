@@ -1,9 +1,12 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
+# El script importa `utilidades` desde la raíz del repo (carpeta padre de esta): PyInstaller la necesita en pathex
+RAIZ_REPO = os.path.dirname(os.path.abspath(SPECPATH))
 
 a = Analysis(
     ['separador_5000_filas.py'],
-    pathex=[],
+    pathex=[RAIZ_REPO],
     binaries=[],
     datas=[],
     hiddenimports=[],
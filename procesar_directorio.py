@@ -3,149 +3,214 @@ import re
 import os
 import argparse
 from glob import glob
+from functools import partial
 import csv  # Importante: Importar el módulo csv
 
+from utilidades.escritura import MOTORES_EXCEL, EscritoresPorArchivo, guardar_excel
+from utilidades.columnas import hojas_a_procesar, proyectar
+from utilidades.lectura import LECTORES_CSV, columnas_tabla, detectar_formato, leer_tabla, leer_texto_por_lotes
+from utilidades.nombres import dividir_nombres
+from utilidades.paralelo import procesar_archivos
+from utilidades.roles import expandir_roles
+from utilidades.telefonos import FORMATOS_TELEFONO, ReporteTelefonos, formato_telefono, limpiar_columna, ruta_reporte
 
-def split_name(full_name):
-    """Divide un nombre completo en nombre y apellido."""
-    if not isinstance(full_name, str):
-        return "", ""
+COLUMN_ORDER = [
+    'Firstname', 'Lastname', 'Email', 'Contact phonenumber', 'Position',
+    'Company', 'Vat', 'Phonenumber', 'Country', 'City', 'Zip', 'State',
+    'Address', 'Website', 'Billing street', 'Billing city', 'Billing state',
+    'Billing zip', 'Billing country', 'Shipping street', 'Shipping city',
+    'Shipping state', 'Shipping zip', 'Shipping country', 'Longitude',
+    'Latitude', 'Stripe id'
+]
 
-    parts = full_name.split()
-    if len(parts) == 0:
-        return "", ""
-    elif len(parts) == 1:
-        return parts[0], ""
-    elif len(parts) == 2:
-        return parts[0], parts[1]
+# Columnas de la plantilla que tienen el mismo valor en todos los contactos
+VALORES_FIJOS = {
+    'Vat': '', 'Phonenumber': '', 'Country': 'Panama', 'City': 'SAN FELIPE', 'Zip': '', 'State': '',
+    'Address': '', 'Website': '', 'Billing street': '', 'Billing city': 'Panama',
+    'Billing state': 'SAN FELIPE', 'Billing zip': '', 'Billing country': 'Panama',
+    'Shipping street': '', 'Shipping city': '', 'Shipping state': '', 'Shipping zip': '',
+    'Shipping country': '', 'Longitude': '', 'Latitude': '', 'Stripe id': '',
+}
+
+DEFAULT_ROLES_MAPPING = {
+    'Representante Principal': ['Representante Principal', 'Email'],
+    'Representante Suplente': ['Representante Suplente', 'Email.1'],
+    'Asistente de Gerencia': ['Asistente de Gerencia', 'Email.2'],
+    'Gerente General': ['Gerente General', 'Email.3'],
+    'Recursos Humanos': ['Recursos Humanos', 'Email.4'],
+    'Mercadeo': ['Mercadeo', 'Email.5'],
+    'Ventas': ['Ventas', 'Email.6'],
+}
+
+
+def transformar_grupo(group_df, roles_mapping):
+    """Contactos de un grupo, como DataFrame con las columnas de COLUMN_ORDER (vacío si no hay)."""
+    # Un contacto por cada par (nombre, email) con datos, en el orden de siempre: por fila y rol
+    contactos = expandir_roles(group_df, roles_mapping)
+    if contactos.empty:
+        return pd.DataFrame()
+    filas = contactos['fila'].to_numpy()
+    firstnames, lastnames = dividir_nombres(contactos['Nombre'])
+
+    columnas = dict(VALORES_FIJOS)
+    columnas.update({
+        'Firstname': firstnames.tolist(), 'Lastname': lastnames.tolist(), 'Email': contactos['Email'].tolist(),
+        # 'Telefonos' ya pasó por la etapa de teléfonos (ver `procesar_hoja`)
+        'Contact phonenumber': group_df['Telefonos'].to_numpy(dtype=object)[filas].tolist(),
+        'Position': contactos['Position'].tolist(),
+        'Company': group_df['Nombre_empresa'].to_numpy(dtype=object)[filas].tolist(),
+    })
+    return pd.DataFrame(columnas, columns=COLUMN_ORDER)
+
+
+def ruta_grupo(group_name, output_dir, output_format, sufijo=""):
+    """Ruta del archivo de salida de un grupo (nombre del grupo sin caracteres inválidos, más `sufijo`)."""
+    try:
+        output_filename = re.sub(r'[\\/*?:"<>|]', "", str(group_name))
+        output_filename = output_filename.strip()
+    except TypeError:
+        output_filename = "grupo_invalido"
+    extension = "csv" if output_format == "csv" else "xlsx"
+    return os.path.join(output_dir, f"{output_filename}{sufijo}.{extension}")
+
+
+def guardar_grupo(output_df, group_name, output_filepath, output_format, excel_writer=None):
+    """Escribe de una vez el archivo de un grupo."""
+    if output_format == "csv":
+        try:
+            # --- CAMBIO IMPORTANTE AQUÍ: Usar csv.writer ---
+            with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
+                writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(output_df.columns)  # Escribe los encabezados
+                for row in output_df.values:
+                    writer.writerow(row)  # Escribe cada fila
+            # ------------------------------------------------
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+
+        except Exception as e:
+            print(f"Error al guardar '{output_filepath}': {e}")
     else:
-        firstname = []
-        lastname = []
-        compound_names = ["María", "Ana", "Juan", "Luis", "José", "Carlos",
-                        "San", "Santa", "De", "Del", "La", "El", "Los"]
+        try:
+            guardar_excel(output_df, output_filepath, excel_writer)
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+        except Exception as e:
+            print(f"Error al guardar '{output_filepath}': {e}")
+
+
+def procesar_por_lotes(lotes, input_file, output_dir, output_format, group_by_col, roles_mapping,
+                       excel_writer=None, sufijo="", phone_format=None, hoja=0):
+    """
+    Transforma el archivo lote a lote y añade las filas de cada grupo a su
+    archivo, que queda abierto hasta el último lote: nunca hay más de un lote
+    en memoria.
+    """
+    # Sin conversión en CSV: mismo texto que el csv.writer de guardar_grupo
+    escritores = EscritoresPorArchivo(COLUMN_ORDER, formato=output_format,
+                                      convertir_csv=lambda valor: valor, motor=excel_writer)
+    grupos = {}  # Nombre de grupo -> ruta de salida
+    reporte = ReporteTelefonos(ruta_reporte(output_dir, input_file, sufijo), input_file)
+    try:
+        for lote in lotes:
+            lote = limpiar_columna(lote, 'Telefonos', phone_format, reporte, hoja)
+            for group_name, group_df in lote.groupby(group_by_col):
+                output_filepath = grupos.setdefault(group_name,
+                                                    ruta_grupo(group_name, output_dir, output_format, sufijo))
+                output_df = transformar_grupo(group_df, roles_mapping)
+                if not output_df.empty:
+                    escritores.agregar_df(output_filepath, output_df)
+    except (KeyError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+
+    try:
+        filas_escritas = escritores.cerrar()
+        reporte.cerrar()
+    except Exception as e:
+        print(f"Error al guardar los archivos de '{input_file}': {e}")
+        return
 
-        i = 0
-        while i < len(parts):
-            if i < len(parts) - 1 and parts[i] in compound_names:
-                firstname.append(parts[i] + " " + parts[i + 1])
-                i += 2
-            else:
-                firstname.append(parts[i])
-                i += 1
+    for group_name, output_filepath in grupos.items():
+        if filas_escritas.get(output_filepath):
+            print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
+        else:
+            print(f"No hay datos para el grupo '{group_name}' en '{input_file}', no se genera archivo.")
 
-        if len(firstname) >= 3:
-            mid = len(firstname) // 2
-            lastname = firstname[mid:]
-            firstname = firstname[:mid]
 
-        return " ".join(firstname), " ".join(lastname)
+def hojas_del_archivo(input_file, group_by_col='GRUPO / TALLER', roles_mapping=None):
+    """Hojas de `input_file` que se procesan (ver `hojas_a_procesar`), leyendo solo los encabezados."""
+    return hojas_a_procesar(input_file, roles_mapping or DEFAULT_ROLES_MAPPING,
+                            obligatorias=['Nombre_empresa', 'Telefonos', group_by_col])
 
 
 def process_and_split_excel(input_file, output_dir, output_format="excel",
-                            group_by_col='GRUPO / TALLER', roles_mapping=None):
+                            group_by_col='GRUPO / TALLER', roles_mapping=None, max_memory_mb=None,
+                            excel_writer=None, hoja=None, csv_reader=None, phone_format=None):
     """
     Procesa archivos, transforma datos y divide en archivos por grupo.
+    Cada hoja del libro cuyo encabezado coincide con el mapeo se procesa por
+    separado (un CSV es una sola hoja); si son varias, los archivos de cada
+    hoja llevan su nombre: 'Grupo (Hoja).xlsx'. Con `hoja`, solo esa.
+    Con `max_memory_mb`, los CSV se leen y transforman por lotes que caben en esa memoria.
+    `phone_format` elige cómo se escriben los teléfonos (ver `utilidades.telefonos`).
     """
 
+    if roles_mapping is None:
+        roles_mapping = DEFAULT_ROLES_MAPPING
+
+    if hoja is not None:
+        procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb,
+                      excel_writer, hoja, sufijo=f" ({hoja})", csv_reader=csv_reader, phone_format=phone_format)
+        return
+
     try:
-        # Intenta leer como Excel primero
-        df = pd.read_excel(input_file, engine='openpyxl')
-    except (FileNotFoundError, ValueError, KeyError, TypeError) as e1:
-        try:
-            # Si falla Excel, intenta leer como CSV con UTF-8 y delimitador \t
-            df = pd.read_csv(input_file, sep='\t', encoding='utf-8')
-        except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e2:
-            try:
-                # Si UTF-8 falla, intenta con latin-1 y delimitador \t
-                df = pd.read_csv(input_file, sep='\t', encoding='latin-1')
-            except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e3:
-                print(f"Error: No se pudo leer el archivo '{input_file}' ni como Excel ni como CSV.")
-                print(f"Errores:\nExcel: {e1}\nCSV (utf-8): {e2}\nCSV (latin-1): {e3}")
-                return
+        hojas = hojas_del_archivo(input_file, group_by_col, roles_mapping)
+    except (OSError, ValueError, KeyError, TypeError, ImportError,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+        return
+
+    for hoja, encabezado in hojas:
+        procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb,
+                      excel_writer, hoja, sufijo=f" ({hoja})" if len(hojas) > 1 else "", encabezado=encabezado,
+                      csv_reader=csv_reader, phone_format=phone_format)
 
-    if roles_mapping is None:
-        roles_mapping = {
-            'Representante Principal': ['Representante Principal', 'Email'],
-            'Representante Suplente': ['Representante Suplente', 'Email.1'],
-            'Asistente de Gerencia': ['Asistente de Gerencia', 'Email.2'],
-            'Gerente General': ['Gerente General', 'Email.3'],
-            'Recursos Humanos': ['Recursos Humanos', 'Email.4'],
-            'Mercadeo': ['Mercadeo', 'Email.5'],
-            'Ventas': ['Ventas', 'Email.6'],
-        }
 
+def procesar_hoja(input_file, output_dir, output_format, group_by_col, roles_mapping, max_memory_mb=None,
+                  excel_writer=None, hoja=0, sufijo="", encabezado=None, csv_reader=None, phone_format=None):
+    """Lee una hoja (solo las columnas que usa la transformación) y la divide en archivos por grupo."""
+    lotes = None
+    try:
+        if encabezado is None:
+            encabezado = columnas_tabla(input_file, sheet_name=hoja)
+        # Solo se leen las columnas que usa la transformación; las que faltan se avisan aquí una vez
+        columnas, roles_mapping = proyectar(encabezado, input_file, roles_mapping,
+                                            obligatorias=['Nombre_empresa', 'Telefonos', group_by_col])
+        if max_memory_mb and detectar_formato(input_file) == 'texto':
+            lotes = leer_texto_por_lotes(input_file, max_memory_mb, usecols=columnas)
+        else:
+            # Un solo intento con el lector que corresponde al formato (xlsx, xls, parquet o texto)
+            df = leer_tabla(input_file, sheet_name=hoja, usecols=columnas, lector=csv_reader)
+    except (OSError, ValueError, KeyError, TypeError, ImportError,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+        return
+
+    if lotes is not None:
+        procesar_por_lotes(lotes, input_file, output_dir, output_format, group_by_col, roles_mapping,
+                           excel_writer, sufijo, phone_format, hoja)
+        return
+
+    with ReporteTelefonos(ruta_reporte(output_dir, input_file, sufijo), input_file) as reporte:
+        df = limpiar_columna(df, 'Telefonos', phone_format, reporte, hoja)
     grouped = df.groupby(group_by_col)
 
     for group_name, group_df in grouped:
-        data = []
-        for index, row in group_df.iterrows():
-            company = row['Nombre_empresa']
-            phone_number = str(row['Telefonos']) if pd.notna(row['Telefonos']) else ''
-            phone_number = re.sub(r'\D', '', phone_number)
-
-            for position, cols in roles_mapping.items():
-                name_col, email_col = cols
-                try:
-                    full_name = str(row[name_col]) if pd.notna(row[name_col]) else ''
-                    email = row[email_col] if pd.notna(row[email_col]) else ''
-                except KeyError as e:
-                    print(f"Advertencia: Columna '{e}' no encontrada en '{input_file}'. Omitiendo.")
-                    continue
-
-                if email and full_name:
-                    firstname, lastname = split_name(full_name)
-                    person_data = {
-                        'Firstname': firstname, 'Lastname': lastname, 'Email': email,
-                        'Contact phonenumber': phone_number, 'Position': position,
-                        'Company': company, 'Vat': '', 'Phonenumber': '', 'Country': 'Panama',
-                        'City': 'SAN FELIPE', 'Zip': '', 'State': '', 'Address': '',
-                        'Website': '', 'Billing street': '', 'Billing city': 'Panama',
-                        'Billing state': 'SAN FELIPE', 'Billing zip': '', 'Billing country': 'Panama',
-                        'Shipping street': '', 'Shipping city': '', 'Shipping state': '',
-                        'Shipping zip': '', 'Shipping country': '', 'Longitude': '', 'Latitude': '',
-                        'Stripe id': ''
-                    }
-                    data.append(person_data)
-
-        output_df = pd.DataFrame(data)
+        output_df = transformar_grupo(group_df, roles_mapping)
         if not output_df.empty:
-            column_order = [
-                'Firstname', 'Lastname', 'Email', 'Contact phonenumber', 'Position',
-                'Company', 'Vat', 'Phonenumber', 'Country', 'City', 'Zip', 'State',
-                'Address', 'Website', 'Billing street', 'Billing city', 'Billing state',
-                'Billing zip', 'Billing country', 'Shipping street', 'Shipping city',
-                'Shipping state', 'Shipping zip', 'Shipping country', 'Longitude',
-                'Latitude', 'Stripe id'
-            ]
-            output_df = output_df[column_order]
-
-            try:
-                output_filename = re.sub(r'[\\/*?:"<>|]', "", str(group_name))
-                output_filename = output_filename.strip()
-            except TypeError:
-                output_filename = "grupo_invalido"
-
-            if output_format == "csv":
-                output_filepath = os.path.join(output_dir, f"{output_filename}.csv")
-                try:
-                    # --- CAMBIO IMPORTANTE AQUÍ: Usar csv.writer ---
-                    with open(output_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                        writer = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                        writer.writerow(output_df.columns)  # Escribe los encabezados
-                        for row in output_df.values:
-                            writer.writerow(row)  # Escribe cada fila
-                    # ------------------------------------------------
-                    print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
-
-                except Exception as e:
-                    print(f"Error al guardar '{output_filepath}': {e}")
-            else:
-                output_filepath = os.path.join(output_dir, f"{output_filename}.xlsx")
-                try:
-                    output_df.to_excel(output_filepath, index=False, engine='openpyxl')
-                    print(f"Datos de '{group_name}' guardados en '{output_filepath}'")
-                except Exception as e:
-                    print(f"Error al guardar '{output_filepath}': {e}")
+            guardar_grupo(output_df, group_name, ruta_grupo(group_name, output_dir, output_format, sufijo),
+                          output_format, excel_writer)
         else:
             print(f"No hay datos para el grupo '{group_name}' en '{input_file}', no se genera archivo.")
 
@@ -159,12 +224,34 @@ def main():
                         help="Directorio de salida (si no, usa el de entrada).")
     parser.add_argument("-f", "--format", choices=["excel", "csv"], default="excel",
                         help="Formato de salida ('excel' o 'csv', por defecto: 'excel').")
+    parser.add_argument("--excel_writer", choices=MOTORES_EXCEL,
+                        help="Motor para escribir xlsx: 'openpyxl' (por defecto), 'write_only' o 'xlsxwriter' "
+                             "(estos dos en streaming, con memoria constante). También: variable MOTOR_EXCEL.")
+    parser.add_argument("--csv_reader", choices=LECTORES_CSV,
+                        help="Lector de CSV/TSV: 'pandas' (por defecto) o 'arrow' (pyarrow: varios hilos y archivo "
+                             "mapeado en memoria; mismo resultado). También: variable LECTOR_CSV.")
+    parser.add_argument("--phone_format", choices=FORMATOS_TELEFONO,
+                        help="Teléfonos: 'digitos' (por defecto: solo los dígitos) o 'e164' (números de Panamá "
+                             "validados y escritos como +507...; los inválidos no se suben y van a "
+                             "'telefonos_invalidos_<archivo>.csv'). También: variable FORMATO_TELEFONO.")
     parser.add_argument("-g", "--group_by", default="GRUPO / TALLER",
                         help="Columna para agrupar (por defecto: 'GRUPO / TALLER').")
     parser.add_argument("-m", "--mapping",
                         help="Ruta a un archivo de mapeo de columnas (opcional).")
+    parser.add_argument("--max_memory", type=float,
+                        help="Memoria máxima en MB: los CSV se procesan por lotes que caben en ella (opcional).")
+
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Procesa los archivos en N procesos en paralelo y muestra el tiempo de cada uno. "
+                             "Si dos archivos generan el mismo grupo, el segundo se guarda como "
+                             "'Grupo (archivo)' en vez de sobrescribir el primero"
+                             " (con --max_memory, el límite es por proceso).")
 
     args = parser.parse_args()
+    try:
+        phone_format = formato_telefono(args.phone_format)
+    except ValueError as e:
+        parser.error(str(e))
 
     output_dir = args.output_dir if args.output_dir else args.input_dir
 
@@ -193,9 +280,20 @@ def main():
         print(f"No se encontraron archivos Excel/CSV en: {args.input_dir}")
         return
 
+    if args.jobs:
+        procesar_archivos(input_files, output_dir,
+                          partial(process_and_split_excel, output_format=args.format, group_by_col=args.group_by,
+                                  roles_mapping=roles_mapping, max_memory_mb=args.max_memory,
+                                  excel_writer=args.excel_writer, csv_reader=args.csv_reader,
+                                  phone_format=phone_format),
+                          args.jobs, hojas_de=partial(hojas_del_archivo, group_by_col=args.group_by,
+                                                      roles_mapping=roles_mapping))
+        return
+
     for input_file in input_files:
         print(f"Procesando archivo: {input_file}")
-        process_and_split_excel(input_file, output_dir, args.format, args.group_by, roles_mapping)
+        process_and_split_excel(input_file, output_dir, args.format, args.group_by, roles_mapping, args.max_memory,
+                                args.excel_writer, csv_reader=args.csv_reader, phone_format=phone_format)
 
 
 if __name__ == "__main__":
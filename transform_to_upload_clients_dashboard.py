@@ -2,60 +2,21 @@ import pandas as pd
 import re
 import os  # Importamos el módulo os
 
-
-def split_name(full_name):
-    """Divide un nombre completo en nombre y apellido."""
-    if not full_name:
-        return "", ""
-
-    parts = full_name.split()
-    if len(parts) == 0:
-        return "", ""
-    elif len(parts) == 1:
-        return parts[0], ""
-    elif len(parts) == 2:
-        return parts[0], parts[1]
-    else:
-        firstname = []
-        lastname = []
-        compound_names = ["María", "Ana", "Juan", "Luis", "José", "Carlos",
-                        "San", "Santa", "De", "Del", "La", "El", "Los"]
-
-        i = 0
-        while i < len(parts):
-            if i < len(parts) - 1 and parts[i] in compound_names:
-                firstname.append(parts[i] + " " + parts[i + 1])
-                i += 2
-            else:
-                firstname.append(parts[i])
-                i += 1
-
-        if len(firstname) >= 3:
-            mid = len(firstname) // 2
-            lastname = firstname[mid:]
-            firstname = firstname[:mid]
-
-        return " ".join(firstname), " ".join(lastname)
+from utilidades.lectura import leer_tabla
+from utilidades.nombres import split_name
 
 
 def process_and_split_excel(input_file, output_dir="output"):
     """Procesa el Excel, transforma los datos y los divide en archivos."""
 
     try:
-        # Intenta leer como CSV
-        df = pd.read_csv(input_file, sep='\t', encoding='latin-1')
-    except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e1:
-        try:
-            # Si falla, intenta leer como Excel
-            df = pd.read_excel(input_file, engine='openpyxl')
-        except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e2:
-            try:
-                # Si falla, intenta leer como CSV con utf-8
-                df = pd.read_csv(input_file, sep='\t', encoding='utf-8')
-            except (FileNotFoundError, pd.errors.ParserError, UnicodeDecodeError) as e3:
-                print(f"Error: No se pudo leer el archivo ni como CSV ni como Excel.")
-                print(f"Errores originales:\nCSV (latin-1): {e1}\nExcel (utf-8): {e2}\nCSV (utf-8): {e3}")
-                return
+        # Un solo intento con el lector que corresponde al formato (xlsx, xls, parquet o texto)
+        df = leer_tabla(input_file)
+    except (OSError, ValueError, KeyError, TypeError, ImportError,
+            pd.errors.ParserError, UnicodeDecodeError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}'.")
+        print(f"Error: {e}")
+        return
 
     # Crea el directorio de salida si no existe
     if not os.path.exists(output_dir):
@@ -0,0 +1,250 @@
+"""
+Caché en disco de tablas ya leídas (xlsx, xls, CSV...), compartida por todos los scripts.
+
+Cada entrada se guarda como Parquet bajo una clave formada por el hash del
+contenido del archivo y las opciones de lectura: si el mismo archivo se vuelve
+a leer con las mismas opciones (desde cualquier script), se carga la copia en
+lugar de volver a parsear el Excel. El tamaño total se limita expulsando las
+entradas usadas hace más tiempo (LRU por fecha de último uso).
+
+Uso desde la línea de comandos:
+    python -m utilidades.cache_tablas            # lista las entradas
+    python -m utilidades.cache_tablas --limpiar  # borra la caché
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+
+import pandas as pd
+
+from utilidades.indice_directorio import hash_contenido
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+METADATO_COLUMNAS_PICKLE = b'columnas_pickle'
+
+VERSION_CACHE = 1
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache_tablas")
+MAX_MB_POR_DEFECTO = 2048
+EXTENSIONES = (".parquet", ".pkl")
+
+
+def clave_opciones(opciones):
+    """Hash estable de las opciones de lectura (las que cambian el DataFrame resultante)."""
+    texto = json.dumps({'version': VERSION_CACHE, **opciones}, sort_keys=True, default=repr)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:16]
+
+
+def _es_columna_mixta(serie):
+    """Columna object con valores que no son texto (p. ej. teléfonos leídos como int y como str)."""
+    if serie.dtype != object:
+        return False
+    return any(not isinstance(valor, str) for valor in serie.dropna())
+
+
+def a_parquet(df, ruta):
+    """
+    Escribe `df` en Parquet. Las columnas con tipos mezclados, que Parquet no
+    admite, se guardan celda a celda serializadas con pickle (columna binaria)
+    y se anotan en los metadatos para restaurarlas al leer.
+    """
+    mixtas = [col for col in df.columns if _es_columna_mixta(df[col])]
+    copia = df.copy(deep=False)
+    for col in mixtas:
+        copia[col] = [pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL) for valor in df[col]]
+    tabla = pa.Table.from_pandas(copia)
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[METADATO_COLUMNAS_PICKLE] = json.dumps(mixtas).encode('utf-8')
+    pq.write_table(tabla.replace_schema_metadata(metadatos), ruta)
+
+
+def de_parquet(ruta):
+    """Lee un Parquet escrito con `a_parquet`, restaurando las columnas mezcladas."""
+    tabla = pq.read_table(ruta)
+    mixtas = json.loads((tabla.schema.metadata or {}).get(METADATO_COLUMNAS_PICKLE, b'[]'))
+    df = tabla.to_pandas()
+    for col in mixtas:
+        df[col] = pd.Series([pickle.loads(valor) for valor in df[col]], index=df.index, dtype=object)
+    return df
+
+
+class CacheTablas:
+    """
+    Caché de DataFrames en `directorio`, con un límite de `max_mb` megabytes.
+    Se guardan en Parquet (ver `a_parquet`); si aun así la copia no se lee
+    idéntica (p. ej. nombres de columna no textuales), se guarda con pickle
+    para no alterar los datos.
+    """
+
+    def __init__(self, directorio=None, max_mb=MAX_MB_POR_DEFECTO):
+        self.directorio = directorio or os.environ.get("CACHE_TABLAS_DIR") or DIRECTORIO_POR_DEFECTO
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _ruta_base(self, ruta, opciones):
+        return os.path.join(self.directorio, f"{hash_contenido(ruta)}_{clave_opciones(opciones)}")
+
+    def leer(self, ruta, opciones, leer):
+        """
+        Devuelve el DataFrame de `ruta` leído con `opciones`: de la caché si ya
+        está; si no, llama a `leer()` y guarda el resultado.
+        """
+        base = self._ruta_base(ruta, opciones)
+        for extension in EXTENSIONES:
+            df = self._cargar(base + extension)
+            if df is not None:
+                self.aciertos += 1
+                return df
+
+        self.fallos += 1
+        df = leer()
+        if isinstance(df, pd.DataFrame):
+            self._guardar(base, df)
+        return df
+
+    def _cargar(self, ruta_entrada):
+        if not os.path.exists(ruta_entrada):
+            return None
+        try:
+            if ruta_entrada.endswith(".parquet"):
+                df = de_parquet(ruta_entrada)
+            else:
+                with open(ruta_entrada, 'rb') as f:
+                    df = pickle.load(f)
+            os.utime(ruta_entrada)  # Marca el último uso (orden de expulsión LRU)
+            return df
+        except Exception as e:
+            print(f"Advertencia: Entrada de caché ilegible ('{ruta_entrada}'), se vuelve a leer el archivo: {e}")
+            return None
+
+    def _guardar(self, base, df):
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = f"{base}.{os.getpid()}.tmp"
+        try:
+            destino = base + ".parquet"
+            try:
+                if pa is None:
+                    raise ImportError("pyarrow no está instalado")
+                a_parquet(df, temporal)
+                # Solo vale si la copia se lee idéntica (tipos incluidos)
+                if not de_parquet(temporal).equals(df):
+                    raise ValueError("la copia en Parquet no es idéntica")
+            except Exception:
+                destino = base + ".pkl"
+                with open(temporal, 'wb') as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, destino)  # Escritura atómica: otro proceso nunca ve un archivo a medias
+        except OSError as e:
+            print(f"Advertencia: No se pudo guardar en la caché de tablas: {e}")
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return
+        self.expulsar()
+
+    def entradas(self):
+        """Lista de (ruta, tamaño en bytes, último uso) de las entradas, de la más antigua a la más reciente."""
+        if not os.path.isdir(self.directorio):
+            return []
+        lista = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(EXTENSIONES):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                estado = os.stat(ruta)
+            except FileNotFoundError:
+                continue  # Otro proceso la expulsó
+            lista.append((ruta, estado.st_size, estado.st_mtime))
+        return sorted(lista, key=lambda entrada: entrada[2])
+
+    def expulsar(self):
+        """Borra las entradas usadas hace más tiempo hasta quedar dentro del límite."""
+        lista = self.entradas()
+        total = sum(tamano for _, tamano, _ in lista)
+        for ruta, tamano, _ in lista:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+
+    def limpiar(self):
+        """Borra todas las entradas. Devuelve cuántas se borraron."""
+        borradas = 0
+        for ruta, _, _ in self.entradas():
+            try:
+                os.remove(ruta)
+                borradas += 1
+            except FileNotFoundError:
+                pass
+        return borradas
+
+    def resumen(self):
+        return f"Caché de tablas: {self.aciertos} aciertos, {self.fallos} lecturas nuevas ('{self.directorio}')"
+
+
+_CACHE_PROCESO = {}
+
+
+def cache_por_defecto():
+    """
+    La caché compartida (una por proceso), o None si se desactivó con la
+    variable de entorno SIN_CACHE_TABLAS. CACHE_TABLAS_DIR y CACHE_TABLAS_MAX_MB
+    cambian la carpeta y el límite.
+    """
+    if os.environ.get("SIN_CACHE_TABLAS"):
+        return None
+    if 'cache' not in _CACHE_PROCESO:
+        _CACHE_PROCESO['cache'] = CacheTablas(max_mb=float(os.environ.get("CACHE_TABLAS_MAX_MB", MAX_MB_POR_DEFECTO)))
+    return _CACHE_PROCESO['cache']
+
+
+def leer_con_cache(ruta, opciones, leer, cache=None):
+    """
+    Lee `ruta` a través de la caché (la compartida si `cache` es None; sin
+    caché si es False). `opciones` identifica cómo se lee: forma parte de la clave.
+    """
+    if cache is None:
+        cache = cache_por_defecto()
+    if not cache:
+        return leer()
+    return cache.leer(ruta, opciones, leer)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspecciona o limpia la caché de tablas leídas.")
+    parser.add_argument("--directorio", help=f"Carpeta de la caché (por defecto: {DIRECTORIO_POR_DEFECTO}).")
+    parser.add_argument("--limpiar", action="store_true", help="Borra todas las entradas.")
+    parser.add_argument("--max_mb", type=float,
+                        help="Expulsa las entradas más antiguas hasta quedar por debajo de este tamaño.")
+    args = parser.parse_args()
+
+    cache = CacheTablas(args.directorio)
+    if args.limpiar:
+        print(f"Entradas borradas: {cache.limpiar()}")
+        return
+    if args.max_mb is not None:
+        cache.max_bytes = int(args.max_mb * 1024 * 1024)
+        cache.expulsar()
+
+    lista = cache.entradas()
+    for ruta, tamano, ultimo_uso in reversed(lista):
+        print(f"{os.path.basename(ruta)}  {tamano / 1024:.1f} KB  último uso "
+              f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ultimo_uso))}")
+    total = sum(tamano for _, tamano, _ in lista)
+    print(f"{len(lista)} entradas, {total / (1024 * 1024):.1f} MB en '{cache.directorio}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Proyección de columnas: cada transformación declara las columnas que usa
+(pares nombre/email del mapeo de roles, obligatorias y opcionales) y solo se
+leen esas. Las que faltan se avisan una vez al ver el encabezado, no fila a fila.
+"""
+
+from utilidades.lectura import hojas_tabla
+
+
+def coincide_con_mapeo(encabezado, roles_mapping, obligatorias=()):
+    """True si el encabezado tiene todas las `obligatorias` y las dos columnas de al menos un rol."""
+    disponibles = set(encabezado)
+    return (all(col in disponibles for col in obligatorias)
+            and any(all(col in disponibles for col in cols) for cols in roles_mapping.values()))
+
+
+def hojas_a_procesar(input_file, roles_mapping, obligatorias=(), **lectura):
+    """
+    [(hoja, encabezado)] de las hojas de `input_file` cuyo encabezado coincide
+    con el mapeo (ver `coincide_con_mapeo`), leyendo solo los encabezados (ver
+    `lectura.hojas_tabla`, que recibe `lectura`). Las demás se omiten con un
+    aviso. Si ninguna coincide se devuelve la primera, que se procesa como
+    siempre (con sus avisos y errores). Cada hoja es una unidad independiente:
+    se puede leer y transformar por separado, también en otro proceso.
+    """
+    hojas = hojas_tabla(input_file, **lectura)
+    if len(hojas) <= 1:
+        return hojas
+    compatibles = [(hoja, encabezado) for hoja, encabezado in hojas
+                   if coincide_con_mapeo(encabezado, roles_mapping, obligatorias)]
+    if not compatibles:
+        return hojas[:1]
+    for hoja, encabezado in hojas:
+        if (hoja, encabezado) not in compatibles:
+            print(f"Hoja '{hoja}' de '{input_file}' omitida: su encabezado no tiene las columnas del mapeo.")
+    return compatibles
+
+
+def proyectar(encabezado, input_file, roles_mapping, obligatorias=(), opcionales=()):
+    """
+    Compara las columnas que usa una transformación con el `encabezado` del archivo.
+
+    - Si falta una obligatoria, lanza ValueError.
+    - Los roles a los que les falta la columna de nombre o de email se quitan
+      del mapeo (es lo que pasaba fila a fila con el KeyError), con un solo aviso.
+    - Las opcionales que faltan se avisan una vez; la transformación las deja vacías.
+
+    Devuelve (columnas a leer, en el orden del archivo; mapeo de roles filtrado).
+    """
+    disponibles = set(encabezado)
+    faltan = [col for col in obligatorias if col not in disponibles]
+    if faltan:
+        raise ValueError(f"Faltan columnas obligatorias en '{input_file}': {', '.join(map(str, faltan))}")
+
+    roles = {}
+    ausentes = []
+    for position, cols in roles_mapping.items():
+        faltan_rol = [col for col in cols if col not in disponibles]
+        if faltan_rol:
+            ausentes += [col for col in faltan_rol if col not in ausentes]
+        else:
+            roles[position] = cols
+    if ausentes:
+        omitidos = [position for position in roles_mapping if position not in roles]
+        print(f"Advertencia: Columnas no encontradas en '{input_file}': {', '.join(map(str, ausentes))}. "
+              f"Se omiten los roles: {', '.join(map(str, omitidos))}.")
+
+    faltan = [col for col in opcionales if col not in disponibles]
+    if faltan:
+        print(f"Advertencia: Columnas opcionales no encontradas en '{input_file}' (se dejan vacías): "
+              f"{', '.join(map(str, faltan))}.")
+
+    usadas = set(obligatorias) | set(opcionales) | {col for cols in roles.values() for col in cols}
+    return [col for col in encabezado if col in usadas], roles
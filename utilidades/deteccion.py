@@ -0,0 +1,76 @@
+"""
+Detección de codificación y delimitador de archivos de texto sobre un prefijo
+acotado, una sola vez por archivo (caché por ruta, tamaño y fecha de modificación).
+"""
+
+import csv
+import os
+from functools import lru_cache
+
+from chardet.universaldetector import UniversalDetector
+
+BYTES_BLOQUE = 64 * 1024
+BYTES_MAXIMOS = 1024 * 1024  # Nunca se leen más de estos bytes para detectar
+LINEAS_DELIMITADOR = 5
+DELIMITADOR_POR_DEFECTO = '\t'
+
+
+def identidad_archivo(ruta):
+    """(ruta absoluta, tamaño, mtime): cambia si el archivo cambia."""
+    estado = os.stat(ruta)
+    return os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns
+
+
+def detectar_encoding_prefijo(ruta, bytes_maximos=BYTES_MAXIMOS):
+    """
+    Codificación según chardet, alimentado por bloques hasta que está seguro
+    (detector.done) o hasta `bytes_maximos`. Devuelve (encoding, prefijo leído).
+    """
+    detector = UniversalDetector()
+    leidos = []
+    with open(ruta, 'rb') as archivo:
+        total = 0
+        while total < bytes_maximos:
+            bloque = archivo.read(min(BYTES_BLOQUE, bytes_maximos - total))
+            if not bloque:
+                break
+            leidos.append(bloque)
+            total += len(bloque)
+            detector.feed(bloque)
+            if detector.done:
+                break
+    detector.close()
+    encoding = detector.result.get('encoding') or 'utf-8'
+    if encoding.lower() == 'ascii':
+        encoding = 'utf-8'  # Un prefijo ASCII no garantiza que el resto lo sea; utf-8 lo incluye
+    return encoding, b''.join(leidos)
+
+
+def detectar_delimitador_texto(texto, num_lines=LINEAS_DELIMITADOR):
+    """Prueba csv.Sniffer línea a línea (como antes); si ninguna sirve, tabulador."""
+    sniffer = csv.Sniffer()
+    for line in texto.splitlines()[:num_lines]:
+        try:
+            return sniffer.sniff(line).delimiter
+        except csv.Error:
+            continue
+    return DELIMITADOR_POR_DEFECTO
+
+
+@lru_cache(maxsize=None)
+def _detectar(ruta_absoluta, tamano, mtime_ns, bytes_maximos):
+    encoding, prefijo = detectar_encoding_prefijo(ruta_absoluta, bytes_maximos)
+    try:
+        texto = prefijo.decode(encoding, errors='replace')
+    except LookupError:
+        texto = prefijo.decode('latin-1')
+    return encoding, detectar_delimitador_texto(texto)
+
+
+def detectar_csv(ruta, bytes_maximos=BYTES_MAXIMOS):
+    """
+    (encoding, delimitador) de un archivo de texto. Se calculan juntos sobre el
+    mismo prefijo y se guardan en caché: las llamadas siguientes para el mismo
+    archivo sin cambios no vuelven a leerlo.
+    """
+    return _detectar(*identidad_archivo(ruta), bytes_maximos)
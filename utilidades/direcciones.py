@@ -0,0 +1,47 @@
+"""
+Dirección de los contactos de 17_Subir_Posibles_clientes (perfiles corp y
+pyme): las partes (provincia, distrito, ..., apartamento) se convierten a
+texto y se unen columna a columna con operaciones de `Series.str`, sobre
+todas las filas de una vez (la tabla entera, o cada bloque cuando el archivo
+se lee por partes), en lugar de hacer str() y strip() de cada parte fila a fila.
+"""
+
+import pandas as pd
+
+SEPARADOR_DIRECCION = ", "
+_ENTERO_COMO_DECIMAL = r'^(\d+)\.0+$'  # Casa 3 leída como 3.0 (columna numérica con vacíos)
+
+
+def partes_como_texto(columna):
+    """
+    str(valor) sin espacios a los lados de cada valor de `columna`, con los
+    enteros leídos como decimales ("3.0") sin el ".0"; los nulos quedan ''.
+    Series de texto con el índice de `columna`.
+    """
+    texto = columna
+    if not isinstance(columna.dtype, pd.StringDtype):
+        # Por object: str() de cada valor de Python (un Timestamp da la fecha y la hora, como antes)
+        texto = columna.astype(object).astype(str)
+    texto = texto.str.strip().str.replace(_ENTERO_COMO_DECIMAL, r'\1', regex=True)
+    return texto.where(columna.notna(), '').fillna('')
+
+
+def direcciones(partes):
+    """
+    Dirección de cada fila de `partes` (DataFrame con las partes en orden):
+    str(valor) sin espacios a los lados de cada parte, saltando los nulos y
+    las vacías, unidas con SEPARADOR_DIRECCION. Series con el índice de `partes`.
+    Los números enteros leídos como decimales ("3.0") se escriben sin el ".0",
+    como los da openpyxl, lea el archivo quien lo lea.
+    """
+    unidas = None
+    for nombre in partes.columns:
+        texto = partes_como_texto(partes[nombre])
+        if unidas is None:
+            unidas = texto
+            continue
+        # El separador solo va entre dos partes no vacías
+        unidas = unidas + texto.mask(unidas.ne('') & texto.ne(''), SEPARADOR_DIRECCION + texto)
+    if unidas is None:
+        return pd.Series('', index=partes.index, dtype=object)
+    return pd.Series(unidas.to_numpy(dtype=object), index=partes.index, dtype=object)
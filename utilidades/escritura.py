@@ -0,0 +1,236 @@
+"""Escritura de resultados por lotes, sin acumular todas las filas en memoria."""
+
+import csv
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+TAMANO_LOTE = 5000  # Filas que se acumulan antes de pasarlas al disco
+HOJA_POR_DEFECTO = "Sheet1"  # La de DataFrame.to_excel
+# Motores para escribir xlsx:
+#   'openpyxl'   -> DataFrame.to_excel: modelo completo del libro en memoria (el de siempre)
+#   'write_only' -> openpyxl en modo write_only: filas en streaming, memoria constante
+#   'xlsxwriter' -> xlsxwriter con constant_memory: streaming y más rápido
+MOTORES_EXCEL = ('openpyxl', 'write_only', 'xlsxwriter')
+MOTOR_EXCEL_POR_DEFECTO = 'openpyxl'
+OPCIONES_XLSXWRITER = {
+    'constant_memory': True,
+    # Los textos se escriben como texto, igual que con openpyxl (sin convertirlos en fórmulas ni enlaces)
+    'strings_to_formulas': False,
+    'strings_to_urls': False,
+    'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+}
+
+
+def formato_salida(ruta):
+    """'csv' si la ruta termina en .csv; si no, 'excel'."""
+    return "csv" if os.path.splitext(ruta)[1].lower() == ".csv" else "excel"
+
+
+def motor_excel(motor=None):
+    """
+    Motor xlsx a usar: `motor` si se indica; si no, la variable de entorno
+    MOTOR_EXCEL; si no, MOTOR_EXCEL_POR_DEFECTO. ValueError si no existe.
+    """
+    motor = motor or os.environ.get("MOTOR_EXCEL") or MOTOR_EXCEL_POR_DEFECTO
+    if motor not in MOTORES_EXCEL:
+        raise ValueError(f"Motor de Excel desconocido: '{motor}' (opciones: {', '.join(MOTORES_EXCEL)})")
+    if motor == 'xlsxwriter' and xlsxwriter is None:
+        raise ImportError("El motor 'xlsxwriter' necesita el paquete xlsxwriter (pip install xlsxwriter)")
+    return motor
+
+
+def _valor_celda(valor):
+    """Los nulos (NaN, None, NA) se escriben como celda vacía, igual que to_excel/to_csv."""
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass  # Valores no escalares: se escriben tal cual
+    return valor
+
+
+class EscritorResultados:
+    """
+    Escribe filas en un CSV (csv.writer) o en un xlsx de memoria constante
+    a medida que llegan, vaciando cada `tamano_lote` filas. El xlsx se escribe
+    con `motor` (ver MOTORES_EXCEL): 'xlsxwriter' o, con cualquier otro valor,
+    openpyxl en modo write_only (este escritor siempre va en streaming).
+    El archivo solo se crea con la primera fila (o con `abrir()`): si no
+    llega ninguna, no se genera salida.
+
+    Uso:
+        with EscritorResultados(ruta, columnas) as escritor:
+            escritor.agregar({'Columna': valor, ...})
+            escritor.agregar_df(df)
+    """
+
+    def __init__(self, ruta, columnas, tamano_lote=TAMANO_LOTE, formato=None, convertir_csv=None,
+                 motor=None, hoja=HOJA_POR_DEFECTO):
+        self.ruta = ruta
+        self.columnas = list(columnas)
+        self.tamano_lote = max(1, tamano_lote)
+        self.formato = formato or formato_salida(ruta)
+        self.motor = motor_excel(motor) if self.formato != "csv" else None
+        self.hoja = hoja
+        # En CSV cada valor pasa por `convertir_csv` si se indica (p. ej. la limpieza de codificación de un script)
+        self.convertir_csv = convertir_csv
+        self.filas_escritas = 0
+        self._lote = []
+        self._archivo = None
+        self._writer = None
+        self._libro = None
+        self._hoja = None
+        self._fila_xlsx = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar()
+        return False
+
+    def abrir(self):
+        """Crea el archivo con el encabezado (si no estaba ya creado), aunque no lleguen filas."""
+        if self._libro is not None or self._writer is not None:
+            return
+        if self.formato == "csv":
+            self._archivo = open(self.ruta, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._archivo, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            self._writer.writerow(self.columnas)
+        elif self.motor == 'xlsxwriter':
+            # constant_memory pasa cada fila al disco en cuanto empieza la siguiente
+            self._libro = xlsxwriter.Workbook(self.ruta, OPCIONES_XLSXWRITER)
+            self._hoja = self._libro.add_worksheet(self.hoja)
+            self._escribir_xlsx(self.columnas)
+        else:
+            # write_only guarda las filas en un temporal: la memoria no crece con el número de filas
+            self._libro = Workbook(write_only=True)
+            self._hoja = self._libro.create_sheet(self.hoja)
+            self._escribir_xlsx(self.columnas)
+
+    def _escribir_xlsx(self, valores):
+        if self.motor == 'xlsxwriter':
+            self._hoja.write_row(self._fila_xlsx, 0, valores)
+            self._fila_xlsx += 1
+        else:
+            self._hoja.append(valores)
+
+    def agregar(self, fila):
+        """Añade una fila (dict por nombre de columna o secuencia en el orden de `columnas`)."""
+        if isinstance(fila, dict):
+            fila = [fila.get(columna) for columna in self.columnas]
+        self._lote.append(fila)
+        if len(self._lote) >= self.tamano_lote:
+            self.vaciar()
+
+    def agregar_filas(self, filas):
+        for fila in filas:
+            self.agregar(fila)
+
+    def agregar_df(self, df):
+        """Añade las filas de un DataFrame (solo las columnas del escritor, en su orden)."""
+        if df is None or df.empty:
+            return
+        self.agregar_filas(df.reindex(columns=self.columnas).itertuples(index=False, name=None))
+
+    def vaciar(self):
+        """Pasa al disco las filas pendientes."""
+        if not self._lote:
+            return
+        self.abrir()
+        for fila in self._lote:
+            if self.formato == "csv" and self.convertir_csv is not None:
+                self._writer.writerow([self.convertir_csv(valor) for valor in fila])
+                continue
+            valores = [_valor_celda(valor) for valor in fila]
+            if self.formato == "csv":
+                self._writer.writerow(['' if valor is None else valor for valor in valores])
+            else:
+                self._escribir_xlsx(valores)
+        self.filas_escritas += len(self._lote)
+        self._lote = []
+
+    def cerrar(self):
+        """Vacía lo pendiente y cierra el archivo. Devuelve cuántas filas se escribieron."""
+        self.vaciar()
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+            self._writer = None
+        if self._libro is not None:
+            if self.motor == 'xlsxwriter':
+                self._libro.close()
+            else:
+                self._libro.save(self.ruta)
+            self._libro = None
+            self._hoja = None
+        return self.filas_escritas
+
+
+def guardar_excel(df, ruta, motor=None, hoja=HOJA_POR_DEFECTO):
+    """
+    Escribe un DataFrame completo en un xlsx (sin el índice) con el motor
+    elegido (ver `motor_excel`). Con 'openpyxl' es DataFrame.to_excel; con
+    'write_only' o 'xlsxwriter' las filas se pasan en streaming, sin construir
+    el libro en memoria. El archivo se crea aunque `df` no tenga filas.
+    """
+    motor = motor_excel(motor)
+    if motor == 'openpyxl':
+        df.to_excel(ruta, index=False, sheet_name=hoja, engine='openpyxl')
+        return
+    with EscritorResultados(ruta, df.columns, formato="excel", motor=motor, hoja=hoja) as escritor:
+        escritor.abrir()
+        escritor.agregar_filas(df.itertuples(index=False, name=None))
+
+
+class EscritoresPorArchivo:
+    """
+    Un EscritorResultados por ruta de salida, todos abiertos a la vez: sirve
+    para ir añadiendo lote a lote las filas de cada grupo a su archivo.
+    `opciones` se pasa a cada EscritorResultados (formato, convertir_csv...).
+    """
+
+    def __init__(self, columnas, **opciones):
+        self.columnas = columnas
+        self.opciones = opciones
+        self.escritores = {}
+
+    def agregar_df(self, ruta, df):
+        if ruta not in self.escritores:
+            self.escritores[ruta] = EscritorResultados(ruta, self.columnas, **self.opciones)
+        self.escritores[ruta].agregar_df(df)
+
+    def cerrar(self):
+        """Cierra todos los archivos. Devuelve {ruta: filas escritas}."""
+        return {ruta: escritor.cerrar() for ruta, escritor in self.escritores.items()}
+
+
+def repartir_como_array_split(registros, tamano_parte):
+    """
+    Reparte `registros` en partes con los mismos tamaños que
+    np.array_split(datos, total // tamano_parte + 1), sin tenerlos todos en
+    memoria: se vuelcan a un temporal y se releen parte por parte.
+    Genera (número de parte desde 1, iterador de la parte); cada parte debe
+    consumirse antes de pedir la siguiente.
+    """
+    with tempfile.TemporaryFile() as temporal:
+        total = 0
+        for registro in registros:
+            pickle.dump(registro, temporal, protocol=pickle.HIGHEST_PROTOCOL)
+            total += 1
+        temporal.seek(0)
+
+        partes = total // tamano_parte + 1
+        base, resto = divmod(total, partes)
+        for numero in range(partes):
+            tamano = base + (1 if numero < resto else 0)  # Las primeras `resto` partes llevan uno más
+            yield numero + 1, (pickle.load(temporal) for _ in range(tamano))
@@ -0,0 +1,119 @@
+"""
+Etiquetas (Tags de Perfex) de los contactos a partir de la actividad de la
+empresa.
+
+Los mismos valores de actividad se repiten en miles de filas, así que cada
+valor distinto se divide en etiquetas una sola vez. Las etiquetas se guardan
+en un vocabulario: cada etiqueta distinta tiene un código, cada valor ya
+visto guarda los códigos de sus etiquetas y el texto de 'Tags' se arma con
+la tabla código -> etiqueta. El vocabulario cuenta en cuántos contactos sale
+cada etiqueta y se puede guardar junto a la salida (ver
+`VocabularioEtiquetas.guardar`), para crear las etiquetas en Perfex antes de
+importar.
+"""
+
+import os
+import re
+
+import pandas as pd
+
+SEPARADORES_ACTIVIDAD = r'[;,]| y '  # "Venta de ropa; calzado y accesorios"
+COLUMNAS_VOCABULARIO = ['Etiqueta', 'Contactos']
+
+
+def _es_nulo(valor):
+    """None, NaN o pd.NA (los nulos que llegan de pandas o de openpyxl)."""
+    return valor is None or valor is pd.NA or (isinstance(valor, float) and valor != valor)
+
+
+def etiquetas_actividad(valor):
+    """
+    Etiquetas de un texto de actividades (17_Subir_Posibles_clientes): partido
+    por ',', ';' o ' y ', sin espacios a los lados y en minúsculas. Sin
+    etiquetas si el valor es nulo o vacío.
+    """
+    if _es_nulo(valor) or not valor:
+        return []
+    return [tag.strip().lower() for tag in re.split(SEPARADORES_ACTIVIDAD, str(valor)) if tag.strip()]
+
+
+def etiquetas_grupo(par):
+    """
+    Etiquetas de un par (grupo, actividad) (TRANSFORM_TO_POSIBLE.py): el grupo
+    y la actividad tal como vienen, partidos por ','; los espacios junto a las
+    comas se quitan. La actividad nula o vacía no da etiquetas.
+    """
+    grupo, actividad = par
+    texto = f"{grupo}" if _es_nulo(actividad) else f"{grupo},{actividad}"
+    texto = texto.replace(" ,", ",").replace(", ", ",")
+    return [tag for tag in texto.split(',') if tag]
+
+
+def ruta_vocabulario(output_dir, input_file, sufijo=""):
+    """Ruta del vocabulario de etiquetas de un archivo de entrada (y hoja, con `sufijo`)."""
+    return os.path.join(output_dir, f"etiquetas_{os.path.basename(input_file)}{sufijo}.csv")
+
+
+class VocabularioEtiquetas:
+    """
+    Vocabulario de las etiquetas de un archivo. `dividir(valor)` da la lista de
+    etiquetas de un valor (ver `etiquetas_actividad` y `etiquetas_grupo`);
+    solo se llama una vez por valor distinto.
+    """
+
+    def __init__(self, dividir=etiquetas_actividad):
+        self.dividir = dividir
+        self.codigos = {}    # Etiqueta -> código
+        self.etiquetas = []  # Código -> etiqueta
+        self.contactos = []  # Código -> contactos con la etiqueta
+        self._valores = {}   # Valor ya dividido -> (códigos, códigos distintos, texto de 'Tags')
+
+    def _codigo(self, etiqueta):
+        codigo = self.codigos.get(etiqueta)
+        if codigo is None:
+            codigo = self.codigos[etiqueta] = len(self.etiquetas)
+            self.etiquetas.append(etiqueta)
+            self.contactos.append(0)
+        return codigo
+
+    def texto(self, codigos):
+        """Texto de 'Tags' de unos códigos: sus etiquetas separadas por ','."""
+        return ",".join(self.etiquetas[codigo] for codigo in codigos)
+
+    def codificar(self, valor):
+        """
+        (códigos, códigos sin repetir, texto de 'Tags') de `valor`. Solo la
+        primera vez que aparece el valor se divide y sus etiquetas nuevas entran
+        al vocabulario.
+        """
+        if _es_nulo(valor):
+            valor = None  # Todos los nulos son el mismo valor (NaN != NaN)
+        codificado = self._valores.get(valor)
+        if codificado is None:
+            codigos = tuple(self._codigo(etiqueta) for etiqueta in self.dividir(valor))
+            codificado = self._valores[valor] = (codigos, tuple(dict.fromkeys(codigos)), self.texto(codigos))
+        return codificado
+
+    def etiquetar(self, valor):
+        """Texto de 'Tags' de un contacto cuyo valor de actividad es `valor`; lo cuenta en sus etiquetas."""
+        _, distintos, texto = self.codificar(valor)
+        for codigo in distintos:
+            self.contactos[codigo] += 1
+        return texto
+
+    def etiquetar_todos(self, valores):
+        """`etiquetar` de cada valor de `valores` (uno por contacto), en una lista."""
+        return [self.etiquetar(valor) for valor in valores]
+
+    def tabla(self):
+        """DataFrame con cada etiqueta y sus contactos, de la más usada a la menos (y por orden alfabético)."""
+        tabla = pd.DataFrame({'Etiqueta': self.etiquetas, 'Contactos': self.contactos}, columns=COLUMNAS_VOCABULARIO)
+        return tabla.sort_values(['Contactos', 'Etiqueta'], ascending=[False, True], kind='stable',
+                                 ignore_index=True)
+
+    def guardar(self, ruta, input_file):
+        """Escribe el vocabulario en CSV (ver `tabla`) y avisa. Devuelve cuántas etiquetas escribió."""
+        tabla = self.tabla()
+        tabla.to_csv(ruta, index=False, encoding='utf-8')
+        print(f"{len(tabla)} etiqueta(s) de '{input_file}' guardadas en '{ruta}'")
+        return len(tabla)
@@ -0,0 +1,137 @@
+"""Índice en disco, ya normalizado, de los archivos de un directorio de comparación."""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+NOMBRE_DIRECTORIO_INDICE = ".indice_comparacion"
+VERSION_INDICE = 1
+
+
+def hash_contenido(ruta, tamano_bloque=1 << 20):
+    """Calcula el hash SHA-256 del contenido de un archivo, leyendo por bloques."""
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class IndiceDirectorio:
+    """
+    Guarda, por cada archivo del directorio de comparación, el DataFrame ya
+    procesado (columnas normalizadas y de contacto) que devuelve `construir`.
+
+    Cada entrada se identifica por ruta, tamaño, fecha de modificación y hash
+    del contenido, y solo se reconstruye cuando el archivo cambió; en las
+    ejecuciones siguientes no hace falta volver a leer el Excel.
+    """
+
+    def __init__(self, compare_dir, espacio, directorio=None, persistente=True, version=VERSION_INDICE):
+        self.directorio = directorio or os.path.join(compare_dir, NOMBRE_DIRECTORIO_INDICE)
+        self.espacio = espacio
+        self.version = version
+        self.persistente = persistente
+        self.ruta_manifiesto = os.path.join(self.directorio, f"manifiesto_{espacio}.json")
+        self.manifiesto = self._cargar_manifiesto() if persistente else {}
+        self.reutilizados = 0
+        self.reconstruidos = 0
+
+    def _cargar_manifiesto(self):
+        if not os.path.exists(self.ruta_manifiesto):
+            return {}
+        try:
+            with open(self.ruta_manifiesto, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: Manifiesto del índice ilegible ('{self.ruta_manifiesto}'), se reconstruye: {e}")
+            return {}
+
+    def guardar(self):
+        """Escribe el manifiesto en disco (de forma atómica)."""
+        if not self.persistente:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = self.ruta_manifiesto + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.manifiesto, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self.ruta_manifiesto)
+
+    def _nombre_datos(self, clave):
+        return hashlib.sha1(f"{self.espacio}|{clave}".encode('utf-8')).hexdigest() + ".pkl"
+
+    def _entrada_vigente(self, clave, stat, ruta):
+        entrada = self.manifiesto.get(clave)
+        if entrada is None or entrada.get('version') != self.version or entrada['tamano'] != stat.st_size:
+            return None
+        if entrada['mtime'] != stat.st_mtime:
+            # Se modificó la fecha pero quizá no el contenido (copias, sincronizaciones...)
+            if entrada['hash'] != hash_contenido(ruta):
+                return None
+            entrada['mtime'] = stat.st_mtime
+        return entrada
+
+    def obtener(self, ruta, leer, construir):
+        """
+        Devuelve el DataFrame indexado de `ruta`. Solo llama a `leer(ruta)` y a
+        `construir(df)` si el archivo no está en el índice o cambió. Devuelve
+        None si el archivo no se pudo leer o `construir` no aportó datos.
+        """
+        if not self.persistente:
+            df = leer(ruta)
+            return None if df is None else construir(df)
+
+        clave = os.path.abspath(ruta)
+        stat = os.stat(ruta)
+        entrada = self._entrada_vigente(clave, stat, ruta)
+        if entrada is not None:
+            if entrada['datos'] is None:
+                self.reutilizados += 1
+                return None
+            try:
+                datos = pd.read_pickle(os.path.join(self.directorio, entrada['datos']))
+                self.reutilizados += 1
+                return datos
+            except Exception as e:
+                print(f"Advertencia: Entrada del índice dañada para '{ruta}', se reconstruye: {e}")
+
+        df = leer(ruta)
+        if df is None:  # No se guarda: el error de lectura puede ser pasajero
+            return None
+        datos = construir(df)
+
+        os.makedirs(self.directorio, exist_ok=True)
+        nombre_datos = None
+        if datos is not None:
+            nombre_datos = self._nombre_datos(clave)
+            datos.to_pickle(os.path.join(self.directorio, nombre_datos))
+        self.manifiesto[clave] = {
+            'version': self.version,
+            'tamano': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': hash_contenido(ruta),
+            'datos': nombre_datos,
+        }
+        self.reconstruidos += 1
+        return datos
+
+    def entrada(self, ruta):
+        """Entrada del manifiesto de un archivo, para pasarla de un proceso trabajador al principal."""
+        return self.manifiesto.get(os.path.abspath(ruta))
+
+    def incorporar(self, ruta, entrada, reconstruido):
+        """Añade la entrada de un archivo obtenida en otro proceso (o en este mismo)."""
+        if not self.persistente:
+            return
+        if entrada is not None:
+            self.manifiesto[os.path.abspath(ruta)] = entrada
+        if reconstruido:
+            self.reconstruidos += 1
+        elif entrada is not None:
+            self.reutilizados += 1
+
+    def resumen(self):
+        """Texto con cuántos archivos se tomaron del índice y cuántos se reconstruyeron."""
+        return f"Índice '{self.espacio}': {self.reutilizados} reutilizados, {self.reconstruidos} reconstruidos"
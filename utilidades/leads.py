@@ -0,0 +1,234 @@
+"""
+Lectura y escritura de los posibles clientes (leads) de los scripts de
+17_Subir_Posibles_clientes. Los scripts solo cambian en sus columnas y en cómo
+arman el registro de cada contacto (ver `PerfilLeads`); leer las hojas por
+bloques, limpiar teléfonos y dirección, recorrer los roles y escribir la
+salida en streaming es lo mismo para todos.
+"""
+
+import itertools
+
+import pandas as pd
+
+from utilidades.cache_tablas import leer_con_cache
+from utilidades.columnas import hojas_a_procesar, proyectar
+from utilidades.deteccion import detectar_csv
+from utilidades.direcciones import direcciones
+from utilidades.escritura import EscritorResultados
+from utilidades.etiquetas import VocabularioEtiquetas
+from utilidades.lectura import (FILAS_POR_BLOQUE, columnas_tabla, detectar_formato, iterar_filas_xlsx, leer_csv,
+                                leer_tabla, leer_texto_por_lotes, lotes_de_filas)
+from utilidades.nombres import NOMBRES_COMPUESTOS_AMPLIADOS, split_name
+from utilidades.telefonos import telefonos
+
+ENCODINGS_TO_TRY = ['utf-8', 'latin-1', 'cp1252', 'utf-8-sig', 'utf-16']  # Si la detectada no sirve
+COLUMN_ORDER = [
+    'Name', 'Position', 'Company', 'Description', 'Country', 'Zip',
+    'City', 'State', 'Address', 'Status', 'Source', 'Email',
+    'Website', 'Phonenumber', 'Lead value', 'Tags'
+]
+
+
+class PerfilLeads:
+    """
+    Lo propio de cada script: las columnas de teléfono (se unen, en orden, en
+    'Phonenumber') y de dirección (partes en orden), las opcionales (se leen si
+    existen; incluyen las de teléfono y dirección) y `construir`, que arma el
+    registro (dict con las columnas de COLUMN_ORDER) de un contacto:
+    construir(fila, firstname, lastname, email, teléfonos, dirección, vocabulario).
+    """
+
+    def __init__(self, columnas_telefono, columnas_direccion, opcionales, construir):
+        self.columnas_telefono = columnas_telefono
+        self.columnas_direccion = columnas_direccion
+        self.opcionales = opcionales
+        self.construir = construir
+
+
+def read_csv_robust(filepath, delimiter=None, usecols=None, csv_reader=None):
+    """Lee un CSV con la codificación detectada; solo si no decodifica prueba otras."""
+    encoding, detected_delimiter = detectar_csv(filepath)  # Una sola detección por archivo
+    if delimiter is None:
+        delimiter = detected_delimiter
+
+    try:
+        return leer_csv(filepath, delimiter, encoding, usecols, csv_reader)
+    except (UnicodeDecodeError, LookupError) as e:
+        print(f"Fallo al leer con {encoding} (detectada): {e}")
+    except Exception as e:
+        print(f"No se pudo leer el archivo CSV: {filepath} ({e})")
+        return None  # Otra codificación no arregla un error de formato
+
+    for encoding in ENCODINGS_TO_TRY:
+        try:
+            df = leer_csv(filepath, delimiter, encoding, usecols, csv_reader)
+            print(f"Archivo leído con éxito usando la codificación: {encoding}")
+            return df
+        except Exception as e:
+            print(f"Fallo al leer con {encoding}: {e}")
+            continue  # Prueba la siguiente codificación
+
+    print(f"No se pudo leer el archivo CSV: {filepath}")
+    return None  # Retorna None si falla
+
+
+def fix_encoding_issues(text):
+    """Intenta corregir problemas comunes de codificación."""
+    if isinstance(text, str):
+        # Diccionario de reemplazos
+        replacements = {
+            "Ã³": "ó",
+            "Ã¡": "á",
+            "Ã©": "é",
+            "Ã­": "í",
+            "Ãº": "ú",
+            "Ã±": "ñ",
+            "Ã": "Á",
+            "Ã‰": "É",
+            "Ã": "Í",
+            "Ã“": "Ó",
+            "Ãš": "Ú",
+            "Ã‘": "Ñ",
+            "Â¿": "¿",
+            "Â¡": "¡",
+            "â€œ": "“",
+            "â€": "”",
+            "â€”": "—",
+            "â€“": "–",
+            "â€¦": "…",
+            "Â": "",  # Remover Â (carácter de control)
+        }
+        #Aplica los remplazos
+        for incorrect, correct in replacements.items():
+            text = text.replace(incorrect, correct)
+
+        return text
+    else:
+        return text #Retorna sin modificar
+
+
+def leer_hojas(input_file, roles_mapping, perfil, max_memory_mb=None, csv_reader=None):
+    """
+    Genera (hoja, lotes, mapeo) de cada hoja del archivo cuyo encabezado
+    coincide con el mapeo (ver `hojas_a_procesar`; un CSV es una sola hoja), en orden.
+    Las hojas se listan leyendo solo los encabezados y cada una se lee (con
+    `leer_lotes`) cuando se pide.
+    """
+    try:
+        lectura = {}
+        if detectar_formato(input_file) == 'texto':
+            encoding, delimiter = detectar_csv(input_file)
+            lectura = {'sep': delimiter, 'encoding': encoding}
+        hojas = hojas_a_procesar(input_file, roles_mapping, encodings=ENCODINGS_TO_TRY, **lectura)
+    except (OSError, ValueError, KeyError, TypeError, ImportError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}': {e}")
+        return
+    for hoja, encabezado in hojas:
+        lotes, roles = leer_lotes(input_file, roles_mapping, perfil, max_memory_mb, hoja, encabezado, csv_reader)
+        if lotes is not None:
+            yield hoja, lotes, roles
+
+
+def leer_lotes(input_file, roles_mapping, perfil, max_memory_mb=None, hoja=0, encabezado=None, csv_reader=None):
+    """
+    Filas de una hoja del archivo en bloques (DataFrames, con el índice
+    seguido desde 0).
+    Los xlsx se recorren en streaming con openpyxl read_only, sin cargar el
+    libro en un DataFrame (ver `lotes_de_filas`); con `max_memory_mb`, los CSV
+    se leen por lotes que caben en esa memoria; el resto se lee completo y es
+    un solo bloque.
+    Solo se leen las columnas del mapeo y las opcionales del perfil; las que
+    faltan se avisan una vez. Devuelve (lotes, mapeo sin los roles a los que
+    les faltan columnas), o (None, None) si no se pudo leer.
+    """
+    try:
+        formato = detectar_formato(input_file)
+        lectura = {}
+        if formato == 'texto':
+            encoding, delimiter = detectar_csv(input_file)
+            lectura = {'sep': delimiter, 'encoding': encoding}
+        if encabezado is None:
+            encabezado = columnas_tabla(input_file, encodings=ENCODINGS_TO_TRY, sheet_name=hoja, **lectura)
+        columnas, roles_mapping = proyectar(encabezado, input_file, roles_mapping, opcionales=perfil.opcionales)
+        if formato == 'xlsx':
+            return lotes_de_filas(iterar_filas_xlsx(input_file, hoja=hoja, columnas=columnas), columnas), roles_mapping
+        if formato == 'texto' and max_memory_mb:
+            lotes = leer_texto_por_lotes(input_file, max_memory_mb, usecols=columnas, encodings=ENCODINGS_TO_TRY,
+                                         **lectura)
+            return lotes, roles_mapping
+        # xls/parquet van directo a su lector; los textos pasan por la detección de codificación
+        if formato == 'texto':
+            df = leer_con_cache(input_file, {'lector': 'read_csv_robust', 'usecols': columnas},
+                                lambda: read_csv_robust(input_file, usecols=columnas, csv_reader=csv_reader))
+        else:
+            df = leer_tabla(input_file, sheet_name=hoja, usecols=columnas)
+    except (OSError, ValueError, KeyError, TypeError, ImportError) as e:
+        print(f"Error: No se pudo leer el archivo '{input_file}': {e}")
+        return None, None
+    if df is None:  # Si read_csv_robust retorna None, no se pudo leer
+        return None, None
+    return [df], roles_mapping
+
+
+def filas_con_telefono_y_direccion(lotes, perfil, reporte, phone_format=None, hoja=0):
+    """
+    Genera (fila, teléfonos, dirección) de cada fila (dict) de los bloques
+    `lotes`. Los teléfonos (ver `utilidades.telefonos`) y la dirección (ver
+    `utilidades.direcciones`) se calculan por columnas una vez por bloque (una
+    vez por archivo si se leyó completo); los teléfonos inválidos van a
+    `reporte`. Las filas se pasan a dict de FILAS_POR_BLOQUE en FILAS_POR_BLOQUE.
+    """
+    for lote in lotes:
+        phone_numbers, invalidos = telefonos(lote.reindex(columns=perfil.columnas_telefono), phone_format)
+        reporte.agregar(invalidos, hoja)
+        addresses = direcciones(lote.reindex(columns=perfil.columnas_direccion)).tolist()
+        phone_numbers = phone_numbers.tolist()
+        for inicio in range(0, len(lote), FILAS_POR_BLOQUE):
+            fin = inicio + FILAS_POR_BLOQUE
+            yield from zip(lote.iloc[inicio:fin].to_dict('records'), phone_numbers[inicio:fin], addresses[inicio:fin])
+
+
+def generar_leads(lotes, roles_mapping, perfil, reporte, phone_format=None, hoja=0, vocabulario=None):
+    """
+    Genera un registro (ver `PerfilLeads.construir`) por cada contacto válido:
+    cada rol del mapeo con nombre y email. Teléfonos y dirección se calculan
+    por bloques de filas (ver `filas_con_telefono_y_direccion`); los teléfonos
+    inválidos van a `reporte`. Los tags salen de `vocabulario`
+    (VocabularioEtiquetas), que los cuenta.
+    """
+    if vocabulario is None:
+        vocabulario = VocabularioEtiquetas()
+    for row, combined_phone_number, address in filas_con_telefono_y_direccion(lotes, perfil, reporte, phone_format,
+                                                                              hoja):
+        for name_col, email_col in roles_mapping.values():
+            full_name = str(row[name_col]) if pd.notna(row[name_col]) else ''
+            email = row[email_col] if pd.notna(row[email_col]) else ''
+
+            if email and full_name:
+                firstname, lastname = split_name(full_name, NOMBRES_COMPUESTOS_AMPLIADOS)
+                yield perfil.construir(row, firstname, lastname, email, combined_phone_number, address, vocabulario)
+
+
+def leads_del_archivo(input_file, roles_mapping, perfil, reporte, max_memory_mb=None, csv_reader=None,
+                      phone_format=None, vocabulario=None):
+    """
+    Registros de todas las hojas del archivo que coinciden con el mapeo, una
+    hoja tras otra y cada una con su mapeo. Lectura y transformación van
+    encadenadas: ninguna etapa guarda todas las filas.
+    Devuelve el iterador de registros, o None si el archivo no tiene ninguno.
+    """
+    leads = (lead for hoja, lotes, roles in leer_hojas(input_file, roles_mapping, perfil, max_memory_mb, csv_reader)
+             for lead in generar_leads(lotes, roles, perfil, reporte, phone_format, hoja, vocabulario))
+    primero = next(leads, None)
+    if primero is None:
+        return None
+    return itertools.chain([primero], leads)
+
+
+def guardar_leads(leads, output_file, output_format, excel_writer=None):
+    """Escribe los registros en streaming (CSV o xlsx de memoria constante). Devuelve cuántos escribió."""
+    formato = "csv" if output_format == "csv" else "excel"
+    with EscritorResultados(output_file, COLUMN_ORDER, formato=formato,
+                            convertir_csv=lambda x: fix_encoding_issues(str(x)), motor=excel_writer) as escritor:
+        escritor.agregar_filas(leads)
+    return escritor.filas_escritas
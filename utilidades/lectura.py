@@ -0,0 +1,426 @@
+"""
+Lectura de tablas (xlsx, xls, parquet, CSV/TSV) según los primeros bytes del
+archivo, con un solo intento por archivo en lugar de probar lectores en cadena.
+"""
+
+import codecs
+import itertools
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from utilidades.cache_tablas import leer_con_cache
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Firmas ("magic bytes") del inicio de cada formato binario
+FIRMAS = (
+    (b'PK\x03\x04', 'xlsx'),  # zip (xlsx, xlsm)
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'xls'),  # OLE2 (Excel 97-2003)
+    (b'PAR1', 'parquet'),
+)
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# Textos que read_csv/read_excel leen como nulos por defecto (na_values de pandas)
+VALORES_NULOS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+DTYPE_TEXTO = pd.Series(['']).dtype  # Dtype que da pandas al texto: 'str' en pandas 3, object antes
+BYTES_MUESTRA = 64 * 1024  # Prefijo leído para decidir la codificación de un texto
+ENCODINGS_TEXTO = ('utf-8', 'latin-1')  # latin-1 decodifica cualquier byte: es el último recurso
+BYTES_BLOQUE = 1024 * 1024  # Bloque para comprobar la codificación de un archivo entero
+FILAS_MUESTRA = 1000  # Filas leídas para estimar la memoria por fila en la lectura por lotes
+FILAS_MINIMAS_LOTE = 100
+FACTOR_MEMORIA_LOTE = 4  # Copias de cada lote durante la transformación (groupby, filas de salida...)
+FILAS_POR_BLOQUE = 5000  # Filas de los bloques que se leen del xlsx en streaming (ver lotes_de_filas)
+# Lectores de CSV/TSV:
+#   'pandas' -> pd.read_csv (parser de C, un hilo)
+#   'arrow'  -> pyarrow.csv: archivo mapeado en memoria, varios hilos, texto en columnas Arrow (ver leer_csv_arrow)
+LECTORES_CSV = ('pandas', 'arrow')
+LECTOR_CSV_POR_DEFECTO = 'pandas'
+# Valores que read_csv convierte en booleanos por defecto (pyarrow acepta además '1' y '0')
+VALORES_VERDADEROS = ['True', 'TRUE', 'true']
+VALORES_FALSOS = ['False', 'FALSE', 'false']
+
+
+def detectar_formato(ruta):
+    """Devuelve 'xlsx', 'xls', 'parquet' o 'texto' según los primeros bytes del archivo."""
+    with open(ruta, 'rb') as archivo:
+        cabecera = archivo.read(8)
+    for firma, formato in FIRMAS:
+        if cabecera.startswith(firma):
+            return formato
+    return 'texto'
+
+
+def detectar_encoding_texto(ruta, encodings=ENCODINGS_TEXTO, bytes_muestra=BYTES_MUESTRA):
+    """
+    Elige la codificación de un texto mirando solo un prefijo: primero el BOM y,
+    si no hay, la primera de `encodings` que decodifica la muestra.
+    """
+    with open(ruta, 'rb') as archivo:
+        muestra = archivo.read(bytes_muestra)
+    for bom, encoding in BOMS:
+        if muestra.startswith(bom):
+            return encoding
+    for encoding in encodings:
+        try:
+            # final=False: un carácter multibyte cortado al final de la muestra no cuenta como error
+            codecs.getincrementaldecoder(encoding)().decode(muestra, final=False)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return encodings[-1]
+
+
+def lector_csv(lector=None):
+    """
+    Lector de CSV a usar: `lector` si se indica; si no, la variable de entorno
+    LECTOR_CSV; si no, LECTOR_CSV_POR_DEFECTO. ValueError si no existe.
+    """
+    lector = lector or os.environ.get("LECTOR_CSV") or LECTOR_CSV_POR_DEFECTO
+    if lector not in LECTORES_CSV:
+        raise ValueError(f"Lector de CSV desconocido: '{lector}' (opciones: {', '.join(LECTORES_CSV)})")
+    if lector == 'arrow' and pa is None:
+        raise ImportError("El lector 'arrow' necesita el paquete pyarrow (pip install pyarrow)")
+    return lector
+
+
+def leer_csv(ruta, sep, encoding, usecols=None, lector=None):
+    """pd.read_csv(ruta, sep=sep, encoding=encoding, usecols=usecols) con el lector elegido (ver `lector_csv`)."""
+    if lector_csv(lector) == 'arrow':
+        return leer_csv_arrow(ruta, sep, encoding, usecols)
+    return pd.read_csv(ruta, sep=sep, encoding=encoding, usecols=usecols)
+
+
+def leer_csv_arrow(ruta, sep=',', encoding='utf-8', usecols=None):
+    """
+    Lee un CSV/TSV con pyarrow: el archivo se mapea en memoria, se parsea en
+    varios hilos y el texto queda en columnas Arrow. Devuelve lo mismo que
+    pd.read_csv(ruta, sep=sep, encoding=encoding, usecols=usecols):
+    - los nombres de columna se toman del encabezado leído por pandas
+      ('Unnamed: i', 'Email.1'...) y las columnas quedan en el orden del archivo;
+    - mismos nulos y booleanos que read_csv, y sin convertir fechas;
+    - el texto con el dtype de texto de pandas (en pandas 3, 'str' sobre Arrow);
+    - las columnas que Arrow deja en float (decimales, enteros con nulos o con
+      signo '+', enteros enormes) se vuelven a leer como texto; si alguno de sus
+      valores puede dar otro número o tipo con el parser de pandas (ver
+      `_numero_dudoso`), la columna se convierte con pd.to_numeric, que redondea
+      y elige el tipo igual que read_csv.
+    Si Arrow no puede leer el archivo (filas con más o menos campos, bytes que
+    no son de la codificación, que Arrow deja en columnas binarias...), se lee
+    con pd.read_csv, que da su resultado o su error de siempre.
+    """
+    nombres = list(pd.read_csv(ruta, sep=sep, encoding=encoding, nrows=0).columns)
+    if usecols is not None:
+        seleccion = set(usecols)
+        columnas = [nombre for nombre in nombres if nombre in seleccion]
+    else:
+        columnas = nombres
+    try:
+        tabla = _tabla_arrow(ruta, sep, encoding, nombres, columnas)
+        if any(pa.types.is_binary(campo.type) or pa.types.is_large_binary(campo.type) for campo in tabla.schema):
+            raise UnicodeDecodeError(encoding or 'utf-8', b'', 0, 1, "texto que no es de la codificación")
+        numericas = [campo.name for campo in tabla.schema
+                     if pa.types.is_floating(campo.type)
+                     or (pa.types.is_integer(campo.type) and tabla.column(campo.name).null_count)]
+        texto = _tabla_arrow(ruta, sep, encoding, nombres, numericas, como_texto=True) if numericas else None
+    except (pa.ArrowInvalid, UnicodeDecodeError):
+        return pd.read_csv(ruta, sep=sep, encoding=encoding, usecols=usecols)
+
+    df = tabla.to_pandas(types_mapper=_tipo_texto_pandas)
+    for nombre in numericas:
+        if _numero_dudoso(texto.column(nombre)):
+            df[nombre] = pd.to_numeric(texto.column(nombre).to_pandas(types_mapper=_tipo_texto_pandas)).set_axis(df.index)
+    return df
+
+
+def _numero_dudoso(columna):
+    """
+    True si algún texto de la columna numérica puede leerse distinto en pandas
+    que en Arrow: con más de 15 caracteres (más cifras de las que un double
+    guarda exactas: pandas puede redondear distinto o dejar un entero enorme),
+    con exponente o con signo '+' (pandas lo lee como entero). Con 15 cifras o
+    menos y sin exponente, los dos dan el double correctamente redondeado.
+    """
+    if columna.null_count == len(columna):
+        return False
+    return (pc.max(pc.utf8_length(columna)).as_py() > 15
+            or pc.any(pc.match_substring_regex(columna, r'[eE+]')).as_py())
+
+
+def _puede_tener_comillas(ruta, encoding):
+    """
+    False si el archivo no tiene ni una comilla doble (y entonces ningún valor
+    puede llevar saltos de línea). Se busca sobre el archivo mapeado, sin
+    copiarlo; en codificaciones que no son ASCII (utf-16...) se supone que sí.
+    """
+    if codecs.lookup(encoding or 'utf-8').name.startswith(('utf-16', 'utf-32')):
+        return True
+    if os.path.getsize(ruta) == 0:
+        return False
+    with open(ruta, 'rb') as archivo, mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+        return datos.find(b'"') != -1
+
+
+def _tabla_arrow(ruta, sep, encoding, nombres, columnas, como_texto=False):
+    opciones_lectura = pa_csv.ReadOptions(use_threads=True, column_names=nombres, skip_rows=1,
+                                          encoding=encoding or 'utf-8')
+    # Con saltos de línea dentro de valores entre comillas Arrow no puede repartir el archivo entre
+    # hilos: solo se activa si hay comillas
+    opciones_parseo = pa_csv.ParseOptions(delimiter=sep,
+                                          newlines_in_values=_puede_tener_comillas(ruta, encoding))
+    opciones_conversion = pa_csv.ConvertOptions(
+        include_columns=columnas, null_values=sorted(VALORES_NULOS), strings_can_be_null=True,
+        true_values=VALORES_VERDADEROS, false_values=VALORES_FALSOS,
+        timestamp_parsers=[],  # read_csv no convierte fechas si no se le pide
+        column_types={nombre: pa.string() for nombre in columnas} if como_texto else None)
+    with pa.memory_map(ruta) as archivo:
+        return pa_csv.read_csv(archivo, opciones_lectura, opciones_parseo, opciones_conversion)
+
+
+def _tipo_texto_pandas(tipo):
+    """Dtype de pandas para las columnas de texto de Arrow: el mismo que pone read_csv."""
+    if pa.types.is_string(tipo) or pa.types.is_large_string(tipo):
+        return DTYPE_TEXTO if isinstance(DTYPE_TEXTO, pd.StringDtype) else None
+    return None
+
+
+def leer_tabla(ruta, sep='\t', encoding=None, encodings=ENCODINGS_TEXTO, sheet_name=0, cache=None, lector=None,
+               **opciones):
+    """
+    Lee `ruta` con el lector que corresponde a su formato real (no a la extensión).
+    Los textos se leen con `sep` y con `encoding` o, si no se indica, con la
+    codificación detectada en el prefijo; solo si el resto del archivo no
+    decodifica se prueba la siguiente de `encodings`. `lector` elige con qué se
+    leen (ver `lector_csv`; 'arrow' solo se usa si `opciones` no pasa de usecols).
+    `opciones` se pasa al lector de pandas (header, usecols, dtype...).
+    El resultado pasa por la caché de tablas (`cache=False` la evita); los dos
+    lectores de CSV dan el mismo DataFrame y comparten la entrada.
+    Lanza la excepción del lector si el archivo no se puede leer.
+    """
+    clave = {'lector': 'leer_tabla', 'sep': sep, 'encoding': encoding, 'encodings': list(encodings),
+             'sheet_name': sheet_name, **opciones}
+    return leer_con_cache(ruta, clave,
+                          lambda: _leer_tabla(ruta, sep, encoding, encodings, sheet_name, lector, **opciones),
+                          cache)
+
+
+def _leer_tabla(ruta, sep, encoding, encodings, sheet_name, lector=None, **opciones):
+    formato = detectar_formato(ruta)
+    if formato == 'xlsx':
+        return pd.read_excel(ruta, engine='openpyxl', sheet_name=sheet_name, **opciones)
+    if formato == 'xls':
+        return pd.read_excel(ruta, engine='xlrd', sheet_name=sheet_name, **opciones)
+    if formato == 'parquet':
+        return pd.read_parquet(ruta, columns=opciones.get('usecols'))
+
+    if encoding is None:
+        encoding = detectar_encoding_texto(ruta, encodings)
+    try:
+        if set(opciones) <= {'usecols'}:
+            return leer_csv(ruta, sep, encoding, opciones.get('usecols'), lector)
+        return pd.read_csv(ruta, sep=sep, encoding=encoding, **opciones)
+    except UnicodeDecodeError:
+        restantes = [e for e in encodings if e != encoding]
+        if not restantes:
+            raise
+        return _leer_tabla(ruta, sep, restantes[0], restantes[1:], sheet_name, lector, **opciones)
+
+
+def encoding_que_decodifica(ruta, encodings, bytes_bloque=BYTES_BLOQUE):
+    """
+    Primera de `encodings` que decodifica el archivo completo, leído por
+    bloques (memoria constante). Si ninguna sirve, la última.
+    """
+    for encoding in encodings:
+        try:
+            decodificador = codecs.getincrementaldecoder(encoding)()
+            with open(ruta, 'rb') as archivo:
+                for bloque in iter(lambda: archivo.read(bytes_bloque), b''):
+                    decodificador.decode(bloque)
+            decodificador.decode(b'', final=True)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return encodings[-1]
+
+
+def filas_por_lote(muestra, max_memoria_mb, factor=FACTOR_MEMORIA_LOTE):
+    """
+    Filas por lote para que un lote, con las `factor` copias que se hacen al
+    transformarlo, quepa en `max_memoria_mb`. La memoria por fila se mide en
+    `muestra` (un DataFrame leído con las mismas opciones).
+    """
+    bytes_fila = muestra.memory_usage(index=True, deep=True).sum() / max(len(muestra), 1)
+    return max(FILAS_MINIMAS_LOTE, int(max_memoria_mb * 1024 * 1024 / (max(bytes_fila, 1) * factor)))
+
+
+def leer_texto_por_lotes(ruta, max_memoria_mb, sep='\t', encoding=None, encodings=ENCODINGS_TEXTO,
+                         factor=FACTOR_MEMORIA_LOTE, **opciones):
+    """
+    Lee un CSV/TSV en DataFrames sucesivos (read_csv con chunksize) cuyo número
+    de filas se ajusta a `max_memoria_mb` (ver `filas_por_lote`).
+    La codificación (`encoding` o la detectada, y si no decodifica el archivo
+    entero, la siguiente de `encodings`) se comprueba antes de empezar: un error
+    de decodificación a mitad de archivo dejaría la salida escrita a medias.
+    La comprobación y la muestra se hacen al llamar; devuelve el iterador de lotes.
+    No pasa por la caché de tablas, que guardaría el archivo entero.
+    """
+    candidatos = [encoding or detectar_encoding_texto(ruta, encodings)]
+    candidatos += [e for e in encodings if e not in candidatos]
+    encoding = encoding_que_decodifica(ruta, candidatos)
+
+    muestra = pd.read_csv(ruta, sep=sep, encoding=encoding, nrows=FILAS_MUESTRA, **opciones)
+    filas = filas_por_lote(muestra, max_memoria_mb, factor)
+    print(f"Lectura por lotes de {filas} filas (memoria máxima: {max_memoria_mb} MB, codificación: {encoding})")
+    return pd.read_csv(ruta, sep=sep, encoding=encoding, chunksize=filas, **opciones)
+
+
+def lotes_de_filas(filas, columnas, tamano=FILAS_POR_BLOQUE):
+    """
+    Agrupa un iterador de filas (dicts {columna: valor}, como los de
+    iterar_filas_xlsx) en DataFrames de hasta `tamano` filas con `columnas`,
+    para transformar por columnas lo que se lee fila a fila sin tener todo el
+    archivo en memoria. Los valores no se convierten (columnas object) y las
+    columnas que faltan quedan nulas; el índice numera las filas desde 0,
+    seguido de un lote al siguiente.
+    """
+    filas = iter(filas)
+    primera_fila = 0
+    while True:
+        lote = list(itertools.islice(filas, tamano))
+        if not lote:
+            return
+        yield pd.DataFrame(lote, columns=columnas, dtype=object).set_axis(
+            pd.RangeIndex(primera_fila, primera_fila + len(lote)))
+        primera_fila += len(lote)
+
+
+def columnas_tabla(ruta, sep='\t', encoding=None, encodings=ENCODINGS_TEXTO, sheet_name=0):
+    """
+    Nombres de columna de `ruta` (como los pone pandas) leyendo solo el
+    encabezado, sin parsear la tabla. Mismos parámetros que `leer_tabla`.
+    """
+    formato = detectar_formato(ruta)
+    if formato == 'xlsx':
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            hoja = libro.worksheets[sheet_name] if isinstance(sheet_name, int) else libro[sheet_name]
+            encabezado = next(hoja.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            libro.close()
+        return nombres_columnas(encabezado)
+    if formato == 'xls':
+        return list(pd.read_excel(ruta, engine='xlrd', sheet_name=sheet_name, nrows=0).columns)
+    if formato == 'parquet':
+        import pyarrow.parquet as pq  # Ya es necesario para leer parquet con pandas
+        return list(pq.read_schema(ruta).names)
+
+    candidatos = [encoding or detectar_encoding_texto(ruta, encodings)]
+    candidatos += [e for e in encodings if e not in candidatos]
+    for i, encoding in enumerate(candidatos):
+        try:
+            return list(pd.read_csv(ruta, sep=sep, encoding=encoding, nrows=0).columns)
+        except (UnicodeDecodeError, LookupError):
+            if i == len(candidatos) - 1:
+                raise
+
+
+def hojas_tabla(ruta, sep='\t', encoding=None, encodings=ENCODINGS_TEXTO):
+    """
+    [(hoja, columnas)] de cada hoja de `ruta`, en el orden del libro: el libro
+    se abre una sola vez y de cada hoja solo se lee el encabezado, sin parsear
+    los datos. Los formatos de una sola tabla (texto, parquet) devuelven
+    [(0, columnas)]. Mismos parámetros que `columnas_tabla`.
+    """
+    formato = detectar_formato(ruta)
+    if formato == 'xlsx':
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            return [(hoja.title, nombres_columnas(next(hoja.iter_rows(max_row=1, values_only=True), ())))
+                    for hoja in libro.worksheets]
+        finally:
+            libro.close()
+    if formato == 'xls':
+        with pd.ExcelFile(ruta, engine='xlrd') as libro:
+            return [(hoja, list(libro.parse(hoja, nrows=0).columns)) for hoja in libro.sheet_names]
+    return [(0, columnas_tabla(ruta, sep, encoding, encodings))]
+
+
+def nombres_columnas(encabezado):
+    """
+    Nombres de columna como los pone pandas: 'Unnamed: i' para celdas vacías
+    y sufijos '.1', '.2'... para los repetidos ('Email', 'Email.1', ...).
+    """
+    nombres = []
+    contador = {}
+    for i, valor in enumerate(encabezado):
+        nombre = f"Unnamed: {i}" if valor is None else valor
+        veces = contador.get(nombre, 0)
+        while veces > 0:
+            contador[nombre] = veces + 1
+            nombre = f"{nombre}.{veces}"
+            veces = contador.get(nombre, 0)
+        contador[nombre] = veces + 1
+        nombres.append(nombre)
+    return nombres
+
+
+def _valor_xlsx(valor):
+    if valor is None or (isinstance(valor, str) and valor in VALORES_NULOS):
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)  # read_excel también devuelve int para los números enteros
+    return valor
+
+
+def iterar_filas_xlsx(ruta, hoja=0, columnas=None):
+    """
+    Recorre una hoja de un xlsx fila a fila (openpyxl read_only, memoria
+    constante) y genera un dict {columna: valor} por fila, con los mismos
+    nombres de columna y nulos (NaN) que read_excel. Las filas vacías se omiten.
+    Con `columnas`, cada dict lleva solo esas (las demás celdas no se convierten).
+    El libro se abre al llamar (los errores de lectura saltan aquí, no al iterar).
+    """
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja_xlsx = libro.worksheets[hoja] if isinstance(hoja, int) else libro[hoja]
+    except (IndexError, KeyError):
+        libro.close()
+        raise
+    return _filas_hoja(libro, hoja_xlsx, columnas)
+
+
+def _filas_hoja(libro, hoja_xlsx, seleccion):
+    try:
+        filas = hoja_xlsx.iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+        columnas = nombres_columnas(encabezado)
+        if seleccion is not None:
+            seleccion = set(seleccion)
+            posiciones = [i for i, columna in enumerate(columnas) if columna in seleccion]
+        else:
+            posiciones = list(range(len(columnas)))
+        nombres = [columnas[i] for i in posiciones]
+        for fila in filas:
+            if all(valor is None for valor in fila):
+                continue
+            # Las celdas que faltan al final de una fila corta valen NaN
+            yield {nombre: _valor_xlsx(fila[i]) if i < len(fila) else np.nan for nombre, i in zip(nombres, posiciones)}
+    finally:
+        libro.close()
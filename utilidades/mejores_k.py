@@ -0,0 +1,61 @@
+"""Montículos acotados con los k mejores aciertos de cada objetivo."""
+
+import argparse
+import heapq
+from collections import defaultdict
+
+
+def entero_positivo(texto):
+    """`type` de argparse para enteros mayores o iguales que 1 (-k/--top_k, -n/--ngrama)."""
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{texto}' no es un número entero")
+    if valor < 1:
+        raise argparse.ArgumentTypeError(f"debe ser un entero mayor o igual que 1 (se recibió {valor})")
+    return valor
+
+
+class MejoresK:
+    """
+    Guarda, para cada objetivo, como mucho `k` aciertos en un montículo de
+    mínimos. `clave` es una tupla comparable que empieza por el score (el
+    resto desempata, p. ej. (score, -fila)); a igual score gana el primero
+    visto si el desempate es la posición negada.
+    """
+
+    def __init__(self, k):
+        if k < 1:
+            raise ValueError(f"k debe ser mayor o igual que 1 (se recibió {k})")
+        self.k = k
+        self.monticulos = defaultdict(list)
+
+    def corte(self, objetivo):
+        """
+        Clave del k-ésimo mejor acierto del objetivo, o None si aún no hay k.
+        Un acierto nuevo solo entra si su clave es mayor: sirve como corte
+        creciente para saltarse comparaciones.
+        """
+        monticulo = self.monticulos.get(objetivo)
+        if monticulo is not None and len(monticulo) >= self.k:
+            return monticulo[0][0]
+        return None
+
+    def score_minimo(self, objetivo, umbral):
+        """Score mínimo que debe alcanzar un acierto nuevo del objetivo para poder entrar."""
+        corte = self.corte(objetivo)
+        return umbral if corte is None else max(umbral, corte[0] + 1)
+
+    def agregar(self, objetivo, clave, dato):
+        """Añade un acierto si está entre los k mejores del objetivo."""
+        monticulo = self.monticulos[objetivo]
+        if len(monticulo) < self.k:
+            heapq.heappush(monticulo, (clave, dato))
+        elif clave > monticulo[0][0]:
+            heapq.heapreplace(monticulo, (clave, dato))
+
+    def ordenados(self):
+        """Recorre (objetivo, clave, dato) por objetivo y, dentro de cada uno, del mejor al peor."""
+        for objetivo in sorted(self.monticulos):
+            for clave, dato in sorted(self.monticulos[objetivo], key=lambda entrada: entrada[0], reverse=True):
+                yield objetivo, clave, dato
@@ -0,0 +1,98 @@
+"""
+Emparejamiento escalonado antes del fuzzy matching.
+
+La mayoría de las coincidencias reales son iguales tras normalizar, o solo
+cambian el orden de las palabras o la ortografía (b/v, s/z/c, ll/y, h muda).
+Cada nivel empareja por igualdad de una clave más laxa que la anterior y solo
+los objetivos que ningún nivel resuelve pasan al fuzzy matching:
+
+1. 'exacta': la cadena normalizada.
+2. 'tokens': las palabras ordenadas.
+3. 'fonetica': una clave fonética del español sobre las palabras ordenadas.
+"""
+
+import re
+from collections import defaultdict
+
+NIVELES = ('exacta', 'tokens', 'fonetica')
+
+# Reglas en orden: cada una se aplica sobre el resultado de la anterior
+_REGLAS_FONETICAS = [
+    (re.compile(r'ch'), 'X'),             # 'ch' es un sonido propio
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'qu(?=[ei])'), 'k'),
+    (re.compile(r'q'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'G'),     # 'gue'/'gui': g suave
+    (re.compile(r'g(?=[ei])'), 'j'),      # 'ge'/'gi' suenan como j
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'x'), 'ks'),
+    (re.compile(r'[vw]'), 'b'),
+    (re.compile(r'h'), ''),               # h muda
+    (re.compile(r'y(?![aeiou])'), 'i'),   # 'y' final o ante consonante suena como i
+    (re.compile(r'([a-z])\1+'), r'\1'),   # letras repetidas ('rr', 'ss'...)
+]
+
+
+def clave_tokens(texto):
+    """Palabras de una cadena normalizada, ordenadas."""
+    return " ".join(sorted(texto.split()))
+
+
+def clave_fonetica(texto):
+    """Clave fonética del español de una cadena normalizada (palabras ordenadas)."""
+    palabras = []
+    for palabra in texto.split():
+        for patron, reemplazo in _REGLAS_FONETICAS:
+            palabra = patron.sub(reemplazo, palabra)
+        palabras.append(palabra.lower())
+    return " ".join(sorted(palabras))
+
+
+_FUNCIONES_CLAVE = {
+    'exacta': lambda texto: texto,
+    'tokens': clave_tokens,
+    'fonetica': clave_fonetica,
+}
+
+
+def resolver_por_niveles(nombres_target, nombres_otro):
+    """
+    Empareja por igualdad de claves (hash join) nivel por nivel.
+    Devuelve (coincidencias, pendientes, resueltos):
+    - coincidencias: tuplas (posición target, posición otro, nivel), ordenadas;
+    - pendientes: posiciones target que ningún nivel resolvió;
+    - resueltos: cuántos targets resolvió cada nivel.
+    """
+    coincidencias = []
+    resueltos = {nivel: 0 for nivel in NIVELES}
+    pendientes = [i for i, nombre in enumerate(nombres_target) if nombre]
+
+    for nivel in NIVELES:
+        if not pendientes:
+            break
+        funcion = _FUNCIONES_CLAVE[nivel]
+        mapa = defaultdict(list)
+        for j, nombre in enumerate(nombres_otro):
+            if nombre:
+                mapa[funcion(nombre)].append(j)
+
+        siguientes = []
+        for i in pendientes:
+            posiciones = mapa.get(funcion(nombres_target[i]))
+            if posiciones:
+                coincidencias.extend((i, j, nivel) for j in posiciones)
+                resueltos[nivel] += 1
+            else:
+                siguientes.append(i)
+        pendientes = siguientes
+
+    coincidencias.sort()
+    return coincidencias, pendientes, resueltos
+
+
+def resumen_niveles(resueltos, pendientes, nombre_archivo):
+    """Texto con cuántos objetivos resolvió cada nivel y cuántos quedan para el fuzzy matching."""
+    partes = ", ".join(f"{nivel} {resueltos[nivel]}" for nivel in NIVELES)
+    return f"Niveles en '{nombre_archivo}': {partes}, al fuzzy matching {pendientes}"
@@ -0,0 +1,80 @@
+"""
+División de nombres completos en nombre y apellido, compartida por los scripts
+que generan contactos.
+
+Los mismos nombres se repiten mucho (entre roles, filas y archivos), así que
+las columnas se dividen sobre sus valores únicos y el resultado de cada valor
+se guarda en una caché LRU acotada que comparten todos los archivos de una
+misma ejecución. Los prefijos de nombres compuestos ("María José", "De León")
+se buscan en un frozenset.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+TAMANO_CACHE = 1 << 18  # Nombres distintos que se recuerdan (~262 mil)
+
+# Prefijos que se unen a la palabra siguiente ("Juan Carlos", "Del Carmen"...)
+NOMBRES_COMPUESTOS = frozenset([
+    "María", "Ana", "Juan", "Luis", "José", "Carlos",
+    "San", "Santa", "De", "Del", "La", "El", "Los",
+])
+# Los de 17_Subir_Posibles_clientes, con partículas de otros idiomas
+NOMBRES_COMPUESTOS_AMPLIADOS = NOMBRES_COMPUESTOS | frozenset([
+    "Da", "Do", "Das", "Dos", "D'", "L'", "O'",
+])
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _dividir(full_name, compound_names):
+    parts = full_name.split()
+    if len(parts) == 0:
+        return "", ""
+    elif len(parts) == 1:
+        return parts[0], ""
+    elif len(parts) == 2:
+        return parts[0], parts[1]
+
+    firstname = []
+    i = 0
+    while i < len(parts):
+        if i < len(parts) - 1 and parts[i] in compound_names:
+            firstname.append(parts[i] + " " + parts[i + 1])
+            i += 2
+        else:
+            firstname.append(parts[i])
+            i += 1
+
+    lastname = []
+    if len(firstname) >= 3:
+        mid = len(firstname) // 2
+        lastname = firstname[mid:]
+        firstname = firstname[:mid]
+    return " ".join(firstname), " ".join(lastname)
+
+
+def split_name(full_name, compound_names=NOMBRES_COMPUESTOS):
+    """
+    Divide un nombre completo en (nombre, apellido). Los prefijos de
+    `compound_names` se unen a la palabra siguiente; con tres partes o más,
+    la primera mitad es el nombre y el resto el apellido. ("", "") si no es texto.
+    """
+    if not isinstance(full_name, str):
+        return "", ""
+    return _dividir(full_name, compound_names)
+
+
+def dividir_nombres(nombres, compound_names=NOMBRES_COMPUESTOS):
+    """
+    Divide una columna (Series o secuencia) de nombres completos: la
+    factoriza, divide solo sus valores únicos y reparte el resultado a todas
+    las filas. Devuelve (nombres, apellidos) como arrays de objetos.
+    """
+    codigos, unicos = pd.factorize(pd.Series(nombres, dtype=object))
+    # El código -1 (nulo) toma el último elemento, que es ("", "")
+    pares = [split_name(valor, compound_names) for valor in unicos] + [("", "")]
+    firstnames = np.array([firstname for firstname, _ in pares], dtype=object)
+    lastnames = np.array([lastname for _, lastname in pares], dtype=object)
+    return firstnames[codigos], lastnames[codigos]
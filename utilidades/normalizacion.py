@@ -0,0 +1,85 @@
+"""
+Normalización de textos compartida por los scripts de comparación.
+
+Los mismos valores (nombres de empresa, "Nombre Completo", encabezados) se
+repiten mucho, así que las columnas se normalizan sobre sus valores únicos y
+el resultado de cada valor se guarda en una caché LRU acotada que comparten
+todos los archivos de una misma ejecución.
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+TAMANO_CACHE = 1 << 18  # Valores distintos que se recuerdan (~262 mil)
+
+_PATRON_NO_ALFANUMERICO = re.compile(r'[^a-z0-9\s]')
+_FILAS = {'filas': 0, 'unicos': 0}
+_ULTIMA_TOMA = {'filas': 0, 'unicos': 0, 'aciertos': 0, 'fallos': 0}
+
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _normalizar(text):
+    text = unidecode(text).lower()  # Elimina tildes y convierte a minúsculas
+    text = _PATRON_NO_ALFANUMERICO.sub('', text)  # Elimina caracteres no alfanuméricos
+    return text.strip()
+
+
+def normalize_string(text):
+    """Normaliza una cadena: minúsculas, sin tildes, solo alfanumérico."""
+    if not isinstance(text, str):
+        return ""
+    return _normalizar(text)
+
+
+def normalizar_serie(serie):
+    """
+    Normaliza una columna completa: la factoriza, normaliza solo sus valores
+    únicos y reparte el resultado a todas las filas. Los nulos quedan como "".
+    """
+    codigos, unicos = pd.factorize(serie)
+    # El código -1 (nulo) toma el último elemento, que es ""
+    normalizados = np.array([normalize_string(valor) for valor in unicos] + [""], dtype=object)
+    _FILAS['filas'] += len(codigos)
+    _FILAS['unicos'] += len(unicos)
+    return pd.Series(normalizados[codigos], index=serie.index, dtype=object)
+
+
+def normalizar_valores(valores):
+    """Como normalizar_serie, pero recibe y devuelve una lista."""
+    return normalizar_serie(pd.Series(valores, dtype=object)).tolist()
+
+
+def tomar_estadisticas():
+    """
+    Devuelve los contadores acumulados desde la toma anterior en este proceso
+    (filas, valores únicos, aciertos y fallos de la caché), para poder sumar
+    los de varios procesos.
+    """
+    info = _normalizar.cache_info()
+    actuales = {'filas': _FILAS['filas'], 'unicos': _FILAS['unicos'],
+                'aciertos': info.hits, 'fallos': info.misses}
+    delta = {clave: actuales[clave] - _ULTIMA_TOMA[clave] for clave in actuales}
+    _ULTIMA_TOMA.update(actuales)
+    return delta
+
+
+def sumar_estadisticas(*estadisticas):
+    """Suma varios diccionarios de tomar_estadisticas()."""
+    total = {'filas': 0, 'unicos': 0, 'aciertos': 0, 'fallos': 0}
+    for parcial in estadisticas:
+        for clave in total:
+            total[clave] += parcial.get(clave, 0)
+    return total
+
+
+def resumen_estadisticas(estadisticas):
+    """Texto con el ahorro por valores únicos y la tasa de aciertos de la caché."""
+    consultas = estadisticas['aciertos'] + estadisticas['fallos']
+    tasa = estadisticas['aciertos'] / consultas if consultas else 0.0
+    return (f"Normalización: {estadisticas['filas']} filas, {estadisticas['unicos']} valores únicos; "
+            f"caché {estadisticas['aciertos']} aciertos / {estadisticas['fallos']} fallos "
+            f"(tasa {tasa:.1%}), {estadisticas['fallos']} normalizaciones reales")
@@ -0,0 +1,148 @@
+"""
+Procesamiento de varios archivos de entrada en paralelo (un proceso por
+archivo) para los scripts que dividen cada archivo en un archivo por grupo.
+
+Cada archivo de entrada escribe en una carpeta temporal propia dentro de la
+carpeta de salida; al terminar, sus archivos se mueven a la carpeta de salida
+en el orden de la lista de entrada. Si dos archivos de entrada generan el
+mismo nombre (el mismo grupo), el segundo no pisa al primero: se guarda como
+"Grupo (entrada).xlsx". El resultado no depende del número de procesos ni del
+orden en que terminan. Un libro con varias hojas que coinciden con el mapeo
+se reparte en una tarea por hoja.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+PREFIJO_PARCIAL = ".parcial_"
+
+# Estado de cada proceso trabajador: la función que procesa un archivo se recibe una sola vez
+_TRABAJO = {}
+
+
+def _inicializar_trabajador(procesar):
+    """Guarda la función de procesado en el proceso (initializer del pool)."""
+    _TRABAJO['procesar'] = procesar
+
+
+def _procesar_archivo(tarea):
+    """Procesa un archivo (o una hoja) en su carpeta temporal. Devuelve (segundos, error o None)."""
+    input_file, hoja, directorio_parcial = tarea
+    print(f"Procesando archivo: {input_file}" + (f" (hoja '{hoja}')" if hoja is not None else ""),
+          flush=True)
+    inicio = time.perf_counter()
+    error = None
+    try:
+        if hoja is None:
+            _TRABAJO['procesar'](input_file, directorio_parcial)
+        else:
+            _TRABAJO['procesar'](input_file, directorio_parcial, hoja=hoja)
+    except Exception as e:  # Un archivo que falla no detiene a los demás
+        error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - inicio, error
+
+
+def nombre_libre(nombre, input_file, usados):
+    """
+    `nombre` si ningún archivo anterior de la ejecución lo usó; si no,
+    "base (entrada).ext" y, si también está usado, "base (entrada 2).ext"...
+    """
+    if os.path.normcase(nombre) not in usados:
+        return nombre
+    base, extension = os.path.splitext(nombre)
+    entrada = os.path.splitext(os.path.basename(input_file))[0]
+    candidato = f"{base} ({entrada}){extension}"
+    numero = 2
+    while os.path.normcase(candidato) in usados:
+        candidato = f"{base} ({entrada} {numero}){extension}"
+        numero += 1
+    return candidato
+
+
+def _mover_salidas(input_file, directorio_parcial, output_dir, usados):
+    """Mueve los archivos de `directorio_parcial` a `output_dir`. Devuelve cuántos movió."""
+    movidos = 0
+    for nombre in sorted(os.listdir(directorio_parcial)):
+        destino = nombre_libre(nombre, input_file, usados)
+        if destino != nombre:
+            print(f"Advertencia: '{nombre}' ya lo generó otro archivo de entrada; "
+                  f"el de '{input_file}' se guarda como '{destino}'.")
+        usados.add(os.path.normcase(destino))
+        os.replace(os.path.join(directorio_parcial, nombre), os.path.join(output_dir, destino))
+        movidos += 1
+    return movidos
+
+
+def dividir_en_hojas(input_files, hojas_de):
+    """
+    [(input_file, hoja)]: una tarea por hoja en los libros para los que
+    `hojas_de(input_file)` devuelve más de una, y (input_file, None) para el
+    resto. Si no se pueden listar las hojas, el archivo va entero: el error
+    se informa al procesarlo.
+    """
+    tareas = []
+    for input_file in input_files:
+        try:
+            hojas = hojas_de(input_file)
+        except Exception:
+            hojas = []
+        if len(hojas) > 1:
+            tareas += [(input_file, hoja) for hoja, _ in hojas]
+        else:
+            tareas.append((input_file, None))
+    return tareas
+
+
+def procesar_archivos(input_files, output_dir, procesar, jobs, hojas_de=None):
+    """
+    Llama a procesar(input_file, carpeta) para cada archivo de `input_files`
+    en `jobs` procesos (en este mismo proceso si `jobs` es 1). `procesar` debe
+    poder enviarse a otro proceso (una función de módulo o un functools.partial).
+    Con `hojas_de` (ver `dividir_en_hojas`), cada hoja de un libro de varias
+    hojas es una tarea: procesar(input_file, carpeta, hoja=hoja).
+    Imprime el tiempo de cada tarea y devuelve [(input_file, hoja, segundos,
+    archivos generados, error o None)] en el orden de `input_files`.
+    """
+    inicio = time.perf_counter()
+    unidades = dividir_en_hojas(input_files, hojas_de) if hojas_de else [(f, None) for f in input_files]
+    tareas = [(input_file, hoja,
+               tempfile.mkdtemp(prefix=f"{PREFIJO_PARCIAL}{os.path.splitext(os.path.basename(input_file))[0]}_",
+                                dir=output_dir))
+              for input_file, hoja in unidades]
+    usados = set()
+    resumen = []
+    try:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_inicializar_trabajador,
+                                     initargs=(procesar,)) as executor:
+                # map devuelve en el orden de input_files: los nombres se reparten igual que en secuencial
+                resultados = list(executor.map(_procesar_archivo, tareas))
+        else:
+            _inicializar_trabajador(procesar)
+            resultados = [_procesar_archivo(tarea) for tarea in tareas]
+
+        for (input_file, hoja, directorio_parcial), (segundos, error) in zip(tareas, resultados):
+            if error:
+                print(f"Error al procesar '{input_file}': {error}")
+            resumen.append((input_file, hoja, segundos,
+                            _mover_salidas(input_file, directorio_parcial, output_dir, usados), error))
+    finally:
+        for _, _, directorio_parcial in tareas:
+            shutil.rmtree(directorio_parcial, ignore_errors=True)
+
+    imprimir_tiempos(resumen, jobs, time.perf_counter() - inicio)
+    return resumen
+
+
+def imprimir_tiempos(resumen, jobs, total):
+    """Tabla con el tiempo de cada archivo (u hoja), del más lento al más rápido."""
+    print(f"\nTiempos por archivo ({jobs} proceso{'s' if jobs != 1 else ''}):")
+    for input_file, hoja, segundos, archivos, error in sorted(resumen, key=lambda fila: -fila[2]):
+        nombre = os.path.basename(input_file) + (f" [{hoja}]" if hoja is not None else "")
+        estado = " (con errores)" if error else ""
+        print(f"  {segundos:8.2f} s  {archivos:4d} archivo(s)  {nombre}{estado}")
+    suma = sum(fila[2] for fila in resumen)
+    print(f"Total: {total:.2f} s (suma de los archivos: {suma:.2f} s)")
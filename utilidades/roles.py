@@ -0,0 +1,71 @@
+"""
+Expansión de los roles de un archivo tipo directorio: cada fila trae varios
+pares (columna de nombre, columna de email), uno por rol del mapeo, y cada
+par con nombre y email es un contacto. En lugar de recorrer fila a fila y
+rol a rol, los pares se pasan a formato largo columna a columna, con
+máscaras, en el mismo orden que el bucle: por fila del archivo y, dentro de
+cada fila, por rol del mapeo.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def como_texto(serie):
+    """
+    La columna como texto, igual que str(valor) fila a fila; los nulos quedan
+    nulos. Las columnas que ya son de texto no se copian valor a valor.
+    """
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie
+    return serie.map(str, na_action='ignore')
+
+
+def no_vacios(serie):
+    """
+    Máscara (array de bool) de los valores no nulos que son verdaderos para
+    Python (ni '' ni 0): lo mismo que `valor if pd.notna(valor) else ''`
+    seguido de `if valor`.
+    """
+    presentes = serie.notna().to_numpy()
+    if isinstance(serie.dtype, pd.StringDtype):
+        return presentes & serie.ne('').fillna(False).to_numpy(dtype=bool)
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return presentes & serie.ne(0).to_numpy(dtype=bool)
+    mascara = presentes.copy()
+    mascara[presentes] = [bool(valor) for valor in serie.to_numpy(dtype=object)[presentes]]
+    return mascara
+
+
+def expandir_roles(df, roles_mapping):
+    """
+    Contactos de `df` en formato largo: un contacto por cada rol de
+    `roles_mapping` ({rol: [columna de nombre, columna de email]}) con nombre
+    y email no vacíos. Devuelve un DataFrame con:
+    - 'fila': posición de la fila de `df` (para tomar el resto de sus columnas),
+    - 'Position': el rol,
+    - 'Nombre': el nombre como texto (str(valor)),
+    - 'Email': el email tal como viene en `df`.
+    Los nombres y emails quedan como objetos de Python (columnas object).
+    """
+    filas, roles, nombres, emails = [], [], [], []
+    for orden, (name_col, email_col) in enumerate(roles_mapping.values()):
+        nombre = como_texto(df[name_col])
+        mascara = (nombre.notna().to_numpy() & nombre.ne('').fillna(False).to_numpy(dtype=bool)
+                   & no_vacios(df[email_col]))
+        posiciones = np.flatnonzero(mascara)
+        filas.append(posiciones)
+        roles.append(np.full(len(posiciones), orden))
+        nombres.append(nombre.to_numpy(dtype=object)[posiciones])
+        emails.append(df[email_col].to_numpy(dtype=object)[posiciones])
+    if not filas:
+        return pd.DataFrame({'fila': np.array([], dtype=np.intp), 'Position': [], 'Nombre': [], 'Email': []})
+
+    filas, roles = np.concatenate(filas), np.concatenate(roles)
+    # Orden del bucle: por fila y, dentro de la fila, por el orden de los roles en el mapeo
+    orden = np.lexsort((roles, filas))
+    return pd.DataFrame({'fila': filas[orden],
+                         'Position': pd.Series(np.array(list(roles_mapping), dtype=object)[roles[orden]],
+                                               dtype=object),
+                         'Nombre': pd.Series(np.concatenate(nombres)[orden], dtype=object),
+                         'Email': pd.Series(np.concatenate(emails)[orden], dtype=object)})
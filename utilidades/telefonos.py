@@ -0,0 +1,177 @@
+"""
+Etapa de teléfonos: limpia las columnas de teléfono de un bloque de filas de
+una vez (operaciones de texto sobre columnas, no fila a fila).
+
+Formatos (ver FORMATOS_TELEFONO):
+  'digitos' -> solo los dígitos de cada celda, y varias columnas unidas con ','
+               (lo de siempre: "6123-4567 / 2345678" queda "61234567 2345678" sin espacio)
+  'e164'    -> cada celda se parte en sus números ("6123-4567 / 2345678"), cada
+               número se clasifica como fijo o móvil de Panamá por prefijo y
+               longitud, y los válidos se escriben en E.164 ("+50761234567"),
+               sin repetir, separados por ','. Los que no son números de Panamá
+               válidos no se suben: van al reporte de teléfonos inválidos.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utilidades.escritura import EscritorResultados
+
+FORMATOS_TELEFONO = ('digitos', 'e164')
+FORMATO_TELEFONO_POR_DEFECTO = 'digitos'
+PREFIJO_PAIS = '+507'
+# Números de Panamá sin el código de país: fijos de 7 dígitos (no empiezan por 0, 1 ni 6) y móviles de 8
+# que empiezan por 6
+PRIMEROS_DIGITOS_FIJO = list('2345789')
+PRIMER_DIGITO_MOVIL = '6'
+# Separadores entre varios números de una misma celda ("2345678 / 6123-4567", "2345678 y 2345679")
+_SEPARADORES = r'[/,;|\n]|\s+(?:y|o)\s+'
+_EXTENSION = r'(?i)\s*(?:ext|extensi[oó]n|x)\.?\s*\d+\s*$'  # "2345678 ext. 12": la extensión no se marca
+_ENTERO_COMO_DECIMAL = r'^(\d+)\.0+$'  # 61234567.0 (celda numérica leída como float)
+_CODIGO_PAIS = r'^(?:00)?507(?=\d{7,8}$)'
+COLUMNAS_REPORTE = ['Archivo', 'Hoja', 'Fila', 'Columna', 'Valor', 'Numero', 'Motivo']
+
+
+def formato_telefono(formato=None):
+    """
+    Formato de teléfono a usar: `formato` si se indica; si no, la variable de
+    entorno FORMATO_TELEFONO; si no, FORMATO_TELEFONO_POR_DEFECTO. ValueError si no existe.
+    """
+    formato = formato or os.environ.get("FORMATO_TELEFONO") or FORMATO_TELEFONO_POR_DEFECTO
+    if formato not in FORMATOS_TELEFONO:
+        raise ValueError(f"Formato de teléfono desconocido: '{formato}' (opciones: {', '.join(FORMATOS_TELEFONO)})")
+    return formato
+
+
+def _como_texto(serie):
+    """str(valor) de cada valor no nulo, como objetos de Python (las expresiones regulares son las de `re`)."""
+    return serie.astype(object).map(str, na_action='ignore')
+
+
+def telefonos(columnas, formato=None):
+    """
+    Teléfonos de cada fila de `columnas` (DataFrame con una o varias columnas
+    de teléfono, en orden) en el formato elegido (ver `formato_telefono`).
+    Devuelve (Series con el texto de cada fila, con el índice de `columnas`;
+    DataFrame de números inválidos con 'fila' (etiqueta del índice),
+    'Columna', 'Valor', 'Numero' y 'Motivo', vacío en formato 'digitos').
+    """
+    if formato_telefono(formato) == 'digitos':
+        return solo_digitos(columnas), pd.DataFrame(columns=['fila', 'Columna', 'Valor', 'Numero', 'Motivo'])
+    return telefonos_e164(columnas)
+
+
+def solo_digitos(columnas):
+    """
+    Lo mismo que re.sub(r'\\D', '', str(valor)) en cada celda no nula y
+    ",".join de los resultados no vacíos de cada fila. Un número leído como
+    decimal (61234567.0, columna numérica con vacíos) pierde antes el ".0".
+    """
+    resultado = np.full(len(columnas), '', dtype=object)
+    for nombre in columnas.columns:
+        digitos = (_como_texto(columnas[nombre]).str.replace(_ENTERO_COMO_DECIMAL, r'\1', regex=True)
+                   .str.replace(r'\D', '', regex=True)
+                   .fillna('').to_numpy(dtype=object))
+        resultado = np.where((resultado != '') & (digitos != ''), resultado + ',' + digitos, resultado + digitos)
+    return pd.Series(resultado, index=columnas.index, dtype=object)
+
+
+def clasificar(nacionales):
+    """'movil', 'fijo' o None para cada número de Panamá sin código de país (Series de texto de dígitos)."""
+    longitud = nacionales.str.len()
+    primero = nacionales.str[:1]
+    tipos = np.select([(longitud == 8) & (primero == PRIMER_DIGITO_MOVIL),
+                       (longitud == 7) & primero.isin(PRIMEROS_DIGITOS_FIJO)],
+                      ['movil', 'fijo'], None)
+    return pd.Series(tipos, index=nacionales.index, dtype=object)
+
+
+def telefonos_e164(columnas):
+    """Formato 'e164' de `telefonos`: parte, clasifica y escribe los números; devuelve también los inválidos."""
+    posiciones = pd.RangeIndex(len(columnas))
+    partes = []
+    for nombre in columnas.columns:
+        valores = _como_texto(columnas[nombre].set_axis(posiciones)).dropna()
+        valores = valores.str.replace(_ENTERO_COMO_DECIMAL, r'\1', regex=True)
+        # Una fila por número: el índice (posición de la fila) se repite, en el orden de la celda. Las celdas
+        # sin ningún dígito ("n/a") no se parten: van enteras al reporte
+        con_digitos = valores.str.contains(r'[0-9]', regex=True).to_numpy(dtype=bool)
+        numeros = valores[con_digitos].str.split(_SEPARADORES, regex=True).explode().str.strip()
+        numeros = numeros[numeros.str.contains(r'[0-9]', regex=True).to_numpy(dtype=bool)]
+        numeros = pd.concat([numeros, valores[~con_digitos].str.strip()]).sort_index(kind='stable')
+        numeros = numeros[numeros != '']
+        partes.append(pd.DataFrame({'Columna': nombre, 'Valor': valores.loc[numeros.index], 'Numero': numeros}))
+    if partes:
+        # Por fila y, dentro de la fila, por columna y por orden en la celda
+        numeros = pd.concat(partes).sort_index(kind='stable')
+    else:
+        numeros = pd.DataFrame({'Columna': [], 'Valor': [], 'Numero': []}, dtype=object)
+
+    digitos = numeros['Numero'].str.replace(_EXTENSION, '', regex=True).str.replace(r'[^0-9]', '', regex=True)
+    nacionales = digitos.str.replace(_CODIGO_PAIS, '', regex=True)
+    validos = clasificar(nacionales).notna().to_numpy(dtype=bool)
+
+    e164 = PREFIJO_PAIS + nacionales[validos]
+    e164 = e164[~pd.MultiIndex.from_arrays([e164.index, e164.to_numpy()]).duplicated()]  # Sin repetir en la fila
+    por_fila = e164.groupby(level=0, sort=False).agg(','.join)
+    resultado = pd.Series('', index=posiciones, dtype=object)
+    resultado[por_fila.index] = por_fila.to_numpy(dtype=object)
+
+    invalidos = numeros[~validos]
+    motivos = np.select([digitos[~validos] == '', ~nacionales[~validos].str.len().isin([7, 8])],
+                        ['sin dígitos', 'longitud'], 'prefijo')
+    invalidos = invalidos.assign(fila=columnas.index[invalidos.index], Motivo=motivos)
+    return (resultado.set_axis(columnas.index),
+            invalidos[['fila', 'Columna', 'Valor', 'Numero', 'Motivo']].reset_index(drop=True))
+
+
+def limpiar_columna(df, columna, formato, reporte, hoja=None):
+    """
+    `df` (sin modificar el original) con `columna` en el formato elegido (ver
+    `telefonos`); los números inválidos van a `reporte` (ReporteTelefonos).
+    """
+    limpios, invalidos = telefonos(df[[columna]], formato)
+    reporte.agregar(invalidos, hoja)
+    return df.assign(**{columna: limpios})
+
+
+def ruta_reporte(output_dir, input_file, sufijo=""):
+    """Ruta del reporte de teléfonos inválidos de un archivo de entrada (y hoja, con `sufijo`)."""
+    return os.path.join(output_dir, f"telefonos_invalidos_{os.path.basename(input_file)}{sufijo}.csv")
+
+
+class ReporteTelefonos:
+    """
+    CSV con los teléfonos que no se suben (ver `telefonos`): archivo, hoja,
+    fila, columna, valor de la celda, número y motivo. La fila es la de la
+    hoja contando el encabezado como fila 1 (sin las filas vacías, que no se
+    leen): el índice de las filas leídas debe empezar en 0. El archivo solo se
+    crea si llega algún inválido.
+    """
+
+    def __init__(self, ruta, input_file):
+        self.ruta = ruta
+        self.input_file = input_file
+        self.escritor = EscritorResultados(ruta, COLUMNAS_REPORTE, formato="csv")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.cerrar()
+        return False
+
+    def agregar(self, invalidos, hoja=None):
+        if invalidos.empty:
+            return
+        self.escritor.agregar_df(invalidos.assign(
+            Archivo=self.input_file, Hoja=hoja if isinstance(hoja, str) else '', Fila=invalidos['fila'] + 2))
+
+    def cerrar(self):
+        """Cierra el reporte y avisa si tiene filas. Devuelve cuántos inválidos escribió."""
+        escritos = self.escritor.cerrar()
+        if escritos:
+            print(f"{escritos} teléfono(s) inválido(s) de '{self.input_file}' guardados en '{self.ruta}'")
+        return escritos